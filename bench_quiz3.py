@@ -0,0 +1,424 @@
+"""quiz3.py の処理時間を測るスクリプト。アプリ本体とは別に、手元や会場の PC で実行する。
+
+    python bench_quiz3.py frame-ring
+    python bench_quiz3.py timer [秒]
+    python bench_quiz3.py timer-tenths [秒]
+    python bench_quiz3.py buzzer [回数]
+    python bench_quiz3.py web-scoreboard [台数]
+
+結果を表示し、併せて確かめている条件が満たされなければ終了コード 1 で終わる。
+動作の正しさそのものは tests/ のテストで確かめる"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+from PIL import Image, ImageChops
+
+from quiz3 import (
+    BUZZER_POLL_MS, BUZZER_SETTLE_US, FRAME_RING_NAME, IMG_HEIGHT, IMG_WIDTH, ROUND_FORMATS,
+    BuzzerArbiter, BuzzerInput, ControlServer, CountdownTimer, KeyboardBuzzerDevice, ScoreboardDrawer,
+    SharedFrameReader, SharedFrameRing, apply_control_delta, build_player_view, diff_control_state,
+    get_empty_player, json_dumps_compact, web_player_state,
+)
+
+def _frame_ring_bench_reader(name, seconds, result):
+    reader = SharedFrameReader(name, untrack=False)
+    got = 0
+    torn = 0
+    nbytes = 0
+    t_end = time.monotonic() + seconds
+    while time.monotonic() < t_end:
+        frame = reader.poll()
+        if frame is None:
+            continue
+        frame["pixels"][0] + frame["pixels"][-1]  # 画素に触れる
+        if frame["still_valid"]():
+            got += 1
+            nbytes += len(frame["pixels"])
+        else:
+            torn += 1
+        frame["pixels"].release()
+    reader.close()
+    result.put((got, torn, nbytes))
+
+def benchmark_frame_ring(seconds=3.0, mode="RGBA"):
+    """書き手 (このプロセス) と読み手 (別プロセス) でリングバッファの転送量を測る (python bench_quiz3.py frame-ring)"""
+    name = f"{FRAME_RING_NAME}_bench_{os.getpid()}"
+    ring = SharedFrameRing(name=name)
+    frames = [Image.new(mode, (IMG_WIDTH, IMG_HEIGHT), c) for c in ((255, 0, 0, 255), (0, 0, 255, 255))]
+    result = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_frame_ring_bench_reader, args=(name, seconds, result))
+    proc.start()
+    written = 0
+    try:
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            if ring.write(frames[written % 2]) is not None:
+                written += 1
+        elapsed = time.perf_counter() - t0
+        got, torn, nbytes = result.get()
+        proc.join()
+    finally:
+        ring.close()
+    print(f"write: {written} frames, {written / elapsed:.1f} fps, {written * IMG_WIDTH * IMG_HEIGHT * len(mode) / elapsed / 1e6:.0f} MB/s")
+    print(f"read : {got} frames ({got / seconds:.1f} fps, {nbytes / seconds / 1e6:.0f} MB/s), torn {torn}")
+    return written, got, torn
+
+def benchmark_web_scoreboard(clients=48, judgements=300):
+    """Web版スコアボードの受信側を clients 台ぶん模擬し、1回の判定で流れるバイト数と届くまでの時間を測る
+    (python bench_quiz3.py web-scoreboard [台数])。最後に全クライアントの状態が一致しているかも確かめる"""
+    import random
+    import statistics
+    server = ControlServer(port=0)
+    server.start()
+    fmt = ROUND_FORMATS["2R"]
+    players = []
+    for i in range(12):
+        p = get_empty_player(i + 1)
+        p.update(name=f"出場 者{i + 1}", univ="立命館大学")
+        players.append(p)
+
+    def snapshot(seconds):
+        return {
+            "board": {"mode": "2R", "group": 0, "view_mode": "2R", "header": "2nd Round Group1",
+                      "semi_set": 1, "final_set": 1, "course": None},
+            "players": [web_player_state(p, build_player_view(p, "2R")) for p in players],
+            "timer": {"seconds": seconds, "running": True, "text": f"{seconds // 60:02}:{seconds % 60:02}",
+                      "visible": True, "alert": False, "blink_on": True},
+            "question": {"total": judgements, "no": 1, "next_no": 2, "visible": True, "shown": True,
+                         "q": "問題文", "a": "答え", "sf": []},
+        }
+
+    state = snapshot(600)
+    server.set_state(0, state)
+    sent_at, received, sizes = {}, [[] for _ in range(clients)], []
+    replicas = [None] * clients
+
+    async def client(k):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(f"GET /events?token={server.token} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+        await reader.readuntil(b"\r\n\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.startswith(b"data: "):
+                continue
+            message = json.loads(line[6:])
+            if message["type"] == "hello":
+                replicas[k] = message["state"]
+                continue
+            received[k].append((message["state_seq"], time.perf_counter()))
+            apply_control_delta(replicas[k], message["changes"])
+            if message["state_seq"] == judgements:
+                break
+        writer.close()
+
+    def publish():
+        nonlocal state
+        rng = random.Random(1)
+        for seq in range(1, judgements + 1):
+            fmt.judge(players[rng.randrange(len(players))], "o" if rng.random() < 0.6 else "x", players)
+            new = snapshot(600 - seq)
+            message = {"type": "delta", "state_seq": seq, "changes": diff_control_state(state, new)}
+            sizes.append(len(json_dumps_compact(message).encode("utf-8")))
+            state = new
+            sent_at[seq] = time.perf_counter()
+            server.set_state(seq, state)
+            server.broadcast(message)
+            time.sleep(0.01)
+
+    async def run():
+        tasks = [asyncio.ensure_future(client(k)) for k in range(clients)]
+        while any(r is None for r in replicas):
+            await asyncio.sleep(0.01)
+        publisher = threading.Thread(target=publish, daemon=True)
+        publisher.start()
+        await asyncio.wait_for(asyncio.gather(*tasks), 60)
+        publisher.join()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.stop()
+    latencies = sorted((t - sent_at[seq]) * 1000 for rows in received for seq, t in rows)
+    consistent = all(r == state for r in replicas)
+    print(f"clients={clients} deltas={judgements} bytes/delta: avg {statistics.mean(sizes):.0f} max {max(sizes)}")
+    print(f"latency ms: p50 {latencies[len(latencies) // 2]:.1f} p99 {latencies[int(len(latencies) * 0.99)]:.1f} "
+          f"max {latencies[-1]:.1f} replicas consistent={consistent}")
+    return consistent
+
+def benchmark_timer(seconds=300, render_ms=(40, 250)):
+    """描画が重いときのタイマーを仮想時計で再現し、従来の after(1000) で 1ずつ減らす方式と締め切り方式を比べる
+    (python bench_quiz3.py timer [秒])。一時停止・再開を挟んでも動作時間の合計が設定時間に一致するか、
+    表示の更新が秒の変わり目ごとに 1回だけかも確かめる"""
+    import heapq
+    import random
+    rng = random.Random(1)
+
+    class Loop:
+        """Tk の after の代わり。コールバックの遅れと描画時間のぶんだけ仮想時刻が進む"""
+        def __init__(self):
+            self.now = 0.0
+            self.jobs = []
+            self.seq = itertools.count()
+
+        def after(self, ms, fn):
+            heapq.heappush(self.jobs, (self.now + ms / 1000, next(self.seq), fn))
+
+        def render(self):
+            self.now += rng.uniform(*render_ms) / 1000
+
+        def run(self):
+            while self.jobs:
+                at, _, fn = heapq.heappop(self.jobs)
+                self.now = max(self.now, at) + rng.uniform(0.001, 0.004)
+                fn()
+
+    # 従来方式
+    loop = Loop()
+    legacy = {"left": seconds}
+    def legacy_tick():
+        legacy["left"] -= 1
+        loop.render()
+        if legacy["left"] > 0:
+            loop.after(1000, legacy_tick)
+    loop.after(1000, legacy_tick)
+    loop.run()
+    legacy_end = loop.now
+
+    # 締め切り方式 (QuizApp._timer_tick と同じ手順)。途中で 5回一時停止する
+    loop = Loop()
+    timer = CountdownTimer(seconds, clock=lambda: loop.now)
+    state = {"shown": seconds, "chain": 0, "updates": 0, "late": 0.0, "paused": 0.0, "pause_at": None, "end": 0.0}
+    def tick(chain):
+        if chain != state["chain"] or not timer.running:
+            return
+        shown = timer.display_seconds()
+        if shown <= 0:
+            timer.pause()
+            state["end"] = loop.now
+        if shown != state["shown"]:
+            # 本来その表示に変わるべき時刻からの遅れ
+            due = state["paused"] + (seconds - shown)
+            state["late"] = max(state["late"], loop.now - due)
+            state["shown"] = shown
+            state["updates"] += 1
+            loop.render()
+        if timer.running:
+            loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(chain))
+    def pause():
+        timer.pause()
+        state["pause_at"] = loop.now
+    def resume():
+        state["paused"] += loop.now - state["pause_at"]
+        timer.start()
+        state["chain"] += 1
+        chain = state["chain"]
+        loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(chain))
+    for k in range(5):
+        at = (k + 1) * seconds * 1000 / 6 + rng.uniform(0, 900)
+        loop.after(at, pause)
+        loop.after(at + rng.uniform(500, 3000), resume)
+    timer.start()
+    loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(0))
+    loop.run()
+    run_time = state["end"] - state["paused"]
+
+    print(f"{seconds}s countdown, render {render_ms[0]}-{render_ms[1]}ms per update")
+    print(f"after(1000) decrement : ended at {legacy_end:.2f}s (+{legacy_end - seconds:.2f}s)")
+    print(f"monotonic deadline    : ran {run_time:.3f}s excluding {state['paused']:.2f}s paused "
+          f"(+{run_time - seconds:.3f}s), max display lag {state['late'] * 1000:.0f}ms, updates {state['updates']}")
+    return abs(run_time - seconds) < 0.5 and state["updates"] == seconds
+
+def benchmark_timer_tenths(seconds=10):
+    """1/10秒表示で毎秒10回描き直したときのフレーム時間を実時間で測る (python bench_quiz3.py timer-tenths [秒])。
+    タイマーだけを描き足した画像が generate_image で全体を描いた画像と一致するかも確かめる"""
+    import statistics
+    drawer = ScoreboardDrawer()
+    ok = True
+    for mode, count in (("SEMI", 9), ("Swedish10", 5)):
+        players = []
+        for i in range(count):
+            p = get_empty_player(i + 1)
+            p.update(name=f"出場 者{i + 1}", univ="立命館大学")
+            players.append(p)
+        kwargs = dict(players=players, group_idx=0, question_text="問題文" * 10, answer_text="答え", mode=mode)
+        t0 = time.perf_counter()
+        drawer.generate_image(**kwargs)
+        full_ms = (time.perf_counter() - t0) * 1000
+        drawer.generate_image_layered(**kwargs)
+        frames, lateness, missed = [], [], 0
+        start = time.perf_counter()
+        for n in range(seconds * 10 + 1):
+            due = start + n * 0.1
+            while time.perf_counter() < due:
+                time.sleep(0.001)
+            tenths = seconds * 10 - n
+            timer_str = f"{tenths // 600:02}:{tenths // 10 % 60:02}.{tenths % 10}"
+            t0 = time.perf_counter()
+            im = drawer.generate_image_layered(**kwargs, timer_str=timer_str, timer_alert=(tenths == 0))
+            done = time.perf_counter()
+            frames.append((done - t0) * 1000)
+            lateness.append((done - due) * 1000)
+            if done > due + 0.1:
+                missed += 1
+            if n % 25 == 0:
+                for obs in (False, True):
+                    args = dict(kwargs, timer_str=timer_str, timer_alert=(tenths == 0), obs_overlay=obs)
+                    if ImageChops.difference(drawer.generate_image_layered(**args), drawer.generate_image(**args)).getbbox():
+                        ok = False
+                start += time.perf_counter() - done     # 照合にかかった時間は計測から外す
+        frames.sort()
+        print(f"{mode}: full render {full_ms:.0f}ms / timer-only redraw p50 {frames[len(frames) // 2]:.1f}ms "
+              f"p99 {frames[int(len(frames) * 0.99)]:.1f}ms max {frames[-1]:.1f}ms, "
+              f"{len(frames)} frames at 10Hz, mean lateness {statistics.mean(lateness):.1f}ms, missed {missed}")
+        ok = ok and missed == 0
+    t0 = time.perf_counter()
+    for tenths in range(100, -1, -1):
+        drawer.generate_image_timer_only(timer_str=f"00:{tenths // 10:02}.{tenths % 10}")
+    print(f"timer-only screen: {(time.perf_counter() - t0) * 1000 / 101:.1f}ms per frame, identical={ok}")
+    return ok
+
+class SimulatedBuzzerDevice:
+    """遅延測定用の模擬機器。schedule した (perf_counter_ns の予定時刻, 席) の順に押下を発生させる"""
+    name = "simulated"
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.fired = []             # (席, 予定時刻, 付けた時刻)
+
+    def schedule(self, at_ns, seat):
+        self.queue.put((at_ns, seat))
+
+    def read(self, timeout):
+        try:
+            at_ns, seat = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while time.perf_counter_ns() < at_ns:
+            time.sleep(0.0002)
+        t_ns = time.perf_counter_ns()
+        self.fired.append((seat, at_ns, t_ns))
+        return seat, t_ns
+
+    def close(self):
+        pass
+
+def benchmark_buzzer(rounds=200):
+    """模擬機器で押下を発生させ、時刻付けの遅れ・1着確定までの時間・強調表示の画像ができるまでの時間を測る
+    (python bench_quiz3.py buzzer [回数])。フライング・凍結中・誤答の締め出しと着順が正しいかも確かめる"""
+    import random
+    import statistics
+    arbiter = BuzzerArbiter()
+    device = SimulatedBuzzerDevice()
+    inputs = BuzzerInput(arbiter)
+    inputs.add(device)
+    drawer = ScoreboardDrawer()
+    players = []
+    for i in range(12):
+        p = get_empty_player(i + 1)
+        p.update(name=f"出場 者{i + 1}", univ="立命館大学")
+        players.append(p)
+    rng = random.Random(1)
+    ms = 1_000_000
+    stamp_lag, decide_lag, frame_lag, errors = [], [], [], 0
+
+    def decide():
+        # Tk 側の _poll_buzzer と同じ間隔で判定を見に行く
+        while True:
+            seat = arbiter.poll()
+            if seat is not None:
+                return seat, time.perf_counter_ns()
+            time.sleep(BUZZER_POLL_MS / 1000)
+
+    try:
+        for _ in range(rounds):
+            frozen, early, first, second = rng.sample(range(12), 4)
+            gap_ns = rng.randrange(20_000, 500_000)
+            arbiter.disarm()                                        # 問題と問題の間
+            device.schedule(time.perf_counter_ns(), early)          # フライング
+            time.sleep(0.005)
+            fired = len(device.fired)
+            arbiter.arm(locked={frozen})
+            t0 = time.perf_counter_ns()
+            device.schedule(t0 + 10 * ms, frozen)
+            device.schedule(t0 + 11 * ms, early)
+            device.schedule(t0 + 12 * ms, first)
+            device.schedule(t0 + 12 * ms + gap_ns, second)
+            winner, decided = decide()
+            while len(device.fired) < fired + 4:
+                time.sleep(0.001)
+            t_first = next(t for seat, _, t in device.fired[fired:] if seat == first)
+            im = drawer.generate_image(players, 0, "", "", mode="2R", buzz_idx=winner)
+            frame_ready = time.perf_counter_ns()
+            if winner != first or [s for s, _ in arbiter.order()] != [first, second]:
+                errors += 1
+            decide_lag.append((decided - t_first) / ms)
+            frame_lag.append((frame_ready - t_first) / ms)
+            # 誤答: 1着の席を締め出して受付し直すと 2番目に押した席が取る
+            arbiter.rearm(reject=first, locked={frozen})
+            t1 = time.perf_counter_ns()
+            device.schedule(t1 + 1 * ms, first)
+            device.schedule(t1 + 2 * ms, second)
+            if decide()[0] != second:
+                errors += 1
+        stamp_lag = [(t - at) / ms for _, at, t in device.fired]
+
+        # キーボード: Tk のイベント処理が 1フレームの描画ぶん (160ms) 遅れても、先に押したキーが 1着になるか
+        keyboard = KeyboardBuzzerDevice(arbiter)
+        base_ms = 123_456
+        clock0 = time.perf_counter_ns()
+        for k in range(8):
+            # 空いているときのキー入力で時計合わせ (ハンドラの遅れ 0〜1ms)
+            keyboard.event_time_ns(base_ms + k, clock0 + k * ms + rng.randrange(0, ms))
+        late_errors = 0
+        for _ in range(20):
+            seat_key, seat_serial = rng.sample(range(12), 2)
+            arbiter.arm()
+            t0 = time.perf_counter_ns()
+            pressed_ms = base_ms + (t0 - clock0) // ms + 1
+            device.schedule(t0 + 5 * ms, seat_serial)                       # 5ms 後に押されたボタン
+            time.sleep(0.160)
+            keyboard.press(seat_key, pressed_ms)                            # 1ms 後に押されたキー (処理は 160ms 後)
+            if decide()[0] != seat_key:
+                late_errors += 1
+            arbiter.disarm()
+        errors += late_errors
+    finally:
+        inputs.stop()
+    stamp_lag.sort(); decide_lag.sort(); frame_lag.sort()
+    print(f"rounds={rounds} settle={BUZZER_SETTLE_US}us poll={BUZZER_POLL_MS}ms frame={im.size[0]}x{im.size[1]}")
+    for label, xs in (("timestamp lag", stamp_lag), ("press -> winner", decide_lag), ("press -> highlighted frame", frame_lag)):
+        print(f"{label} ms: p50 {xs[len(xs) // 2]:.3f} p99 {xs[int(len(xs) * 0.99)]:.3f} "
+              f"mean {statistics.mean(xs):.3f} max {xs[-1]:.3f}")
+    print(f"keyboard presses handled 160ms late: wrong winner {late_errors}/20")
+    print(f"errors={errors}")
+    return errors == 0
+
+BENCHMARKS = {
+    # 名前: (関数, 引数の名前, 既定値)
+    "frame-ring": (benchmark_frame_ring, None, None),
+    "timer": (benchmark_timer, "seconds", 300),
+    "timer-tenths": (benchmark_timer_tenths, "seconds", 10),
+    "buzzer": (benchmark_buzzer, "rounds", 200),
+    "web-scoreboard": (benchmark_web_scoreboard, "clients", 48),
+}
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"使い方: python bench_quiz3.py {{{'|'.join(BENCHMARKS)}}} [回数]")
+        sys.exit(2)
+    fn, arg, default = BENCHMARKS[sys.argv[1]]
+    if arg is None:
+        fn()
+        sys.exit(0)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else default
+    sys.exit(0 if fn(**{arg: count}) else 1)
@@ -1,9 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pandas as pd
+import csv
+import os
 import dataclasses
 from enum import Enum
-from typing import List, Dict, Optional, Type
+from typing import List, Dict, Optional, Type, Tuple
+
+# pandas は Excel 名簿を読むときだけ必要になるので、起動時には読み込まない
+ROSTER_CSV_EXTENSIONS = (".csv", ".txt")
+ROSTER_CSV_ENCODINGS = ("utf-8-sig", "cp932")
+
+# 操作パネルの1行の高さと各列の幅 (px)。行ウィジェットは表示範囲の分だけ作って使い回す
+PANEL_ROW_HEIGHT = 44
+PANEL_HEADERS = ["ID", "名前", "所属", "スコア", "誤答数", "状態", "判定操作"]
+PANEL_COLUMN_WIDTHS = [60, 200, 200, 80, 120, 110, 130]
 
 # --- 1. バックエンド・ロジック (クイズルールと計算) ---
 
@@ -92,22 +102,82 @@ class QuizSystem:
             "F: 10○4×": RuleNbyM(10, 4)
         }
 
+    @staticmethod
+    def _pick_roster_columns(columns: List[str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """CSVのカラム名に柔軟に対応し、(番号, 表示名, 所属) の列位置を返す"""
+        def find(pred):
+            return next((i for i, c in enumerate(columns) if pred(c)), None)
+        col_id = find(lambda c: '番号' in c)
+        col_name = find(lambda c: '名' in c and '表示' in c) # 表示名優先
+        if col_name is None: col_name = find(lambda c: '姓' in c)
+        col_org = find(lambda c: '所属' in c)
+        return col_id, col_name, col_org
+
+    @staticmethod
+    def _parse_player_id(raw) -> int:
+        try:
+            return int(float(str(raw).strip()))
+        except (TypeError, ValueError, OverflowError):
+            return 0
+
+    def _roster_from_rows(self, rows) -> Dict[int, Player]:
+        """csv.reader の行を順に読み、列位置で値を取り出す (pandas 不要)"""
+        header = next(rows, None)
+        if header is None:
+            return {}
+        col_id, col_name, col_org = self._pick_roster_columns([c.strip() for c in header])
+        roster: Dict[int, Player] = {}
+        if col_id is None:
+            return roster
+        for row in rows:
+            if col_id >= len(row):
+                continue
+            pid = self._parse_player_id(row[col_id])
+            if pid <= 0:
+                continue
+            name = row[col_name] if col_name is not None and col_name < len(row) and row[col_name] != "" else f"Player{pid}"
+            org = row[col_org] if col_org is not None and col_org < len(row) else ""
+            roster[pid] = Player(pid, name, org)
+        return roster
+
+    def _roster_from_frame(self, df) -> Dict[int, Player]:
+        """DataFrame を列ごとにまとめて変換してから Player を作る (iterrows を使わない)"""
+        import pandas as pd
+        col_id, col_name, col_org = self._pick_roster_columns([str(c) for c in df.columns])
+        if col_id is None:
+            return {}
+        ids = pd.to_numeric(df.iloc[:, col_id], errors="coerce").fillna(0).astype("int64")
+        fallback = "Player" + ids.astype(str)
+        if col_name is not None:
+            names = df.iloc[:, col_name]
+            names = names.astype(str).where(names.notna(), fallback)
+        else:
+            names = fallback
+        if col_org is not None:
+            orgs = df.iloc[:, col_org]
+            orgs = orgs.astype(str).where(orgs.notna(), "")
+        else:
+            orgs = pd.Series("", index=df.index)
+        mask = ids > 0
+        return {pid: Player(pid, name, org) for pid, name, org in zip(ids[mask].tolist(), names[mask].tolist(), orgs[mask].tolist())}
+
     def load_roster(self, filepath):
         try:
-            df = pd.read_csv(filepath)
-            # CSVのカラム名に柔軟に対応
-            col_id = next((c for c in df.columns if '番号' in c), None)
-            col_name = next((c for c in df.columns if '名' in c and '表示' in c), '表示名') # 表示名優先
-            if not col_name: col_name = next((c for c in df.columns if '姓' in c), None)
-            col_org = next((c for c in df.columns if '所属' in c), '所属')
-
-            if col_id:
-                for _, row in df.iterrows():
-                    pid = int(row[col_id]) if pd.notna(row[col_id]) else 0
-                    name = str(row[col_name]) if col_name and pd.notna(row[col_name]) else f"Player{pid}"
-                    org = str(row[col_org]) if col_org and pd.notna(row[col_org]) else ""
-                    if pid > 0:
-                        self.roster[pid] = Player(pid, name, org)
+            if os.path.splitext(filepath)[1].lower() in ROSTER_CSV_EXTENSIONS:
+                roster = None
+                for enc in ROSTER_CSV_ENCODINGS:
+                    try:
+                        with open(filepath, newline="", encoding=enc) as f:
+                            roster = self._roster_from_rows(csv.reader(f))
+                        break
+                    except UnicodeDecodeError:
+                        continue
+                if roster is None:
+                    raise ValueError("名簿の文字コードを判定できませんでした。")
+            else:
+                import pandas as pd
+                roster = self._roster_from_frame(pd.read_excel(filepath))
+            self.roster.update(roster)
             return True
         except Exception as e:
             print(f"Error: {e}")
@@ -115,6 +185,82 @@ class QuizSystem:
 
 # --- 2. GUI フロントエンド (Tkinter) ---
 
+class PlayerRow:
+    """操作パネルの1行分のウィジェット。一度だけ作り、表示するプレイヤーが変わったら config で書き換える"""
+    def __init__(self, app, parent):
+        self.app = app
+        self.player: Optional[Player] = None
+        self.shown = None # 最後に表示した内容 (変化がなければ config しない)
+        self.frame = tk.Frame(parent, height=PANEL_ROW_HEIGHT, width=sum(PANEL_COLUMN_WIDTHS) + 2 * len(PANEL_COLUMN_WIDTHS))
+        self.frame.grid_propagate(False)
+        for i, w in enumerate(PANEL_COLUMN_WIDTHS):
+            self.frame.columnconfigure(i, minsize=w)
+        self.frame.rowconfigure(0, weight=1)
+
+        # width=1 で要求幅を最小にし、列幅は columnconfigure の minsize で揃える (長い名前は切り詰め)
+        common_opt = {'font': ("Arial", 12), 'padx': 10, 'pady': 5, 'width': 1}
+        self.lbl_id = tk.Label(self.frame, **common_opt)
+        self.lbl_id.grid(row=0, column=0, sticky="nsew", padx=1, pady=1)
+        self.lbl_name = tk.Label(self.frame, anchor="w", **common_opt)
+        self.lbl_name.grid(row=0, column=1, sticky="nsew", padx=1, pady=1)
+        self.lbl_org = tk.Label(self.frame, anchor="w", **common_opt)
+        self.lbl_org.grid(row=0, column=2, sticky="nsew", padx=1, pady=1)
+        # スコア表示 (大きく)
+        self.lbl_score = tk.Label(self.frame, fg="blue", font=("Arial", 16, "bold"), width=1)
+        self.lbl_score.grid(row=0, column=3, sticky="nsew", padx=1, pady=1)
+        # 誤答数表示
+        self.lbl_wrong = tk.Label(self.frame, fg="red", font=("Arial", 14, "bold"), width=1)
+        self.lbl_wrong.grid(row=0, column=4, sticky="nsew", padx=1, pady=1)
+        # ステータス
+        self.lbl_status = tk.Label(self.frame, **common_opt)
+        self.lbl_status.grid(row=0, column=5, sticky="nsew", padx=1, pady=1)
+
+        # 操作ボタンフレーム
+        self.btn_frame = tk.Frame(self.frame)
+        self.btn_frame.grid(row=0, column=6, padx=1, pady=1)
+        self.btn_o = tk.Button(self.btn_frame, text="○", font=("Arial", 12, "bold"), fg="white", width=4,
+                               command=lambda: self.player and self.app.action_correct(self.player))
+        self.btn_x = tk.Button(self.btn_frame, text="×", font=("Arial", 12, "bold"), fg="white", width=4,
+                               command=lambda: self.player and self.app.action_wrong(self.player))
+        self.btn_o.pack(side=tk.LEFT, padx=2)
+        self.btn_x.pack(side=tk.LEFT, padx=2)
+
+        self.item = parent.create_window((0, 0), window=self.frame, anchor="nw", state="hidden")
+        for w in (self.frame, self.lbl_id, self.lbl_name, self.lbl_org, self.lbl_score, self.lbl_wrong, self.lbl_status, self.btn_frame):
+            w.bind("<MouseWheel>", app._on_panel_wheel)
+
+    def show(self, player: Player):
+        self.player = player
+        shown = (player.id, player.name, player.organization, player.score, player.wrong_count, player.status)
+        if shown == self.shown:
+            return
+        self.shown = shown
+
+        bg_color = "white"
+        fg_color = "black"
+        # 状態による色分け
+        if player.status == PlayerStatus.WIN:
+            bg_color = "#ffcccc" # 赤背景（勝ち抜け）
+            fg_color = "#cc0000"
+        elif player.status == PlayerStatus.LOSE:
+            bg_color = "#cccccc" # グレー（失格）
+            fg_color = "#666666"
+
+        self.frame.config(bg=bg_color)
+        self.lbl_id.config(text=str(player.id), bg=bg_color, fg=fg_color)
+        self.lbl_name.config(text=player.name, bg=bg_color, fg=fg_color)
+        self.lbl_org.config(text=player.organization, bg=bg_color, fg=fg_color)
+        self.lbl_score.config(text=str(player.score), bg=bg_color)
+        self.lbl_wrong.config(text="×" * player.wrong_count, bg=bg_color)
+        self.lbl_status.config(text=player.status.value, bg=bg_color, fg=fg_color)
+        self.btn_frame.config(bg=bg_color)
+        if player.status != PlayerStatus.PLAYING:
+            self.btn_o.config(state="disabled", bg="#ddaaaa")
+            self.btn_x.config(state="disabled", bg="#aaaadd")
+        else:
+            self.btn_o.config(state="normal", bg="#ff3333")
+            self.btn_x.config(state="normal", bg="#3333ff")
+
 class QuizApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -122,7 +268,7 @@ class QuizApp(tk.Tk):
         self.geometry("1000x600")
         
         self.system = QuizSystem()
-        self.player_frames = [] # プレイヤー行のウィジェット管理用
+        self.row_pool: List[PlayerRow] = [] # プレイヤー行のウィジェット (表示範囲の分だけ作って使い回す)
 
         # 自動読み込みトライ
         default_csv = 'abc23model-1.xlsx - 名簿.csv'
@@ -160,17 +306,19 @@ class QuizApp(tk.Tk):
         tk.Button(control_frame, text="スルー / 次へ", command=self.next_question).pack(side=tk.LEFT, padx=5)
 
         # --- メイン：プレイヤースコアパネル ---
-        # スクロール可能なエリアを作成
-        self.canvas = tk.Canvas(self)
+        # ヘッダー (スクロールしない)
+        header_frame = tk.Frame(self)
+        header_frame.pack(side=tk.TOP, fill=tk.X)
+        for i, (h, w) in enumerate(zip(PANEL_HEADERS, PANEL_COLUMN_WIDTHS)):
+            header_frame.columnconfigure(i, minsize=w)
+            tk.Label(header_frame, text=h, font=("MS Gothic", 10, "bold"), relief=tk.RAISED, bg="#eeeeee", width=1).grid(row=0, column=i, sticky="nsew", padx=1, pady=1)
+
+        # スクロール可能なエリア。全員分の高さをスクロール範囲にし、見えている行だけウィジェットを割り当てる
+        self.canvas = tk.Canvas(self, yscrollincrement=PANEL_ROW_HEIGHT, highlightthickness=0)
         self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.scroll_frame = tk.Frame(self.canvas)
-
-        self.scroll_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        self.canvas.create_window((0, 0), window=self.scroll_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.configure(yscrollcommand=self._on_panel_scroll)
+        self.canvas.bind("<Configure>", lambda e: self._layout_rows())
+        self.canvas.bind("<MouseWheel>", self._on_panel_wheel)
 
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -197,6 +345,7 @@ class QuizApp(tk.Tk):
                 pass
         
         # 画面再描画
+        self.canvas.yview_moveto(0)
         self.refresh_panel()
         self.lbl_q_num.config(text="Q.1")
 
@@ -209,63 +358,35 @@ class QuizApp(tk.Tk):
         except:
             pass
 
+    def _on_panel_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._layout_rows()
+
+    def _on_panel_wheel(self, event):
+        self.canvas.yview_scroll(int(-event.delta / 120) or (-1 if event.delta > 0 else 1), "units")
+
+    def _layout_rows(self):
+        """見えている範囲の行にだけプール内のウィジェットを割り当てる"""
+        players = self.system.current_players
+        visible = max(1, self.canvas.winfo_height() // PANEL_ROW_HEIGHT + 2)
+        while len(self.row_pool) < min(visible, len(players)):
+            self.row_pool.append(PlayerRow(self, self.canvas))
+
+        first = max(0, int(self.canvas.canvasy(0)) // PANEL_ROW_HEIGHT)
+        for k, row in enumerate(self.row_pool):
+            idx = first + k
+            if idx < len(players) and k < visible:
+                self.canvas.coords(row.item, 0, idx * PANEL_ROW_HEIGHT)
+                self.canvas.itemconfigure(row.item, state="normal")
+                row.show(players[idx])
+            else:
+                self.canvas.itemconfigure(row.item, state="hidden")
+                row.player = None
+
     def refresh_panel(self):
-        # 既存ウィジェット削除
-        for widget in self.scroll_frame.winfo_children():
-            widget.destroy()
-        
-        # ヘッダー
-        headers = ["ID", "名前", "所属", "スコア", "誤答数", "状態", "判定操作"]
-        for i, h in enumerate(headers):
-            tk.Label(self.scroll_frame, text=h, font=("MS Gothic", 10, "bold"), relief=tk.RAISED, bg="#eeeeee").grid(row=0, column=i, sticky="nsew", padx=1, pady=1)
-
-        # プレイヤー行生成
-        for idx, player in enumerate(self.system.current_players):
-            row = idx + 1
-            bg_color = "white"
-            fg_color = "black"
-            
-            # 状態による色分け
-            if player.status == PlayerStatus.WIN:
-                bg_color = "#ffcccc" # 赤背景（勝ち抜け）
-                fg_color = "#cc0000"
-            elif player.status == PlayerStatus.LOSE:
-                bg_color = "#cccccc" # グレー（失格）
-                fg_color = "#666666"
-
-            common_opt = {'bg': bg_color, 'fg': fg_color, 'font': ("Arial", 12), 'padx': 10, 'pady': 5}
-
-            tk.Label(self.scroll_frame, text=str(player.id), **common_opt).grid(row=row, column=0, sticky="nsew", padx=1, pady=1)
-            tk.Label(self.scroll_frame, text=player.name, **common_opt).grid(row=row, column=1, sticky="w", padx=1, pady=1)
-            tk.Label(self.scroll_frame, text=player.organization, **common_opt).grid(row=row, column=2, sticky="w", padx=1, pady=1)
-            
-            # スコア表示 (大きく)
-            tk.Label(self.scroll_frame, text=str(player.score), bg=bg_color, fg="blue", font=("Arial", 16, "bold")).grid(row=row, column=3, sticky="nsew", padx=1, pady=1)
-            
-            # 誤答数表示
-            wrong_text = "×" * player.wrong_count
-            tk.Label(self.scroll_frame, text=wrong_text, bg=bg_color, fg="red", font=("Arial", 14, "bold")).grid(row=row, column=4, sticky="nsew", padx=1, pady=1)
-
-            # ステータス
-            tk.Label(self.scroll_frame, text=player.status.value, **common_opt).grid(row=row, column=5, sticky="nsew", padx=1, pady=1)
-
-            # 操作ボタンフレーム
-            btn_frame = tk.Frame(self.scroll_frame, bg=bg_color)
-            btn_frame.grid(row=row, column=6, padx=1, pady=1)
-            
-            # ○ボタン
-            btn_o = tk.Button(btn_frame, text="○", font=("Arial", 12, "bold"), fg="white", bg="#ff3333", width=4,
-                              command=lambda p=player: self.action_correct(p))
-            # ×ボタン
-            btn_x = tk.Button(btn_frame, text="×", font=("Arial", 12, "bold"), fg="white", bg="#3333ff", width=4,
-                              command=lambda p=player: self.action_wrong(p))
-            
-            if player.status != PlayerStatus.PLAYING:
-                btn_o.config(state="disabled", bg="#ddaaaa")
-                btn_x.config(state="disabled", bg="#aaaadd")
-
-            btn_o.pack(side=tk.LEFT, padx=2)
-            btn_x.pack(side=tk.LEFT, padx=2)
+        n = len(self.system.current_players)
+        self.canvas.configure(scrollregion=(0, 0, sum(PANEL_COLUMN_WIDTHS) + 2 * len(PANEL_COLUMN_WIDTHS), n * PANEL_ROW_HEIGHT))
+        self._layout_rows()
 
     def action_correct(self, player):
         self.system.rule.on_correct(player)
@@ -1,12 +1,38 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog, ttk
-from PIL import Image, ImageDraw, ImageFont, ImageTk, ImageOps
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageTk, ImageOps
 import os
 import csv
 import re
+from array import array
+import asyncio
+import base64
+import bisect
+import codecs
 import copy
+import difflib
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import pickle
+import queue
+import secrets
+from multiprocessing import shared_memory
+import struct
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import traceback
+import unicodedata
+import urllib.parse
 import zipfile
 import xml.etree.ElementTree as ET
 
@@ -57,7 +83,56 @@ TIMER_DEFAULT_SEC = 0
 DISPLAY_WINDOW_SEPARATE_DEFAULT = True
 OBS_OVERLAY_DEFAULT = False
 OBS_CHROMA_KEY_COLOR = (0, 255, 0)
+# True なら OBS用の透過帯をクロマキー色ではなく α=0 の RGBA で出力する (配信・共有メモリ出力向け。画面表示はクロマキー色で埋める)
+OBS_OVERLAY_TRANSPARENT_DEFAULT = False
 TIMER_VISIBLE_DEFAULT = True
+# 1/10秒表示 (MM:SS.t)。SEMI・3rd コース・タイマー画面で、残りがこの秒数以下になったら切り替える (0 なら常に)
+TIMER_TENTHS_DEFAULT = False
+TIMER_TENTHS_LAST_SEC = 10
+TIMER_TENTHS_SCALE = 0.8   # 1/10秒表示は文字数が増えるので一回り小さく描く
+# 合成フレームの HTTP 配信 (OBS のブラウザソース/メディアソースから localhost で取得する。使うときだけ有効にする)
+FRAME_SERVER_ENABLED = False
+FRAME_SERVER_HOST = "127.0.0.1"
+FRAME_SERVER_PORT = 8765
+FRAME_SERVER_JPEG_QUALITY = 85
+FRAME_SERVER_MJPEG_MAX_FPS = 30
+# 合成フレームを無圧縮のまま共有メモリのリングバッファへ書き出す (録画・別マシン中継などローカルの別プロセス向け)
+FRAME_RING_ENABLED = False
+FRAME_RING_NAME = "ruqabc_frames"
+FRAME_RING_SLOTS = 3
+# 出力先ごとの描画内容: "main" = 操作画面と同じ表示 / "obs" = 常に OBS合成UI / "timer" = タイマーのみ
+OUTPUT_STREAM_KIND = "main"  # HTTP 配信・共有メモリ出力に流す内容
+# 表示分離中も操作画面に小さなプレビューを残す
+CONTROL_PREVIEW_WITH_DISPLAY = True
+CONTROL_PREVIEW_HEIGHT = 200
+HOST_TIMER_WINDOW_TITLE = "RUQabc Host Timer"
+HOST_TIMER_WINDOW_GEOMETRY = "640x360"
+# 描画を子プロセスで行い、操作画面の応答を保つ (子プロセスが落ちても自動で作り直す)
+# 会場の PC で動作を確かめるまでは既定で無効 (無効なら従来どおり操作画面のスレッドで描画する)
+RENDER_PROCESS_ENABLED = False
+RENDER_PROCESS_RING_SLOTS = 4  # 1回の依頼で描く種類の数 (最大3) より多くする
+RENDER_PROCESS_POLL_MS = 10
+RENDER_PROCESS_TIMEOUT_SEC = 10.0
+# 複数オペレーター用の操作API (WebSocket: ws://HOST:PORT/ws / HTTP: POST /api/command, GET /api/state)
+# 同じポートで Web版スコアボードも配信する (http://HOST:PORT/scoreboard、OBS 用は ?layout=obs&transparent=1)
+# どの URL にもトークン (?token=...) が必要。CONTROL_API_TOKEN が空なら起動ごとに作り、起動時に URL を表示する
+# 別の PC から操作する場合は HOST を "0.0.0.0" にする。他サイトのページからの WebSocket 接続・POST は Origin で拒否する
+CONTROL_API_ENABLED = False
+CONTROL_API_HOST = "127.0.0.1"
+CONTROL_API_PORT = 8766
+CONTROL_API_TOKEN = ""
+CONTROL_API_MAX_MESSAGE_BYTES = 64 * 1024  # 受け取る WebSocket メッセージ・POST 本文の上限
+CONTROL_API_POLL_MS = 5
+CONTROL_API_CLIENT_BUFFER_BYTES = 1024 * 1024  # 送信待ちがこれを超えた遅いクライアントは切断する
+# 早押し判定 (操作画面のキー、またはシリアル接続の押しボタンを席 1〜12 に割り当てる)
+BUZZER_ENABLED = True
+BUZZER_KEYS = ["F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8", "F9", "F10", "F11", "F12"]
+BUZZER_SERIAL_PORT = ""         # 例: "COM3" / "/dev/ttyUSB0" (空なら使わない。pyserial が必要)
+BUZZER_SERIAL_BAUD = 115200
+BUZZER_SETTLE_US = 2000         # 最初の押下からこの時間は後から届く押下を待ってから 1着を決める
+BUZZER_EARLY_LOCKOUT_MS = 300   # フライングした席を受付開始からこの時間だけ締め出す
+BUZZER_POLL_MS = 5
+BUZZER_HIGHLIGHT_COLOR = "#FFE000"
 DISPLAY_WINDOW_TITLE = "RUQabc Display"
 DISPLAY_WINDOW_GEOMETRY = "1920x1080"
 CONTROL_WINDOW_GEOMETRY = "1500x650"
@@ -72,6 +147,24 @@ CONTROL_SCALE_FILL = 0.98
 CONTROL_SCALE_MIN = 0.85
 CONTROL_SCALE_MAX = 1.8
 
+# 先頭サンプルで決めた文字コードで1回だけ読み、途中で解読できなければ次の文字コードで先頭から読み直す
+# (cp932 は Shift_JIS の上位互換なので shift_jis は並べない)
+CSV_ENCODINGS = ["utf-8", "cp932"]
+CSV_ENCODING_SAMPLE_BYTES = 64 * 1024
+FILE_READ_CHUNK_BYTES = 1024 * 1024
+FILE_LOAD_POLL_MS = 100
+QUESTION_WATCH_ENABLED = True
+QUESTION_WATCH_INTERVAL_MS = 1000
+QUESTION_CACHE_ENABLED = True
+QUESTION_CACHE_SUFFIX = ".rqcache"
+QUESTION_LAYOUT_SUFFIX = ".rqlayout"
+
+# 筆記予選の採点: 同点時は先頭の基準から順に比べる
+#   score: 配点込みの得点 / correct: 正解数 / rare: 正答率の低い問題ほど重く数えた正解 / backward: 後ろの問題から見た正誤の並び
+QUALIFIER_TIEBREAK = ["score", "correct", "rare", "backward"]
+QUALIFIER_ADVANCE = 48
+QUALIFIER_ANSWER_SEPARATOR = "|"
+
 SEMI_RULES = {
     1: {"correct": 1, "wrong": -1},
     2: {"correct": 1, "wrong": -2},
@@ -84,6 +177,13 @@ def get_advantage_points(rank_num):
     elif 13 <= rank_num <= 24: return 1
     return 0
 
+_player_state_counter = itertools.count(1)
+
+def touch_player(p):
+    """プレイヤーの状態が変わったことを記録する (表示キャッシュの無効化用)"""
+    p["state_ver"] = next(_player_state_counter)
+    return p
+
 def get_empty_player(rank_num):
     suffixes = {1: 'st', 2: 'nd', 3: 'rd'}
     suffix = suffixes.get(rank_num % 10 if not 11 <= rank_num <= 13 else 0, 'th')
@@ -109,7 +209,8 @@ def get_empty_player(rank_num):
         "semi_score": 0, "win_order_semi": 0,
         "semi_status": "active", "semi_exit_set": 0, # active, win, lose
         "final_sets_won": 0, "final_curr_o": 0, "final_curr_x": 0, "final_set_lost": False, "win_order_final": 0,
-        "extra_score": 0, "extra_wrong": 0, "win_order_extra": 0
+        "extra_score": 0, "extra_wrong": 0, "win_order_extra": 0,
+        "state_ver": next(_player_state_counter)
     }
 
 def get_ordinal_str(n):
@@ -121,13 +222,438 @@ def get_ordinal_str(n):
     return f"{n}th"
 
 def get_swedish10_wrong_increment(correct_count):
-    if correct_count <= 0:
-        return 1
-    if correct_count <= 2:
-        return 2
-    if correct_count <= 5:
-        return 3
-    return 4
+    return ROUND_FORMATS["Swedish10"].wrong_x_for(correct_count)
+
+# ==========================================
+# ラウンド形式定義 (宣言的に記述し、起動時に判定テーブルへコンパイルする)
+# ==========================================
+# o / x / win_order : 正解数・誤答数・勝ち抜け順を保持するキー
+# correct / wrong   : 1回の正解・誤答での o の増減 ("reset" で0に戻す、"set" でセット別表を参照)
+# wrong_x           : 1回の誤答での x の増減。((正解数の上限, 加算値), ...) の表も可 (上限None=以降すべて)
+# rento_bonus       : 連答時の追加点
+# freeze            : 誤答時の休み回数 = x + freeze
+# score             : "o" または "product" (o × x)
+# win_at / lose     : 勝ち抜けライン / 失格条件 (キー, 演算子, 値)
+# sets              : 複数セット制 (セット先取数・セット勝利/失格ライン)
+# force_win / force_lose : W/Lボタンで上書きする値
+# display           : 表示の定義 (省略した項目は正解数/誤答数の汎用表示)。文字列は str.format のテンプレートで、
+#                     {o} {x} {score} {next_x} (次の誤答での x の増分) {freeze} (残り休み) {sets} (獲得セット)
+#                     {x_marks} (x 個の ×) {main} (main の結果) が使える
+#   main / sub / note : 札の大きな数字 / その下の小さな文字 / 補足 (None なら出さない)
+#   obs / panel       : OBS合成UI・Web版の成績文字列 / 操作画面の成績文字列
+#   marks             : True なら x の数だけ × 印を描く
+#   gauge             : ゲージが満タンになる値 (省略時は勝ち抜けライン、None ならゲージなし)
+#   gauge_full_color  : ゲージが満タンのときの色
+#   win_text          : 勝ち抜け時の成績文字列 (省略時は勝ち抜け順 1st, 2nd...)
+#   frozen / hidden   : 休み中 / 得点を隠す (SF) ときに上書きする項目 (main_color も指定できる)
+MODE_COURSES = ["10by10", "Swedish10", "Freeze10", "10up-down"]
+
+ROUND_FORMAT_SPECS = {
+    "2R": {
+        "o": "score", "x": "wrong", "win_order": "win_order",
+        "correct": 1, "wrong_x": 1, "rento_bonus": 1,
+        "win_at": WIN_POINTS, "lose": ("x", ">=", LOSE_WRONGS),
+        "reset": {"score": lambda p: get_advantage_points(p["rank_num"]), "wrong": 0, "rento": False, "win_order": 0},
+        "force_win": {"score": WIN_POINTS}, "force_lose": {"wrong": LOSE_WRONGS},
+        "display": {"main": "{o}", "marks": True, "obs": "{o} {x_marks}", "panel": "{o}pts / {x}×"},
+    },
+    "10by10": {
+        "o": "10by10_o", "x": "10by10_x", "win_order": "win_order_10by10",
+        "correct": 1, "wrong_x": -1, "score": "product",
+        "win_at": 100, "lose": ("x", "<=", 4),
+        "reset": {"10by10_o": 0, "10by10_x": 10, "win_order_10by10": 0},
+        "force_win": {"10by10_o": 10, "10by10_x": 10}, "force_lose": {"10by10_x": 0},
+        "display": {"main": "{score}", "sub": "{o} × {x}", "obs": "{score} ({o} × {x})", "panel": "{score} ({o}○{x}×)"},
+    },
+    "Swedish10": {
+        "o": "Swedish10_o", "x": "Swedish10_x", "win_order": "win_order_Swedish10",
+        "correct": 1, "wrong_x": ((0, 1), (2, 2), (5, 3), (None, 4)),
+        "win_at": 10, "lose": ("x", ">=", 10),
+        "reset": {"Swedish10_o": 0, "Swedish10_x": 0, "win_order_Swedish10": 0},
+        "force_win": {"Swedish10_o": 10}, "force_lose": {"Swedish10_x": 10},
+        "display": {"main": "{o}", "sub": "{x}x", "note": "(+{next_x})",
+                    "obs": "{o} / {x}x (+{next_x})", "panel": "{o}○ {x}× (+{next_x})"},
+    },
+    "Freeze10": {
+        "o": "Freeze10_o", "x": "Freeze10_x", "win_order": "win_order_Freeze10",
+        "correct": 1, "wrong_x": 1, "freeze": 1, "freeze_key": "Freeze10_freeze",
+        "win_at": 10, "lose": ("x", ">=", 10),
+        "reset": {"Freeze10_o": 0, "Freeze10_x": 0, "Freeze10_freeze": 0, "win_order_Freeze10": 0},
+        "force_win": {"Freeze10_o": 10, "Freeze10_x": 0, "Freeze10_freeze": 0},
+        "force_lose": {"Freeze10_x": 10, "Freeze10_freeze": 0, "win_order_Freeze10": 0},
+        "display": {"main": "{o}", "sub": "{x}x", "obs": "{o} / {x}x", "panel": "{o}○ {x}×",
+                    "frozen": {"main": "Freeze {freeze}", "main_color": "cyan", "sub": None, "obs": "{main}"}},
+    },
+    "10up-down": {
+        "o": "10up-down_score", "x": "10up-down_wrong", "win_order": "win_order_10up-down",
+        "correct": 1, "wrong": "reset", "wrong_x": 1,
+        "win_at": 10, "lose": ("x", ">=", 2),
+        "reset": {"10up-down_score": 0, "10up-down_wrong": 0, "win_order_10up-down": 0},
+        "force_win": {"10up-down_score": 10}, "force_lose": {"10up-down_wrong": 2},
+        "display": {"main": "{o}", "marks": True, "obs": "{o} {x_marks}", "panel": "{o}pts {x}×"},
+    },
+    "SEMI": {
+        "o": "semi_score", "win_order": "win_order_semi",
+        "correct": "set", "wrong": "set", "set_deltas": SEMI_RULES,
+        "won": ("semi_status", "==", "win"), "lose": ("semi_status", "==", "lose"),
+        "exit_set_key": "semi_exit_set",
+        "reset": {"semi_score": 0, "semi_status": "active"},
+        "force_win": {"semi_status": "win"}, "force_lose": {"semi_status": "lose"},
+        "display": {"main": "{o}", "obs": "{main}", "panel": "{o} pts", "win_text": "WIN",
+                    "hidden": {"main": "?", "main_color": "white"}},
+    },
+    "FINAL": {
+        "o": "final_curr_o", "x": "final_curr_x", "win_order": "win_order_final",
+        "correct": 1, "wrong_x": 1, "lose": ("final_set_lost", "==", True), "lock_lost": True,
+        "sets": {"win_at": 7, "lose_x_at": 3, "to_win": 3, "won_key": "final_sets_won", "lost_key": "final_set_lost"},
+        "last_survivor": "set",
+        "reset": {"final_sets_won": 0},
+        "reset_set": {"final_curr_o": 0, "final_curr_x": 0, "final_set_lost": False},
+        "display": {"main": "{o}", "marks": True, "obs": "{o} {x_marks}", "panel": "{sets}Sets ({o}○{x}×)",
+                    "gauge_full_color": WIN_BG_COLOR, "win_text": "☆Champion☆"},
+    },
+    "EXTRA": {
+        "o": "extra_score", "x": "extra_wrong", "win_order": "win_order_extra",
+        "correct": 1, "wrong_x": 1, "win_order_mode": "first",
+        "win_at": 5, "lose": ("x", ">=", 1), "lock_lost": True,
+        "last_survivor": "win",
+        "reset": {"extra_score": 0, "extra_wrong": 0, "win_order_extra": 0},
+        "force_win": {"extra_score": 5}, "force_lose": {"extra_wrong": 1},
+        "display": {"main": "{o}", "obs": "{o}", "panel": "{o}pts {x}×"},
+    },
+}
+
+_COMPARE_OPS = {
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+    "==": lambda a, b: a == b,
+}
+
+class RoundFormat:
+    """ROUND_FORMAT_SPECS の1形式をコンパイルしたもの。判定時はモード分岐せず表とクロージャだけを辿る"""
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.o_key = spec["o"]
+        self.x_key = spec.get("x")
+        self.win_key = spec["win_order"]
+        self.freeze_key = spec.get("freeze_key")
+        self.sets = spec.get("sets")
+        self.win_at = spec.get("win_at")
+        self.x_start = spec.get("reset", {}).get(self.x_key, 0) if self.x_key else 0
+        self.display = self._compile_display(spec.get("display", {}))
+        self.gauge_max = self.display["gauge"]
+
+        o_key, x_key = self.o_key, self.x_key
+        if spec.get("score") == "product":
+            self.score = lambda p: p.get(o_key, 0) * p.get(x_key, 0)
+        else:
+            self.score = lambda p: p.get(o_key, 0)
+
+        # 誤答加算表: 正解数 -> x の増分 (勝ち抜けラインまで展開し、それ以降は末尾の値)
+        wrong_x = spec.get("wrong_x", 0)
+        if isinstance(wrong_x, tuple):
+            limit = (self.win_at or 0) + 1
+            table = []
+            for o in range(limit):
+                table.append(next(inc for upper, inc in wrong_x if upper is None or o <= upper))
+            self.wrong_x_table = table
+        else:
+            self.wrong_x_table = [wrong_x]
+
+        self.is_lost = self._compile_condition(spec.get("lose"))
+        won = self._compile_condition(spec.get("won"))
+        win_key = self.win_key
+        self.is_win = lambda p: p.get(win_key, 0) > 0 or won(p)
+        if self.freeze_key:
+            freeze_key = self.freeze_key
+            self.is_frozen = lambda p: p.get(freeze_key, 0) > 0
+        else:
+            self.is_frozen = lambda p: False
+
+        self.steps = {
+            "o": self._compile_correct(),
+            "x": self._compile_wrong(),
+            "r": self._compile_reset(),
+        }
+        self.after_steps = self._compile_survivor()
+
+    def wrong_x_for(self, correct_count):
+        table = self.wrong_x_table
+        idx = correct_count if correct_count > 0 else 0
+        return table[idx] if idx < len(table) else table[-1]
+
+    def gauge(self, p):
+        if not self.gauge_max:
+            return 0
+        return min(self.score(p), self.gauge_max) / self.gauge_max
+
+    def _compile_display(self, display):
+        """表示定義に汎用表示の既定値を補う"""
+        base = {"main": "{score}", "sub": None, "note": None, "obs": "{main}", "panel": "{o} pts",
+                "marks": False, "gauge": self.sets["win_at"] if self.sets else self.win_at,
+                "gauge_full_color": None, "win_text": None, "frozen": {}, "hidden": {}}
+        if self.x_key and not display:
+            base.update({"sub": "{x}x", "obs": "{o} / {x}x", "panel": "{o}○ {x}×"})
+        base.update(display)
+        return base
+
+    def view_texts(self, p, frozen=False, hidden=False):
+        """表示定義のテンプレートを埋め、(main, main_color, sub, note, obs, panel, marks) を返す"""
+        d = self.display
+        o = p.get(self.o_key, 0)
+        x = p.get(self.x_key, self.x_start) if self.x_key else 0
+        fields = {
+            "o": o, "x": x, "score": self.score(p), "next_x": self.wrong_x_for(o),
+            "freeze": p.get(self.freeze_key, 0) if self.freeze_key else 0,
+            "sets": p.get(self.sets["won_key"], 0) if self.sets else 0,
+            "x_marks": "×" * x,
+        }
+        if "rento_bonus" in self.spec and p.get("rento", False):
+            main_color = SCORE_COLOR_RENTO
+        else:
+            main_color = SCORE_COLOR_NORMAL
+        override = {}
+        if frozen:
+            override.update(d["frozen"])
+        if hidden:
+            override.update(d["hidden"])
+        main_color = override.get("main_color", main_color)
+
+        def fill(name):
+            tpl = override[name] if name in override else d[name]
+            return None if tpl is None else tpl.format(**fields).strip()
+
+        fields["main"] = fill("main")
+        return (fields["main"], main_color, fill("sub"), fill("note"), fill("obs"), fill("panel"),
+                x if d["marks"] else 0)
+
+    def _compile_condition(self, cond):
+        if cond is None:
+            return lambda p: False
+        key, op, value = cond
+        key = {"o": self.o_key, "x": self.x_key}.get(key, key)
+        default = self.x_start if key == self.x_key else 0
+        fn = _COMPARE_OPS[op]
+        return lambda p: fn(p.get(key, default), value)
+
+    def _next_win_order(self, players, p):
+        if self.spec.get("win_order_mode") == "first":
+            return 1
+        win_key = self.win_key
+        return len([pl for pl in players if pl[win_key] > 0]) + 1
+
+    def _compile_correct(self):
+        spec = self.spec
+        o_key, win_key = self.o_key, self.win_key
+        steps = []
+        if spec.get("correct") == "set":
+            set_deltas = spec["set_deltas"]
+            steps.append(lambda p, players, ctx: p.__setitem__(o_key, p[o_key] + set_deltas[ctx["set_idx"]]["correct"]))
+        elif spec.get("rento_bonus"):
+            bonus, delta, win_at = spec["rento_bonus"], spec["correct"], self.win_at
+            def add_with_rento(p, players, ctx):
+                p[o_key] += delta + (bonus if p["rento"] else 0)
+                if p["rento"]: p["rento"] = False
+                elif p[o_key] < win_at: p["rento"] = True
+            steps.append(add_with_rento)
+        elif self.sets:
+            sets, delta = self.sets, spec["correct"]
+            def add_in_set(p, players, ctx):
+                if p[o_key] >= sets["win_at"]:
+                    ctx["advance"] = False
+                    return
+                p[o_key] += delta
+                if p[o_key] == sets["win_at"]:
+                    p[sets["won_key"]] += 1
+                    ctx["events"].append(("set_won", p))
+                    if p[sets["won_key"]] >= sets["to_win"]: p[win_key] = 1
+            steps.append(add_in_set)
+        else:
+            delta = spec["correct"]
+            steps.append(lambda p, players, ctx: p.__setitem__(o_key, p[o_key] + delta))
+
+        if self.win_at is not None:
+            win_at, score = self.win_at, self.score
+            def check_win(p, players, ctx):
+                if score(p) >= win_at and p[win_key] == 0:
+                    p[win_key] = self._next_win_order(players, p)
+            steps.append(check_win)
+
+        if spec.get("rento_bonus"):
+            def clear_other_rento(p, players, ctx):
+                for other in players:
+                    if other is not p and other["rento"]:
+                        other["rento"] = False
+                        touch_player(other)
+            steps.append(clear_other_rento)
+        return steps
+
+    def _compile_wrong(self):
+        spec = self.spec
+        o_key, x_key = self.o_key, self.x_key
+        steps = []
+        wrong = spec.get("wrong")
+        if wrong == "set":
+            set_deltas = spec["set_deltas"]
+            steps.append(lambda p, players, ctx: p.__setitem__(o_key, p[o_key] + set_deltas[ctx["set_idx"]]["wrong"]))
+        elif wrong == "reset":
+            steps.append(lambda p, players, ctx: p.__setitem__(o_key, 0))
+        if x_key:
+            if len(self.wrong_x_table) > 1:
+                steps.append(lambda p, players, ctx: p.__setitem__(x_key, p[x_key] + self.wrong_x_for(p[o_key])))
+            else:
+                inc = self.wrong_x_table[0]
+                steps.append(lambda p, players, ctx: p.__setitem__(x_key, p[x_key] + inc))
+        if spec.get("rento_bonus"):
+            steps.append(lambda p, players, ctx: p.__setitem__("rento", False))
+        if self.freeze_key:
+            freeze_key, base = self.freeze_key, spec["freeze"]
+            steps.append(lambda p, players, ctx: p.__setitem__(freeze_key, p[x_key] + base))
+        if self.sets:
+            sets = self.sets
+            def check_set_lost(p, players, ctx):
+                if p[x_key] >= sets["lose_x_at"]: p[sets["lost_key"]] = True
+            steps.append(check_set_lost)
+        return steps
+
+    def _compile_reset(self):
+        reset = list(self.spec.get("reset", {}).items())
+        def reset_player(p, players, ctx):
+            for k, v in reset:
+                p[k] = v(p) if callable(v) else v
+            ctx["advance"] = False
+        steps = [reset_player]
+        if self.spec.get("reset_set"):
+            steps.append(lambda p, players, ctx: self.reset_set(players))
+        return steps
+
+    def _compile_survivor(self):
+        kind = self.spec.get("last_survivor")
+        if kind is None:
+            return []
+        is_lost, win_key = self.is_lost, self.win_key
+        if kind == "win":
+            def survivor_wins(p, players, ctx):
+                active = [pl for pl in players if pl["name"] != "---" and not is_lost(pl)]
+                already_win = any(pl[win_key] > 0 for pl in players)
+                if not already_win and len(active) == 1:
+                    winner = active[0]
+                    winner[win_key] = 1
+                    touch_player(winner)
+                    ctx["events"].append(("survivor", winner))
+            return [survivor_wins]
+        sets, o_key = self.sets, self.o_key
+        def survivor_takes_set(p, players, ctx):
+            active = [pl for pl in players if not is_lost(pl)]
+            if len(active) == 1:
+                winner = active[0]
+                winner[sets["won_key"]] += 1
+                winner[o_key] = sets["win_at"]
+                touch_player(winner)
+                ctx["events"].append(("set_survivor", winner))
+                if winner[sets["won_key"]] >= sets["to_win"]: winner[win_key] = 1
+        return [survivor_takes_set]
+
+    def reset_set(self, players):
+        """複数セット制で次のセットに入るときの現セット成績リセット"""
+        reset = self.spec.get("reset_set", {})
+        for p in players:
+            p.update(reset)
+            touch_player(p)
+
+    def judge(self, p, t, players, set_idx=1):
+        """○(o)/×(x)/リセット(r) を適用する。ロック中なら None、それ以外は (問題を進めるか, イベント一覧)"""
+        if self.is_frozen(p):
+            return None
+        if self.spec.get("lock_lost") and self.is_lost(p):
+            return None
+        ctx = {"advance": True, "events": [], "set_idx": set_idx}
+        for step in self.steps.get(t, ()):
+            step(p, players, ctx)
+        touch_player(p)
+        for step in self.after_steps:
+            step(p, players, ctx)
+        return ctx["advance"] and t in self.steps, ctx["events"]
+
+    def force(self, p, status, players, set_idx=1):
+        """W/Lボタンによる勝敗の上書き"""
+        values = self.spec.get("force_win" if status == "win" else "force_lose")
+        if not values:
+            return
+        p.update(values)
+        if self.spec.get("exit_set_key"):
+            p[self.spec["exit_set_key"]] = set_idx
+        elif status == "win" and p[self.win_key] == 0:
+            p[self.win_key] = len([pl for pl in players if pl[self.win_key] > 0]) + 1
+        touch_player(p)
+
+    def end_of_question(self, players):
+        if not self.freeze_key:
+            return
+        freeze_key = self.freeze_key
+        for p in players:
+            if p[freeze_key] > 0:
+                p[freeze_key] -= 1
+                touch_player(p)
+
+ROUND_FORMATS = {name: RoundFormat(name, spec) for name, spec in ROUND_FORMAT_SPECS.items()}
+
+def build_player_view(p, mode, sf_hide_scores=False):
+    """プレイヤー1人分の表示用派生情報 (勝敗・スコア文字列・色・ゲージ) をまとめて計算する。
+    文字や色は形式ごとの表示定義 (ROUND_FORMAT_SPECS の display) から作り、モード名では分岐しない"""
+    fmt = ROUND_FORMATS.get(mode)
+    win_order = p.get(fmt.win_key, 0) if fmt else 0
+    lost = fmt.is_lost(p) if fmt else False
+    frozen = fmt.is_frozen(p) if fmt else False
+    ratio = fmt.gauge(p) if fmt else 0
+    fill_color = INNER_BG_BOTTOM
+    marks = 0
+    main_text = ""
+    main_color = SCORE_COLOR_NORMAL
+    sub_text = None
+    note_text = None
+    obs_text = "-"
+    panel_text = ""
+    win_text = None
+
+    if fmt is not None:
+        main_text, main_color, sub_text, note_text, obs_text, panel_text, marks = fmt.view_texts(p, frozen, sf_hide_scores)
+        if ratio >= 1 and fmt.display["gauge_full_color"]:
+            fill_color = fmt.display["gauge_full_color"]
+        win_text = fmt.display["win_text"]
+
+    win = fmt.is_win(p) if fmt else False
+    score_color = main_color
+    if win:
+        status = "win"
+        score_color = "red"
+        obs_text = win_text or get_ordinal_str(win_order)
+    elif lost:
+        status = "lose"
+        score_color = "gray"
+        obs_text = "LOSE"
+    else:
+        status = "active"
+
+    return {
+        "status": status,
+        "win": win,
+        "lost": lost,
+        "frozen": frozen,
+        "win_order": win_order,
+        "suffix": {"win": " [WIN]", "lose": " [LOSE]"}.get(status, ""),
+        "main_text": main_text,
+        "main_color": main_color,
+        "sub_text": sub_text,
+        "note_text": note_text,
+        "marks": marks,
+        "fill_ratio": ratio,
+        "fill_color": fill_color,
+        "score_text": obs_text,
+        "score_color": score_color,
+        "panel_text": panel_text,
+    }
 
 # ==========================================
 # 描画エンジン
@@ -142,6 +668,11 @@ class ScoreboardDrawer:
                        self.find_font_path("BIZUDPGothic-Regular.ttf")
         self.load_fonts()
         self.photo_cache = {}
+        self.view_cache = {}
+        self.layout_cache = {}
+        self.font_variants = {}
+        self.timer_layer_cache = {}
+        self.timer_only_fonts = {}
 
     def find_font_path(self, f):
         candidates = [f, os.path.join(os.getcwd(), f), f"C:/Windows/Fonts/{f}", f"/Library/Fonts/{f}",
@@ -210,6 +741,18 @@ class ScoreboardDrawer:
         except:
             return None
 
+    def get_player_view(self, p, mode, sf_hide_scores=False):
+        ver = p.get("state_ver")
+        if ver is None:
+            return build_player_view(p, mode, sf_hide_scores)
+        key = (ver, mode, sf_hide_scores)
+        view = self.view_cache.get(key)
+        if view is None:
+            if len(self.view_cache) > 4096: self.view_cache.clear()
+            view = build_player_view(p, mode, sf_hide_scores)
+            self.view_cache[key] = view
+        return view
+
     def draw_text_fit(self, draw, text, cx, bottom_y, max_w, font_path, max_size, color, stroke_w, stroke_c, align="center", x_offset=0):
         size = max_size
         font = None
@@ -239,53 +782,39 @@ class ScoreboardDrawer:
         draw_x += x_offset
         draw.text((draw_x, bottom_y - h - 5), text, font=font, fill=color, stroke_width=stroke_w, stroke_fill=stroke_c)
 
+    def font_key(self, font):
+        return (str(getattr(font, "path", "") or f"#{id(font)}"), int(getattr(font, "size", 0) or 0))
+
+    def wrap_text_lines(self, draw, text, font, max_width):
+        """折り返し結果 (行のタプル) を文字列・フォント・幅ごとに覚えておく"""
+        key = (text, self.font_key(font), int(max_width))
+        lines = self.layout_cache.get(key)
+        if lines is None:
+            lines = []
+            words = list(text); current_line = ""
+            for char in words:
+                test_line = current_line + char
+                if draw.textbbox((0, 0), test_line, font=font)[2] <= max_width: current_line = test_line
+                else: lines.append(current_line); current_line = char
+            lines.append(current_line)
+            lines = tuple(lines)
+            if len(self.layout_cache) > 8192: self.layout_cache.clear()
+            self.layout_cache[key] = lines
+        return lines
+
     def draw_wrapped_text(self, draw, text, x, y, font, fill, max_width):
-        lines = []
-        words = list(text); current_line = ""
-        for char in words:
-            test_line = current_line + char
-            if draw.textbbox((0, 0), test_line, font=font)[2] <= max_width: current_line = test_line
-            else: lines.append(current_line); current_line = char
-        lines.append(current_line)
+        lines = self.wrap_text_lines(draw, text, font, max_width)
         cur_y = y
         for line in lines:
             draw.text((x, cur_y), line, font=font, fill=fill); cur_y += 10 + (font.size if hasattr(font, 'size') else 20)
         return cur_y
 
     def draw_player_plate(self, im, draw, p, xb, sy, cw, ch, scale, is_3rd=False, mode="2R"):
-        lost, win = False, False
-        win_order_num = 0
-        
-        if mode == "2R":
-            lost = p.get("wrong", 0) >= LOSE_WRONGS
-            win_order_num = p.get("win_order", 0)
-        elif mode == "10by10":
-            lost = p.get("10by10_x", 10) <= 4
-            win_order_num = p.get("win_order_10by10", 0)
-        elif mode == "Swedish10":
-            lost = p.get("Swedish10_x", 0) >= 10
-            win_order_num = p.get("win_order_Swedish10", 0)
-        elif mode == "Freeze10":
-            lost = p.get("Freeze10_x", 0) >= 10
-            win_order_num = p.get("win_order_Freeze10", 0)
-        elif mode == "10up-down":
-            lost = p.get("10up-down_wrong", 0) >= 2
-            win_order_num = p.get("win_order_10up-down", 0)
-        elif mode == "SEMI":
-            win_order_num = p.get("win_order_semi", 0)
-            if p.get("semi_status") == "win": win = True
-            if p.get("semi_status") == "lose": lost = True
-        elif mode == "FINAL":
-            lost = p.get("final_set_lost", False) 
-            win_order_num = p.get("win_order_final", 0)
-        elif mode == "EXTRA":
-            lost = p.get("extra_wrong", 0) >= 1
-            win_order_num = p.get("win_order_extra", 0)
-            
-        win = (win_order_num > 0) or (mode == "SEMI" and p.get("semi_status") == "win")
+        view = self.get_player_view(p, mode)
+        lost, win = view["lost"], view["win"]
 
         fc, rc, it = ("#555", "#555", "#666") if lost else (FRAME_COLOR, p["rank_color"], INNER_BG_TOP)
-        is_frozen = (mode == "Freeze10" and p.get("Freeze10_freeze", 0) > 0)
+        is_frozen = view["frozen"]
         if is_frozen and not win: it = "#444"
         if mode == "FINAL" and p.get("final_set_lost", False) and not win: it = "#444"
 
@@ -317,12 +846,9 @@ class ScoreboardDrawer:
             draw.rectangle((ix, iy + ih - text_area_h, ix + iw, iy + ih), fill=it)
             
             if not win and not lost:
-                ratio = min(p.get("final_curr_o", 0), 7) / 7.0
+                ratio = view["fill_ratio"]
                 if ratio > 0:
-                    fill_color = INNER_BG_BOTTOM
-                    if p.get("final_curr_o", 0) >= 7:
-                        fill_color = WIN_BG_COLOR
-                    draw.rectangle((ix, iy+ih*(1-ratio), ix+iw, iy+ih), fill=fill_color)
+                    draw.rectangle((ix, iy+ih*(1-ratio), ix+iw, iy+ih), fill=view["fill_color"])
 
             if p.get("photo_path"):
                 photo_w = iw - (photo_margin * 2)
@@ -355,14 +881,7 @@ class ScoreboardDrawer:
                 if win: draw.rectangle((ix, iy, ix+iw, iy+ih), fill=WIN_BG_COLOR)
                 elif lost: draw.rectangle((ix, iy, ix+iw, iy+ih), fill="#444")
                 else:
-                    ratio = 0
-                    if mode == "2R": ratio = min(p["score"], WIN_POINTS) / WIN_POINTS
-                    elif mode == "10by10": ratio = min(p["10by10_o"] * p["10by10_x"], 100) / 100
-                    elif mode == "Swedish10": ratio = min(p["Swedish10_o"], 10) / 10
-                    elif mode == "Freeze10": ratio = min(p["Freeze10_o"], 10) / 10
-                    elif mode == "10up-down": ratio = min(p["10up-down_score"], 10) / 10
-                    elif mode == "EXTRA": ratio = min(p["extra_score"], 5) / 5
-                    
+                    ratio = view["fill_ratio"]
                     if ratio > 0 and not is_frozen:
                          draw.rectangle((ix, iy+ih*(1-ratio), ix+iw, iy+ih), fill=INNER_BG_BOTTOM)
 
@@ -447,71 +966,83 @@ class ScoreboardDrawer:
             draw.text((xb+cw/2-(bbox[2]-bbox[0])/2, sy+ch+offset_y), text, font=font, fill=color)
 
         if win:
-            rank_val = 0
-            if mode == "2R": rank_val = p.get("win_order", 0)
-            elif mode == "10by10": rank_val = p.get("win_order_10by10", 0)
-            elif mode == "Swedish10": rank_val = p.get("win_order_Swedish10", 0)
-            elif mode == "Freeze10": rank_val = p.get("win_order_Freeze10", 0)
-            elif mode == "10up-down": rank_val = p.get("win_order_10up-down", 0)
-            elif mode == "EXTRA": rank_val = p.get("win_order_extra", 0)
-            elif mode == "FINAL": rank_val = p.get("win_order_final", 0)
-            
-            if mode == "FINAL" and rank_val > 0:
-                draw_center_scaled("☆Champion☆", self.header_path, 72, "red", max_w_ratio=0.98)
-            elif rank_val > 0:
-                txt = get_ordinal_str(rank_val)
-                # 変更: rank_path -> header_path
-                draw_center_scaled(txt, self.header_path, 80, "red", max_w_ratio=0.86)
+            if mode == "FINAL":
+                draw_center_scaled(view["score_text"], self.header_path, 72, "red", max_w_ratio=0.98)
             else:
-                txt = "WIN"
-                # 変更: rank_path -> header_path
-                draw_center_scaled(txt, self.header_path, 80, "red", max_w_ratio=0.86)
+                draw_center_scaled(view["score_text"] if view["win_order"] > 0 else "WIN", self.header_path, 80, "red", max_w_ratio=0.86)
         elif lost and mode != "FINAL":
-            txt = "LOSE"
-            # 変更: rank_path -> header_path
-            draw_center_scaled(txt, self.header_path, 92, "gray", max_w_ratio=1.10)
-        else:
-            if mode == "2R":
-                draw_center_scaled(str(p["score"]), self.header_path, 80, SCORE_COLOR_RENTO if p["rento"] else SCORE_COLOR_NORMAL)
-                if p["wrong"] > 0:
-                    f_mark_scaled = ImageFont.truetype(self.pick_font_path(self.main_path, prefer_japanese=True), int(60 * scale))
-                    for xi in range(p["wrong"]):
-                        draw.text((xb+cw/2-25*scale+xi*50*scale-draw.textbbox((0,0),"×",font=f_mark_scaled)[2]/2, sy+ch+100*scale), "×", font=f_mark_scaled, fill="white")
-            elif mode == "10by10":
-                val = p["10by10_o"] * p["10by10_x"]
-                draw_center_scaled(str(val), self.header_path, 80, SCORE_COLOR_NORMAL)
-                draw_center_scaled(f"{p['10by10_o']} × {p['10by10_x']}", self.header_path, 50, "white", 100)
-            elif mode == "Swedish10":
-                draw_center_scaled(str(p["Swedish10_o"]), self.header_path, 80, SCORE_COLOR_NORMAL)
-                # 修正: Swedish10の誤答数を白に変更
-                draw_center_scaled(f"{p['Swedish10_x']}x", self.header_path, 50, "white", 100)
-                next_penalty = get_swedish10_wrong_increment(p["Swedish10_o"])
-                draw_center_scaled(f"(+{next_penalty})", self.header_path, 36, "#b9d8ff", 145)
-            elif mode == "Freeze10":
-                if is_frozen: 
-                    # 修正: Freeze表示の変更
-                    draw_center_scaled(f"Freeze {p['Freeze10_freeze']}", self.header_path, 50, "cyan", 30)
+            draw_center_scaled("LOSE", self.header_path, 92, "gray", max_w_ratio=1.10)
+        elif mode == "FINAL" and lost:
+            draw_center_scaled("LOSE", self.header_path, 80, "gray")
+        elif mode == "Freeze10" and is_frozen:
+            draw_center_scaled(view["main_text"], self.header_path, 50, view["main_color"], 30)
+        elif mode != "SEMI":
+            draw_center_scaled(view["main_text"], self.header_path, 80, view["main_color"])
+            if view["sub_text"]:
+                draw_center_scaled(view["sub_text"], self.header_path, 50, "white", 100)
+            if view["note_text"]:
+                draw_center_scaled(view["note_text"], self.header_path, 36, "#b9d8ff", 145)
+            if view["marks"] > 0:
+                f_mark_scaled = ImageFont.truetype(self.pick_font_path(self.main_path, prefer_japanese=True), int(60 * scale))
+                mark_w = draw.textbbox((0,0),"×",font=f_mark_scaled)[2]
+                if mode == "10up-down":
+                    draw.text((xb+cw/2-mark_w/2, sy+ch+100*scale), "×", font=f_mark_scaled, fill="red")
                 else:
-                    draw_center_scaled(str(p["Freeze10_o"]), self.header_path, 80, SCORE_COLOR_NORMAL)
-                    draw_center_scaled(f"{p['Freeze10_x']}x", self.header_path, 50, "white", 100)
-            elif mode == "10up-down":
-                draw_center_scaled(str(p["10up-down_score"]), self.header_path, 80, SCORE_COLOR_NORMAL)
-                if p["10up-down_wrong"] > 0:
-                    f_mark_scaled = ImageFont.truetype(self.pick_font_path(self.main_path, prefer_japanese=True), int(60 * scale))
-                    draw.text((xb+cw/2-draw.textbbox((0,0),"×",font=f_mark_scaled)[2]/2, sy+ch+100*scale), "×", font=f_mark_scaled, fill="red")
-            elif mode == "FINAL":
-                if p["final_set_lost"]:
-                    # 変更: rank_path -> header_path
-                    draw_center_scaled("LOSE", self.header_path, 80, "gray")
-                else:
-                    draw_center_scaled(str(p["final_curr_o"]), self.header_path, 80, SCORE_COLOR_NORMAL)
-                    if p["final_curr_x"] > 0:
-                         f_mark_scaled = ImageFont.truetype(self.pick_font_path(self.main_path, prefer_japanese=True), int(60 * scale))
-                         for xi in range(p["final_curr_x"]):
-                            draw.text((xb+cw/2-25*scale+xi*50*scale-draw.textbbox((0,0),"×",font=f_mark_scaled)[2]/2, sy+ch+100*scale), "×", font=f_mark_scaled, fill="white")
-
-            elif mode == "EXTRA":
-                draw_center_scaled(str(p["extra_score"]), self.header_path, 80, SCORE_COLOR_NORMAL)
+                    for xi in range(view["marks"]):
+                        draw.text((xb+cw/2-25*scale+xi*50*scale-mark_w/2, sy+ch+100*scale), "×", font=f_mark_scaled, fill="white")
+
+    # 修正: コロン間隔調整 (文字数ごとの位置。1/10秒表示 MM:SS.t は詰めて一回り小さく描く)
+    TIMER_OFFSETS = {5: [-1.75, -0.8, 0, 0.8, 1.75], 7: [-2.35, -1.4, -0.6, 0.2, 1.15, 1.75, 2.35]}
+    TIMER_ARGS = ("timer_str", "timer_alert", "timer_blink_on")
+
+    def draw_fixed_pitch_timer(self, draw, cx, cy, text, font, color, pitch):
+        offsets = self.TIMER_OFFSETS.get(len(text), self.TIMER_OFFSETS[5])
+        if len(text) > 5:
+            font = self.scaled_font(font, TIMER_TENTHS_SCALE)
+            pitch *= TIMER_TENTHS_SCALE
+        for i, char in enumerate(text):
+            if i < len(offsets):
+                draw.text((cx + offsets[i] * pitch, cy), char, font=font, fill=color, anchor="mm")
+
+    def scaled_font(self, font, scale):
+        key = (self.font_key(font), scale)
+        scaled = self.font_variants.get(key)
+        if scaled is None:
+            variant = getattr(font, "font_variant", None)
+            scaled = variant(size=int(font.size * scale)) if variant else font
+            self.font_variants[key] = scaled
+        return scaled
+
+    def draw_timer(self, draw, mode, timer_str, timer_alert, timer_blink_on, show_timer=True):
+        if not show_timer or (timer_alert and not timer_blink_on):
+            return
+        color = "red" if timer_alert else "#00FFFF"
+        if mode in MODE_COURSES:
+            self.draw_fixed_pitch_timer(draw, 1640, 550, timer_str, self.font_timer, color, 100)
+        elif mode == "SEMI":
+            self.draw_fixed_pitch_timer(draw, IMG_WIDTH // 2, 250, timer_str, self.font_semi_timer, color, 120)
+
+    def generate_image_layered(self, **kwargs):
+        """generate_image と同じ画像を返す。タイマー以外の引数が前回と同じなら、タイマー抜きで描いておいた画像に
+        タイマーだけを描き足す (1/10秒表示で毎秒10回描き直しても出場者や問題文は描き直さない)"""
+        players = kwargs.get("players", [])
+        if any(p.get("state_ver") is None for p in players):
+            return self.generate_image(**kwargs)
+        key = (
+            tuple((p["state_ver"], p["name"], p["univ"], p["rank"], p.get("rank_color"), p.get("photo_path")) for p in players),
+            tuple(sorted((k, v) for k, v in kwargs.items() if k != "players" and k not in self.TIMER_ARGS)),
+        )
+        base = self.timer_layer_cache.get(key)
+        if base is None:
+            while len(self.timer_layer_cache) >= 4:
+                self.timer_layer_cache.pop(next(iter(self.timer_layer_cache)))
+            base = self.timer_layer_cache[key] = self.generate_image(**dict(kwargs, show_timer=False))
+        im = base.copy()
+        # OBS用オーバーレイではタイマーの位置を透過帯で塗り戻すので描き足さない (generate_image と同じ結果)
+        if not kwargs.get("obs_overlay"):
+            self.draw_timer(ImageDraw.Draw(im), kwargs.get("mode", "2R"), kwargs.get("timer_str", "00:00"),
+                            kwargs.get("timer_alert", False), kwargs.get("timer_blink_on", True), kwargs.get("show_timer", True))
+        return im
 
     def _build_header_text(self, mode, group_idx, semi_set_idx, final_set_idx=1):
         if mode == "2R":
@@ -539,125 +1070,10 @@ class ScoreboardDrawer:
             return players[:12]
         return players[:5]
 
-    def _get_obs_score_text(self, p, mode, sf_hide_scores=False):
-        if mode == "2R":
-            if p.get("win_order", 0) > 0:
-                return get_ordinal_str(p["win_order"])
-            if p.get("wrong", 0) >= LOSE_WRONGS:
-                return "LOSE"
-            wrong_marks = "×" * p.get("wrong", 0)
-            return f"{p.get('score', 0)} {wrong_marks}".strip()
-        if mode == "10by10":
-            if p.get("win_order_10by10", 0) > 0:
-                return get_ordinal_str(p["win_order_10by10"])
-            if p.get("10by10_x", 10) <= 4:
-                return "LOSE"
-            score = p.get("10by10_o", 0) * p.get("10by10_x", 0)
-            return f"{score} ({p.get('10by10_o', 0)} × {p.get('10by10_x', 0)})"
-        if mode == "Swedish10":
-            if p.get("win_order_Swedish10", 0) > 0:
-                return get_ordinal_str(p["win_order_Swedish10"])
-            if p.get("Swedish10_x", 0) >= 10:
-                return "LOSE"
-            nxt = get_swedish10_wrong_increment(p.get("Swedish10_o", 0))
-            return f"{p.get('Swedish10_o', 0)} / {p.get('Swedish10_x', 0)}x (+{nxt})"
-        if mode == "Freeze10":
-            if p.get("win_order_Freeze10", 0) > 0:
-                return get_ordinal_str(p["win_order_Freeze10"])
-            if p.get("Freeze10_x", 0) >= 10:
-                return "LOSE"
-            if p.get("Freeze10_freeze", 0) > 0:
-                return f"Freeze {p.get('Freeze10_freeze', 0)}"
-            return f"{p.get('Freeze10_o', 0)} / {p.get('Freeze10_x', 0)}x"
-        if mode == "10up-down":
-            if p.get("win_order_10up-down", 0) > 0:
-                return get_ordinal_str(p["win_order_10up-down"])
-            if p.get("10up-down_wrong", 0) >= 2:
-                return "LOSE"
-            wrong_marks = "×" * p.get("10up-down_wrong", 0)
-            return f"{p.get('10up-down_score', 0)} {wrong_marks}".strip()
-        if mode == "SEMI":
-            if p.get("semi_status") == "win":
-                return "WIN"
-            if p.get("semi_status") == "lose":
-                return "LOSE"
-            if sf_hide_scores:
-                return "?"
-            return str(p.get("semi_score", 0))
-        if mode == "FINAL":
-            if p.get("win_order_final", 0) > 0:
-                return "☆Champion☆"
-            if p.get("final_set_lost", False):
-                return "LOSE"
-            wrong_marks = "×" * p.get("final_curr_x", 0)
-            return f"{p.get('final_curr_o', 0)} {wrong_marks}".strip()
-        if mode == "EXTRA":
-            if p.get("win_order_extra", 0) > 0:
-                return get_ordinal_str(p["win_order_extra"])
-            if p.get("extra_wrong", 0) > 0:
-                return "LOSE"
-            return str(p.get("extra_score", 0))
-        return "-"
-
-    def _get_obs_score_color(self, p, mode, sf_hide_scores=False):
-        if mode == "2R":
-            if p.get("win_order", 0) > 0:
-                return "red"
-            if p.get("wrong", 0) >= LOSE_WRONGS:
-                return "gray"
-            if p.get("rento", False):
-                return SCORE_COLOR_RENTO
-            return SCORE_COLOR_NORMAL
-        if mode == "10by10":
-            if p.get("win_order_10by10", 0) > 0:
-                return "red"
-            if p.get("10by10_x", 10) <= 4:
-                return "gray"
-            return SCORE_COLOR_NORMAL
-        if mode == "Swedish10":
-            if p.get("win_order_Swedish10", 0) > 0:
-                return "red"
-            if p.get("Swedish10_x", 0) >= 10:
-                return "gray"
-            return SCORE_COLOR_NORMAL
-        if mode == "Freeze10":
-            if p.get("win_order_Freeze10", 0) > 0:
-                return "red"
-            if p.get("Freeze10_x", 0) >= 10:
-                return "gray"
-            if p.get("Freeze10_freeze", 0) > 0:
-                return "cyan"
-            return SCORE_COLOR_NORMAL
-        if mode == "10up-down":
-            if p.get("win_order_10up-down", 0) > 0:
-                return "red"
-            if p.get("10up-down_wrong", 0) >= 2:
-                return "gray"
-            return SCORE_COLOR_NORMAL
-        if mode == "SEMI":
-            if p.get("semi_status") == "win":
-                return "red"
-            if p.get("semi_status") == "lose":
-                return "gray"
-            if sf_hide_scores:
-                return "white"
-            return SCORE_COLOR_NORMAL
-        if mode == "FINAL":
-            if p.get("win_order_final", 0) > 0:
-                return "red"
-            if p.get("final_set_lost", False):
-                return "gray"
-            return SCORE_COLOR_NORMAL
-        if mode == "EXTRA":
-            if p.get("win_order_extra", 0) > 0:
-                return "red"
-            if p.get("extra_wrong", 0) > 0:
-                return "gray"
-            return SCORE_COLOR_NORMAL
-        return SCORE_COLOR_NORMAL
-
-    def generate_image_obs_overlay(self, players, group_idx, question_text, answer_text, timer_str="00:00", timer_alert=False, mode="2R", semi_set_idx=1, final_set_idx=1, sf_hide_scores=False, question_index=None, show_timer=True, show_question_text=True, timer_blink_on=True):
-        im = Image.new("RGB", (IMG_WIDTH, IMG_HEIGHT), OBS_CHROMA_KEY_COLOR)
+    def generate_image_obs_overlay(self, players, group_idx, question_text, answer_text, timer_str="00:00", timer_alert=False, mode="2R", semi_set_idx=1, final_set_idx=1, sf_hide_scores=False, question_index=None, show_timer=True, show_question_text=True, timer_blink_on=True, transparent=False, buzz_idx=None):
+        # transparent の場合、透過部分はクロマキー色の代わりに α=0 にする (文字はすべて不透明な帯の上に描くので縁は出ない)
+        clear_color = (0, 0, 0, 0) if transparent else OBS_CHROMA_KEY_COLOR
+        im = Image.new("RGBA" if transparent else "RGB", (IMG_WIDTH, IMG_HEIGHT), clear_color)
         draw = ImageDraw.Draw(im)
 
         header_text = self._build_header_text(mode, group_idx, semi_set_idx, final_set_idx=final_set_idx)
@@ -676,17 +1092,7 @@ class ScoreboardDrawer:
         header_w = draw.textbbox((0, 0), header_text, font=self.font_header_sub)[2]
         draw.text((IMG_WIDTH - header_w - 50, header_text_y), header_text, font=self.font_header_sub, fill="white")
 
-        def draw_fixed_pitch_timer(cx, cy, text, font, color, pitch):
-            offsets = [-1.75, -0.8, 0, 0.8, 1.75]
-            for i, char in enumerate(text):
-                if i < len(offsets):
-                    char_x = cx + offsets[i] * pitch
-                    draw.text((char_x, cy), char, font=font, fill=color, anchor="mm")
-
-        if show_timer and mode in ["10by10", "Swedish10", "Freeze10", "10up-down"] and (not timer_alert or timer_blink_on):
-            draw_fixed_pitch_timer(1640, 550, timer_str, self.font_timer, "red" if timer_alert else "#00FFFF", 100)
-        elif show_timer and mode == "SEMI" and (not timer_alert or timer_blink_on):
-            draw_fixed_pitch_timer(IMG_WIDTH // 2, 250, timer_str, self.font_semi_timer, "red" if timer_alert else "#00FFFF", 120)
+        self.draw_timer(draw, mode, timer_str, timer_alert, timer_blink_on, show_timer)
 
         show_qa = (mode != "SEMI" and mode != "SF_FOLLOW" and show_question_text)
         qa_bottom = top_h1
@@ -698,22 +1104,8 @@ class ScoreboardDrawer:
             qa_max_w = IMG_WIDTH - (qa_margin_x * 2)
             line_h = (self.font_msg.size if hasattr(self.font_msg, "size") else 45) + 10
 
-            def wrapped_line_count(text, font, max_width):
-                lines = 0
-                current = ""
-                for ch in list(text):
-                    test = current + ch
-                    if draw.textbbox((0, 0), test, font=font)[2] <= max_width:
-                        current = test
-                    else:
-                        lines += 1
-                        current = ch
-                if current:
-                    lines += 1
-                return max(1, lines)
-
-            q_lines = wrapped_line_count(q_text, self.font_msg, qa_max_w)
-            a_lines = wrapped_line_count(a_text, self.font_msg, qa_max_w)
+            q_lines = len(self.wrap_text_lines(draw, q_text, self.font_msg, qa_max_w))
+            a_lines = len(self.wrap_text_lines(draw, a_text, self.font_msg, qa_max_w))
             qa_h = (q_lines + a_lines) * line_h + 12
             qa_bottom = qa_top + qa_h
 
@@ -723,7 +1115,7 @@ class ScoreboardDrawer:
 
         # 問題表示と出場者表示の間は常にクロマキー色で塗り戻し、透過帯を保証する
         if qa_bottom < bottom_top:
-            draw.rectangle((0, qa_bottom, IMG_WIDTH, bottom_top), fill=OBS_CHROMA_KEY_COLOR)
+            draw.rectangle((0, qa_bottom, IMG_WIDTH, bottom_top), fill=clear_color)
 
         display_players = self._get_display_players(players, mode)
         filtered_players_for_drawing = []
@@ -763,13 +1155,16 @@ class ScoreboardDrawer:
             self.draw_text_fit(draw, p.get("rank", "---"), int((x1 + x2) / 2), bottom_top + 32, int(col_w - 8), self.rank_path or self.main_path, 32, "white", 1, "black", align="center")
             self.draw_text_fit(draw, p.get("name", "---"), int((x1 + x2) / 2), bottom_top + 98, int(col_w - 8), self.main_path, 40, "white", 2, "black", align="center")
             self.draw_text_fit(draw, p.get("univ", "---"), int((x1 + x2) / 2), bottom_top + 134, int(col_w - 8), self.main_path, 24, "#efefef", 1, "black", align="center")
-            score_txt = self._get_obs_score_text(p, mode, sf_hide_scores=sf_hide_scores)
-            score_color = self._get_obs_score_color(p, mode, sf_hide_scores=sf_hide_scores)
+            view = self.get_player_view(p, mode, sf_hide_scores)
+            score_txt = view["score_text"]
+            score_color = view["score_color"]
             self.draw_text_fit(draw, score_txt, int((x1 + x2) / 2), bottom_top + 178, int(col_w - 8), self.header_path or self.rank_path, 36, score_color, 2, "black", align="center")
+            if i == buzz_idx:
+                draw.rectangle((x1, bottom_top, x2, IMG_HEIGHT - 4), outline=BUZZER_HIGHLIGHT_COLOR, width=5)
 
         return im
 
-    def generate_image(self, players, group_idx, question_text, answer_text, timer_str="00:00", timer_alert=False, mode="2R", semi_set_idx=1, final_set_idx=1, sf_hide_scores=False, obs_overlay=False, question_index=None, show_timer=True, show_question_text=True, timer_blink_on=True, bg_color=None):
+    def generate_image(self, players, group_idx, question_text, answer_text, timer_str="00:00", timer_alert=False, mode="2R", semi_set_idx=1, final_set_idx=1, sf_hide_scores=False, obs_overlay=False, question_index=None, show_timer=True, show_question_text=True, timer_blink_on=True, bg_color=None, obs_transparent=False, buzz_idx=None):
         if obs_overlay and mode != "SF_FOLLOW":
             return self.generate_image_obs_overlay(
                 players,
@@ -786,6 +1181,8 @@ class ScoreboardDrawer:
                 show_timer=show_timer,
                 show_question_text=show_question_text,
                 timer_blink_on=timer_blink_on,
+                transparent=obs_transparent,
+                buzz_idx=buzz_idx,
             )
 
         base_bg = bg_color if bg_color is not None else BG_COLOR
@@ -798,20 +1195,7 @@ class ScoreboardDrawer:
         header = self._build_header_text(mode, group_idx, semi_set_idx, final_set_idx=final_set_idx)
         draw.text((IMG_WIDTH - draw.textbbox((0, 0), header, font=self.font_header_sub)[2] - 50, 40), header, font=self.font_header_sub, fill="white")
         
-        # 修正: コロン間隔調整
-        def draw_fixed_pitch_timer(cx, cy, text, font, color, pitch):
-            offsets = [-1.75, -0.8, 0, 0.8, 1.75]
-            for i, char in enumerate(text):
-                if i < len(offsets):
-                    char_x = cx + offsets[i] * pitch
-                    draw.text((char_x, cy), char, font=font, fill=color, anchor="mm")
-
-        if show_timer and mode in ["10by10", "Swedish10", "Freeze10", "10up-down"] and (not timer_alert or timer_blink_on):
-            center_x, center_y = 1640, 550
-            draw_fixed_pitch_timer(center_x, center_y, timer_str, self.font_timer, "red" if timer_alert else "#00FFFF", 100)
-        elif show_timer and mode == "SEMI" and (not timer_alert or timer_blink_on):
-            center_x, center_y = IMG_WIDTH // 2 , 250
-            draw_fixed_pitch_timer(center_x, center_y, timer_str, self.font_semi_timer, "red" if timer_alert else "#00FFFF", 120)
+        self.draw_timer(draw, mode, timer_str, timer_alert, timer_blink_on, show_timer)
 
         if mode != "SEMI" and mode != "SF_FOLLOW" and show_question_text:
             last_y = self.draw_wrapped_text(draw, f"Q. {question_text}", 50, 140, self.font_msg, "white", IMG_WIDTH - 100)
@@ -865,13 +1249,12 @@ class ScoreboardDrawer:
             if p is None: continue 
             px, py = mx+i*(cw+gap), sy
             self.draw_player_plate(im, draw, p, px, py, cw, ch, current_scale, is_3rd=False, mode=mode)
+            if i == buzz_idx:
+                # 早押しの 1着
+                draw.rectangle((px - 8, py - 8, px + cw + 8, py + ch + 8), outline=BUZZER_HIGHLIGHT_COLOR, width=6)
             
             if mode == "SEMI" and p.get("semi_status") == "active":
-                if sf_hide_scores:
-                    score_text = "?"
-                else:
-                    score_val = p.get("semi_score", 0)
-                    score_text = str(score_val)
+                score_text = self.get_player_view(p, mode, sf_hide_scores)["main_text"]
                 s_bbox = draw.textbbox((0,0), score_text, font=self.font_semi_score)
                 sw, sh = s_bbox[2]-s_bbox[0], s_bbox[3]-s_bbox[1]
                 draw.text((px + cw//2 - sw//2, py + ch + 30), score_text, font=self.font_semi_score, fill="yellow")
@@ -939,21 +1322,2323 @@ class ScoreboardDrawer:
         color = "red" if timer_alert else "#00FFFF"
         font_path = self.pick_font_path(self.header_path, prefer_japanese=False)
 
-        font = ImageFont.load_default()
-        for size in range(620, 79, -8):
-            try:
-                test_font = ImageFont.truetype(font_path, size)
-            except Exception:
-                test_font = ImageFont.load_default()
-            bbox = draw.textbbox((0, 0), timer_str, font=test_font)
-            if (bbox[2] - bbox[0]) <= (IMG_WIDTH - 80):
-                font = test_font
-                break
+        # 大きさは数字を 0 に置き換えた形ごとに 1度だけ決める (1/10秒表示で毎回探さない)
+        pattern = re.sub(r"\d", "0", timer_str)
+        font = self.timer_only_fonts.get(pattern)
+        if font is None:
+            font = ImageFont.load_default()
+            for size in range(620, 79, -8):
+                try:
+                    test_font = ImageFont.truetype(font_path, size)
+                except Exception:
+                    test_font = ImageFont.load_default()
+                bbox = draw.textbbox((0, 0), pattern, font=test_font)
+                if (bbox[2] - bbox[0]) <= (IMG_WIDTH - 80):
+                    font = test_font
+                    break
+            self.timer_only_fonts[pattern] = font
 
         if not timer_alert or timer_blink_on:
             draw.text((IMG_WIDTH // 2, IMG_HEIGHT // 2), timer_str, font=font, fill=color, anchor="mm")
         return im
 
+# ==========================================
+# 進出者管理 (2R → 3rd → SEMI → FINAL)
+# ==========================================
+class QualifierPipeline:
+    """各ラウンドの勝ち抜け順の変化をイベントとして受け取り、次ラウンドの進出者リストを差分更新する。
+    並び順は従来の全走査と同じ (勝ち抜け順, ランク番号) で保持する"""
+    def __init__(self):
+        self.group_keys = {}            # 組 -> その組が寄与している (勝ち抜け順, rank_num)
+        self.winners_2r = []            # (勝ち抜け順, rank_num) の昇順
+        self.players_2r = {}            # (勝ち抜け順, rank_num) -> player
+        self.course_fields = [ROUND_FORMATS[c].win_key for c in MODE_COURSES]
+        self.course_winners = {f: [] for f in self.course_fields}
+        self.course_players = {f: {} for f in self.course_fields}
+        self.course_keys = {f: {} for f in self.course_fields}   # rank_num -> 登録済みキー
+        self._semi_winners = None
+        self.extra_winner = None
+        self.final_slots = [None, None, None]
+
+    def update_group(self, g_idx, group_players):
+        for key in self.group_keys.get(g_idx, []):
+            self.winners_2r.pop(bisect.bisect_left(self.winners_2r, key))
+            del self.players_2r[key]
+        keys = []
+        for p in group_players:
+            if 1 <= p["win_order"] <= 12:
+                key = (p["win_order"], p["rank_num"])
+                bisect.insort(self.winners_2r, key)
+                self.players_2r[key] = p
+                keys.append(key)
+        self.group_keys[g_idx] = keys
+
+    def third_round_roster(self):
+        selected = [self.players_2r[key] for key in self.winners_2r[:20]]
+        while len(selected) < 20: selected.append(get_empty_player(99))
+        return selected
+
+    def update_course_players(self, players):
+        for p in players:
+            r = p.get("rank_num", 99)
+            if r == 99:
+                continue
+            for f in self.course_fields:
+                old = self.course_keys[f].get(r)
+                new = (p[f], r) if p.get(f, 0) > 0 else None
+                if old == new and (new is None or self.course_players[f][new] is p):
+                    continue
+                if old is not None:
+                    self.course_winners[f].pop(bisect.bisect_left(self.course_winners[f], old))
+                    del self.course_players[f][old]
+                    del self.course_keys[f][r]
+                if new is not None:
+                    bisect.insort(self.course_winners[f], new)
+                    self.course_players[f][new] = p
+                    self.course_keys[f][r] = new
+                self._semi_winners = None
+
+    def rebuild_courses(self, players_3rd):
+        for f in self.course_fields:
+            self.course_winners[f] = []
+            self.course_players[f] = {}
+            self.course_keys[f] = {}
+        self._semi_winners = None
+        self.update_course_players(players_3rd)
+
+    def semi_winners(self):
+        if self._semi_winners is None:
+            winners = []
+            seen_rank = set()
+            for f in self.course_fields:
+                for key in self.course_winners[f]:
+                    if key[1] in seen_rank:
+                        continue
+                    seen_rank.add(key[1])
+                    winners.append(self.course_players[f][key])
+            self._semi_winners = winners
+        return self._semi_winners
+
+    def update_extra(self, players_extra):
+        best, best_key = None, None
+        for p in players_extra:
+            if p.get("win_order_extra", 0) > 0 and p.get("rank_num", 99) != 99:
+                key = (p["win_order_extra"], p["rank_num"])
+                if best_key is None or key < best_key:
+                    best, best_key = p, key
+        self.extra_winner = best
+
+    def update_semi(self, players_semi):
+        slots = [None, None, None]
+        for p in players_semi:
+            if p["semi_status"] == "win":
+                s_idx = p.get("semi_exit_set", 0)
+                if 1 <= s_idx <= 3:
+                    slots[s_idx - 1] = p
+        self.final_slots = slots
+
+    def final_roster(self):
+        return [p if p is not None else get_empty_player(99) for p in self.final_slots]
+
+# ==========================================
+# 参加者インデックス (rank_num / 氏名・大学の前方一致 / 現在の出場枠)
+# ==========================================
+def normalize_search_key(text):
+    return re.sub(r"[ 　]+", "", str(text or "")).casefold()
+
+class PrefixTrie:
+    """前方一致検索用のトライ木。各ノードに配下の値を持たせ、検索は接頭辞の長さだけで済ませる"""
+    def __init__(self):
+        self.root = {"children": {}, "values": []}
+
+    def insert(self, key, value):
+        node = self.root
+        for ch in key:
+            node = node["children"].setdefault(ch, {"children": {}, "values": []})
+            node["values"].append(value)
+
+    def remove(self, key, value):
+        node = self.root
+        for ch in key:
+            node = node["children"].get(ch)
+            if node is None:
+                return
+            if value in node["values"]:
+                node["values"].remove(value)
+
+    def search(self, prefix):
+        node = self.root
+        for ch in prefix:
+            node = node["children"].get(ch)
+            if node is None:
+                return []
+        return node["values"]
+
+class TournamentIndex:
+    """48名の参加者を rank_num・氏名/大学の前方一致・現在の出場ラウンド/枠 で引けるように保持する"""
+    def __init__(self):
+        self.by_rank = {}
+        self.registered = set()
+        self.trie = PrefixTrie()
+        self.search_keys = {}      # rank_num -> トライに登録したキー
+        self.locations = {}        # rank_num -> {ラウンド名: 枠番号}
+
+    def update_player(self, p):
+        r = p.get("rank_num", 99)
+        if r == 99:
+            return
+        self.by_rank[r] = p
+        for key in self.search_keys.pop(r, []):
+            self.trie.remove(key, r)
+        self.registered.discard(r)
+        if p.get("name", "---") != "---":
+            self.registered.add(r)
+            keys = {normalize_search_key(p["name"]), normalize_search_key(p.get("univ", ""))} - {""}
+            for key in keys:
+                self.trie.insert(key, r)
+            self.search_keys[r] = keys
+
+    def update_group(self, g_idx, group_players):
+        for slot, p in enumerate(group_players):
+            self.update_player(p)
+            self.locations.setdefault(p.get("rank_num", 99), {})["2R"] = (g_idx, slot)
+
+    def set_round(self, round_name, players):
+        for locs in self.locations.values():
+            locs.pop(round_name, None)
+        for slot, p in enumerate(players):
+            r = p.get("rank_num", 99)
+            if r != 99:
+                self.locations.setdefault(r, {})[round_name] = slot
+
+    def get_registered(self, rank_num):
+        return self.by_rank.get(rank_num) if rank_num in self.registered else None
+
+    def has_registered(self):
+        return bool(self.registered)
+
+    def search(self, text, limit=20):
+        """数字なら rank_num 完全一致、それ以外は氏名/大学の前方一致で rank_num を返す"""
+        txt = str(text or "").strip().translate(str.maketrans("０１２３４５６７８９", "0123456789"))
+        if not txt:
+            return []
+        if txt.isdigit():
+            return [int(txt)] if int(txt) in self.registered else []
+        ranks = sorted(set(self.trie.search(normalize_search_key(txt))))
+        return ranks[:limit]
+
+    def describe(self, rank_num):
+        p = self.by_rank.get(rank_num)
+        if p is None:
+            return ""
+        locs = self.locations.get(rank_num, {})
+        where = " / ".join(f"{k}:{v + 1 if isinstance(v, int) else f'{v[0] + 1}組{v[1] + 1}'}" for k, v in locs.items())
+        return f"{rank_num}: {p['name']} ({p.get('univ', '')}) {where}".strip()
+
+_KATAKANA_TO_HIRAGANA = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}
+
+def normalize_question_text(text):
+    """問題検索用の正規化: 全角/半角を揃え (NFKC)、カタカナをひらがなに寄せ、空白を除いて小文字化する"""
+    return normalize_search_key(unicodedata.normalize("NFKC", str(text or "")).translate(_KATAKANA_TO_HIRAGANA))
+
+class QuestionSearchIndex:
+    """問題文・解答の2文字組 (bi-gram) の転置索引。
+    2文字組ごとに問題番号 (0始まり) の昇順配列を持ち、検索は一番短い配列の候補を他の配列で二分探索して絞り込む。
+    add() は番号順に呼ぶこと (別スレッドで作りながら、作成済みの範囲だけで検索してよい)"""
+    def __init__(self, total=0):
+        self.postings = {}
+        self.count = 0
+        self.total = total
+
+    @staticmethod
+    def _grams(key):
+        return {key[i:i + 2] for i in range(len(key) - 1)}
+
+    def add(self, idx, q, a):
+        grams = self._grams(normalize_question_text(q)) | self._grams(normalize_question_text(a))
+        postings = self.postings
+        for g in grams:
+            p = postings.get(g)
+            if p is None:
+                postings[g] = array("I", [idx])
+            else:
+                p.append(idx)
+        self.count = idx + 1
+
+    @property
+    def ready(self):
+        return self.count >= self.total
+
+    def search(self, text, questions, limit=50):
+        """キーワードを含む問題の番号 (0始まり) を返す。1文字の検索語は候補が多すぎるので扱わない"""
+        key = normalize_question_text(text)
+        if len(key) < 2:
+            return []
+        lists = []
+        for g in self._grams(key):
+            p = self.postings.get(g)
+            if p is None:
+                return []
+            lists.append(p)
+        lists.sort(key=len)
+        first, rest = lists[0], lists[1:]
+        lows = [0] * len(rest)
+        results = []
+        for idx in first:
+            ok = True
+            for k, p in enumerate(rest):
+                j = bisect.bisect_left(p, idx, lows[k])
+                lows[k] = j
+                if j >= len(p) or p[j] != idx:
+                    ok = False
+                    break
+            if not ok:
+                continue
+            # 2文字組がすべて含まれていても並びが違う場合があるので、本文で確かめる
+            qa = questions[idx]
+            if len(key) == 2 or key in normalize_question_text(qa["q"]) or key in normalize_question_text(qa["a"]):
+                results.append(idx)
+                if len(results) >= limit:
+                    break
+        return results
+
+# ==========================================
+# ファイル読込
+# ==========================================
+class _MmapDigest:
+    """メモリマップを読み進めた範囲を順にハッシュへ足していく (読み直した範囲は足さない)。
+    解析と同じ1回の読み進めで、キャッシュの照合に使う元ファイルのハッシュを得る"""
+    def __init__(self):
+        self.h = hashlib.sha1()
+        self.pos = 0
+
+    def feed(self, mm, upto):
+        while self.pos < upto:
+            end = min(upto, self.pos + FILE_READ_CHUNK_BYTES)
+            self.h.update(mm[self.pos:end])
+            self.pos = end
+
+    def digest(self):
+        return self.h.digest()
+
+class _MmapRawReader(io.RawIOBase):
+    """メモリマップ済みファイルをコピーせずにストリームとして読むためのアダプタ。digest を渡すと読んだ範囲をハッシュに足す"""
+    def __init__(self, mm, start=0, digest=None):
+        self.mm = mm
+        self.pos = start
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: len(self.mm)}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, b):
+        n = min(len(b), len(self.mm) - self.pos)
+        if n <= 0:
+            return 0
+        b[:n] = self.mm[self.pos:self.pos + n]
+        self.pos += n
+        if self.digest is not None:
+            self.digest.feed(self.mm, self.pos)
+        return n
+
+class LoadCancelled(Exception):
+    """ファイル読込が操作者によって中止された"""
+
+class FileLoadJob:
+    """ワーカースレッドでファイルを解析するジョブ。進捗はTk側が定期的に読みに来る"""
+    def __init__(self, fp, parse):
+        self.fp = fp
+        self.parse = parse
+        self.rows = 0
+        self.bytes_read = 0
+        try:
+            self.total_bytes = os.path.getsize(fp)
+        except OSError:
+            self.total_bytes = 0
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="file-load", daemon=True).start()
+
+    def _run(self):
+        try:
+            self.result = self.parse(self)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def tick(self, bytes_read=None):
+        """1行読むごとにリーダーから呼ばれる。中止要求があればここで打ち切る"""
+        self.rows += 1
+        if bytes_read is not None:
+            self.bytes_read = bytes_read
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+
+def _align8(pos):
+    return (pos + 7) & ~7
+
+class TableStore:
+    """行ごとのセル数・セル境界のバイト位置・全セルを連結したUTF-8本文、からなる読み取り専用の表。
+    メモリマップしたキャッシュファイルをそのまま参照し、セルは読まれたときに初めて文字列にする"""
+    def __init__(self, buf, n_rows, cols, pos=0):
+        self.buf = buf
+        self.n_rows = n_rows
+        self.cols = cols
+        mv = memoryview(buf)
+        self.counts = mv[pos:pos + 2 * n_rows].cast("H")
+        pos = _align8(pos + 2 * n_rows)
+        n_off = n_rows * cols + 1
+        self.offsets = mv[pos:pos + 8 * n_off].cast("Q")
+        pos += 8 * n_off
+        self.blob = mv[pos:pos + self.offsets[-1]]
+
+    @staticmethod
+    def encode(rows, cols, out):
+        """rows を1行ずつ読みながら out (書込用のバイナリファイル) へ書き出し、行数を返す。
+        手元に残すのは行ごとのセル数とセル境界だけで、本文は一時ファイルへ逃がしておき最後に続けて書く"""
+        counts = array("H")
+        offsets = array("Q", [0])
+        parts = []
+        pending = 0
+        end = 0
+        with tempfile.SpooledTemporaryFile(max_size=FILE_READ_CHUNK_BYTES) as blob:
+            for row in rows:
+                row = row[:cols]
+                counts.append(len(row))
+                for c in range(cols):
+                    if c < len(row):
+                        b = row[c].encode("utf-8")
+                        parts.append(b)
+                        pending += len(b)
+                        end += len(b)
+                    offsets.append(end)
+                if pending >= FILE_READ_CHUNK_BYTES:
+                    blob.write(b"".join(parts))
+                    parts.clear()
+                    pending = 0
+            blob.write(b"".join(parts))
+            head = counts.tobytes()
+            out.write(head)
+            out.write(bytes(_align8(len(head)) - len(head)))
+            out.write(offsets.tobytes())
+            blob.seek(0)
+            shutil.copyfileobj(blob, out, FILE_READ_CHUNK_BYTES)
+        return len(counts)
+
+    @classmethod
+    def from_rows(cls, rows, cols):
+        buf = io.BytesIO()
+        n_rows = cls.encode(rows, cols, buf)
+        return cls(buf.getvalue(), n_rows, cols)
+
+    def __len__(self):
+        return self.n_rows
+
+    def cell(self, r, c):
+        k = r * self.cols + c
+        return str(self.blob[self.offsets[k]:self.offsets[k + 1]], "utf-8")
+
+    def row(self, r):
+        return [self.cell(r, c) for c in range(self.counts[r])]
+
+    def __iter__(self):
+        for r in range(self.n_rows):
+            yield self.row(r)
+
+class QuestionStore:
+    """問題集。TableStore の行番号の並びとして持ち、必要になった問題だけ {"q", "a"} にして返す。
+    スライスや deck() で作る部分集合 (SFフォローのページやラウンド用の問題セット) は同じ表を参照するだけなので軽い"""
+    def __init__(self, table, rows=None):
+        self.table = table
+        if rows is None:
+            rows = array("I", (i for i, n in enumerate(table.counts) if n >= 2))
+        self.rows = rows
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        return cls(TableStore.from_rows([[q, a] for q, a in pairs], 2))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return QuestionStore(self.table, self.rows[i])
+        r = self.rows[i]
+        return {"q": self.table.cell(r, 0), "a": self.table.cell(r, 1)}
+
+    def __iter__(self):
+        for r in self.rows:
+            yield {"q": self.table.cell(r, 0), "a": self.table.cell(r, 1)}
+
+    def pairs(self):
+        cell = self.table.cell
+        for r in self.rows:
+            yield (cell(r, 0), cell(r, 1))
+
+    def deck(self, indices):
+        """0始まりの問題番号の並びから、その順に並んだ部分集合を作る"""
+        return QuestionStore(self.table, array("I", (self.rows[i] for i in indices)))
+
+def diff_question_stores(old, new):
+    """問題集 2つを行単位で比べ、(SequenceMatcher 形式の opcodes, 折り返し結果を捨てるべき文字列) を返す。
+    内容が同じなら opcodes は None。全件を文字列にするので、ファイル監視のワーカースレッドで呼ぶ"""
+    old_keys = list(old.pairs())
+    new_keys = list(new.pairs())
+    if old_keys == new_keys:
+        return None, set()
+    # 誤字修正のような小さな変更では前後の一致部分が大半なので、そこを除いてから差分を取る
+    head = 0
+    limit = min(len(old_keys), len(new_keys))
+    while head < limit and old_keys[head] == new_keys[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_keys[-1 - tail] == new_keys[-1 - tail]:
+        tail += 1
+    matcher = difflib.SequenceMatcher(
+        None, old_keys[head:len(old_keys) - tail], new_keys[head:len(new_keys) - tail], autojunk=False)
+    opcodes = []
+    if head:
+        opcodes.append(("equal", 0, head, 0, head))
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        opcodes.append((tag, i1 + head, i2 + head, j1 + head, j2 + head))
+    if tail:
+        opcodes.append(("equal", len(old_keys) - tail, len(old_keys), len(new_keys) - tail, len(new_keys)))
+
+    stale_texts = set()
+    fresh_texts = set()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        for q, a in old_keys[i1:i2]:
+            stale_texts.update((q, f"Q. {q}", f"A. {a}"))
+        for q, a in new_keys[j1:j2]:
+            fresh_texts.update((q, f"Q. {q}", f"A. {a}"))
+    return opcodes, stale_texts - fresh_texts
+
+class QuestionBankCache:
+    """読み込んだ行を元ファイルの隣にバイナリで保存しておくサイドカーキャッシュ。
+    パス・サイズ・更新時刻が一致すればそのまま使い、更新時刻だけ違う場合は内容のハッシュで確かめる。
+    行のキャッシュはメモリマップしたまま TableStore として使うため、使用中に書き換える必要のない
+    折り返し結果は別ファイル (QUESTION_LAYOUT_SUFFIX) に分けている"""
+    MAGIC = b"RQBC"
+    LAYOUT_MAGIC = b"RQBL"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHQQ20sHII")
+    LAYOUT_HEADER = struct.Struct("<4sH20sI")
+
+    def __init__(self, suffix=QUESTION_CACHE_SUFFIX, layout_suffix=QUESTION_LAYOUT_SUFFIX):
+        self.suffix = suffix
+        self.layout_suffix = layout_suffix
+
+    def sidecar_path(self, fp):
+        return fp + self.suffix
+
+    def layout_path(self, fp):
+        return fp + self.layout_suffix
+
+    def file_digest(self, fp):
+        h = hashlib.sha1()
+        with open(fp, "rb") as f:
+            for chunk in iter(lambda: f.read(FILE_READ_CHUNK_BYTES), b""):
+                h.update(chunk)
+        return h.digest()
+
+    def is_current(self, fp, stamp):
+        try:
+            st = os.stat(fp)
+        except OSError:
+            return False
+        return stamp is not None and (st.st_size, st.st_mtime_ns) == stamp[:2]
+
+    @staticmethod
+    def _put_str(out, text):
+        b = text.encode("utf-8")
+        out.append(struct.pack("<I", len(b)))
+        out.append(b)
+
+    @staticmethod
+    def _get_str(buf, pos):
+        (n,) = struct.unpack_from("<I", buf, pos)
+        pos += 4
+        return str(buf[pos:pos + n], "utf-8"), pos + n
+
+    def load(self, fp, max_cols):
+        """有効なキャッシュがあれば (メモリマップした TableStore, スタンプ) を返し、無い・古い場合は None"""
+        if sys.byteorder != "little":
+            return None
+        cp = self.sidecar_path(fp)
+        try:
+            st = os.stat(fp)
+            with open(cp, "rb") as f:
+                head = f.read(self.HEADER.size)
+                magic, ver, size, mtime_ns, digest, cols, path_len, n_rows = self.HEADER.unpack(head)
+                if magic != self.MAGIC or ver != self.VERSION or cols != max_cols or size != st.st_size:
+                    return None
+                if str(f.read(path_len), "utf-8") != os.path.abspath(fp):
+                    return None
+            if mtime_ns != st.st_mtime_ns:
+                if self.file_digest(fp) != digest:
+                    return None
+                # 内容は同じで更新時刻だけ変わった: 次回は速い経路で当たるように時刻を書き直す
+                try:
+                    with open(cp, "r+b") as f:
+                        f.seek(self.HEADER.size - struct.calcsize("<Q20sHII"))
+                        f.write(struct.pack("<Q", st.st_mtime_ns))
+                except OSError:
+                    pass
+            with open(cp, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            table = TableStore(mm, n_rows, cols, _align8(self.HEADER.size + path_len))
+            return table, (size, st.st_mtime_ns, digest)
+        except (OSError, struct.error, UnicodeDecodeError, ValueError, IndexError, TypeError):
+            return None
+
+    def save(self, fp, max_cols, rows, st=None, digest=None):
+        """rows を1行ずつ読みながら書き出し、(書き出したファイルをメモリマップした TableStore, スタンプ) を返す。
+        st は解析前に取った os.stat (解析中の書き換えを取り違えないため)。digest は rows を読み進めながら元ファイルの
+        ハッシュを取る _MmapDigest で、読み終えた時点で値が決まる (無ければ書き出した後にファイルから求める)。
+        書き込めない場所や、使用中で置き換えられない場合はメモリ上の表を返す"""
+        if st is None:
+            st = os.stat(fp)
+        path_b = os.path.abspath(fp).encode("utf-8")
+        pos = _align8(self.HEADER.size + len(path_b))
+
+        def header(n_rows, file_digest):
+            head = self.HEADER.pack(self.MAGIC, self.VERSION, st.st_size, st.st_mtime_ns, file_digest, max_cols,
+                                    len(path_b), n_rows) + path_b
+            return head + bytes(pos - len(head))
+
+        def finish_digest():
+            return digest.digest() if digest is not None else self.file_digest(fp)
+
+        cp = self.sidecar_path(fp)
+        tmp = cp + ".tmp"
+        f = None
+        if sys.byteorder == "little":
+            try:
+                f = open(tmp, "w+b")
+            except OSError:
+                f = None
+        if f is None:
+            buf = io.BytesIO()
+            buf.write(bytes(pos))
+            n_rows = TableStore.encode(rows, max_cols, buf)
+            stamp = (st.st_size, st.st_mtime_ns, finish_digest())
+            buf.seek(0)
+            buf.write(header(n_rows, stamp[2]))
+            return TableStore(buf.getvalue(), n_rows, max_cols, pos), stamp
+        try:
+            with f:
+                f.write(bytes(pos))     # 行数とハッシュは読み終えてから書く
+                n_rows = TableStore.encode(rows, max_cols, f)
+                stamp = (st.st_size, st.st_mtime_ns, finish_digest())
+                f.seek(0)
+                f.write(header(n_rows, stamp[2]))
+            try:
+                os.replace(tmp, cp)
+            except OSError:
+                # 前のキャッシュを使用中で置き換えられない: 書き出した内容をメモリに読んで使う
+                with open(tmp, "rb") as f:
+                    data = f.read()
+                os.remove(tmp)
+                return TableStore(data, n_rows, max_cols, pos), stamp
+            with open(cp, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return TableStore(mm, n_rows, max_cols, pos), stamp
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def load_layouts(self, fp, stamp):
+        """同じ内容のファイルに対して保存された折り返し結果を返す。無ければ空の辞書"""
+        layouts = {}
+        if stamp is None or stamp[2] is None:
+            return layouts
+        try:
+            with open(self.layout_path(fp), "rb") as f:
+                buf = f.read()
+            magic, ver, digest, n_layouts = self.LAYOUT_HEADER.unpack_from(buf, 0)
+            if magic != self.LAYOUT_MAGIC or ver != self.VERSION or digest != stamp[2]:
+                return layouts
+            pos = self.LAYOUT_HEADER.size
+            for _ in range(n_layouts):
+                text, pos = self._get_str(buf, pos)
+                font_path, pos = self._get_str(buf, pos)
+                font_size, width, n_lines = struct.unpack_from("<HIH", buf, pos)
+                pos += 8
+                lines = []
+                for _ in range(n_lines):
+                    line, pos = self._get_str(buf, pos)
+                    lines.append(line)
+                layouts[(text, (font_path, font_size), width)] = tuple(lines)
+        except (OSError, struct.error, UnicodeDecodeError):
+            return {}
+        return layouts
+
+    def save_layouts(self, fp, stamp, layouts):
+        """折り返し結果を書き出す。書き込めない場所でも表示は続けられるよう失敗は無視する"""
+        if stamp is None or stamp[2] is None:
+            return False
+        out = [self.LAYOUT_HEADER.pack(self.LAYOUT_MAGIC, self.VERSION, stamp[2], len(layouts))]
+        try:
+            for (text, (font_path, font_size), width), lines in layouts.items():
+                self._put_str(out, text)
+                self._put_str(out, font_path)
+                out.append(struct.pack("<HIH", font_size, width, len(lines)))
+                for line in lines:
+                    self._put_str(out, line)
+            cp = self.layout_path(fp)
+            tmp = cp + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(b"".join(out))
+            os.replace(tmp, cp)
+            return True
+        except (OSError, struct.error):
+            return False
+
+# ==========================================
+# フレーム配信
+# ==========================================
+FRAME_SERVER_INDEX_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>RUQabc</title>
+<style>html,body{margin:0;background:transparent;overflow:hidden}img{width:100vw;height:100vh;object-fit:contain}</style>
+</head><body><img id="f" src="/frame.png">
+<script>
+// 同じURLを読み直すとブラウザが If-None-Match を付けるので、変化のないフレームは 304 で済む
+const img = document.getElementById("f");
+function next() {
+  const pre = new Image();
+  pre.onload = () => { img.src = pre.src; setTimeout(next, 50); };
+  pre.onerror = () => setTimeout(next, 500);
+  pre.src = "/frame.png";
+}
+next();
+</script></body></html>
+"""
+
+class FrameServer:
+    """最新の合成フレームを localhost に HTTP で配信する。
+    /frame.png, /frame.jpg は ETag 付きのスナップショット、/stream.mjpg は MJPEG ストリーム、/ は PNG を読み直すだけのページ。
+    publish() は参照を差し替えて番号を進めるだけ。内容の比較とエンコードは要求を受けた配信スレッドで行い、
+    同じ内容 (画素のハッシュ) のエンコード結果は全クライアントで共有する"""
+    FORMATS = {
+        "png": "image/png",
+        "jpeg": "image/jpeg",
+        "bgra": "application/octet-stream",
+    }
+    PATHS = {"/frame.png": "png", "/frame.jpg": "jpeg", "/frame.bgra": "bgra"}
+
+    def __init__(self, host=FRAME_SERVER_HOST, port=FRAME_SERVER_PORT):
+        self.host = host
+        self.port = port
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.image = None
+        self.digest = None
+        self.digest_seq = 0
+        self.encoded = {}
+        self.httpd = None
+        self.running = False
+
+    def start(self):
+        frames = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path in ("/", "/index.html"):
+                    body = FRAME_SERVER_INDEX_HTML.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif path == "/stream.mjpg":
+                    frames._serve_mjpeg(self)
+                elif path in frames.PATHS:
+                    frames._serve_snapshot(self, frames.PATHS[path])
+                else:
+                    self.send_error(404)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.running = True
+        threading.Thread(target=self.httpd.serve_forever, name="frame-server", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def publish(self, im):
+        """新しいフレームを渡す。Tkスレッドから毎回呼ぶので参照を差し替えるだけにし、
+        前回と同じ内容かの比較 (画素のハッシュ) は要求を受けた配信スレッドで行う"""
+        with self.cond:
+            self.seq += 1
+            self.image = im
+            self.cond.notify_all()
+
+    def _digest(self, seq, im):
+        """番号 seq のフレームの内容ハッシュ。同じ番号では 1回だけ計算し、内容が変わったらエンコード結果を捨てる"""
+        with self.cond:
+            if self.digest_seq == seq:
+                return self.digest
+        h = hashlib.blake2b(f"{im.mode}:{im.size[0]}x{im.size[1]}:".encode("ascii"), digest_size=16)
+        h.update(im.tobytes())
+        digest = h.hexdigest()
+        with self.cond:
+            if seq > self.digest_seq:
+                if digest != self.digest:
+                    self.encoded = {}
+                self.digest, self.digest_seq = digest, seq
+        return digest
+
+    def _encode(self, im, fmt):
+        buf = io.BytesIO()
+        if fmt == "png":
+            im.save(buf, "PNG", compress_level=1)
+        elif fmt == "bgra":
+            return im.convert("RGBA").tobytes("raw", "BGRA")
+        else:
+            im.convert("RGB").save(buf, "JPEG", quality=FRAME_SERVER_JPEG_QUALITY)
+        return buf.getvalue()
+
+    def get(self, fmt):
+        """(番号, エンコード済みバイト列, (幅, 高さ), ETag) を返す。まだフレームが無ければ (0, None, None, None)。
+        エンコードはロックの外で行い、publish() (Tkスレッド) を待たせない"""
+        with self.cond:
+            if self.image is None:
+                return 0, None, None, None
+            seq, im = self.seq, self.image
+        digest = self._digest(seq, im)
+        # ETag は画素のハッシュから作る (番号は起動し直すと 1 に戻り、別のフレームと取り違えるため)
+        etag = f'"{digest}-{fmt}"'
+        with self.cond:
+            data = self.encoded.get((digest, fmt))
+        if data is None:
+            data = self._encode(im, fmt)
+            with self.cond:
+                if self.digest == digest:
+                    data = self.encoded.setdefault((digest, fmt), data)
+        return seq, data, im.size, etag
+
+    def wait_next(self, last_seq, timeout=1.0):
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq or not self.running, timeout)
+            return self.seq
+
+    def _serve_snapshot(self, req, fmt):
+        _, data, size, etag = self.get(fmt)
+        if data is None:
+            req.send_error(503, "no frame yet")
+            return
+        if req.headers.get("If-None-Match") == etag:
+            req.send_response(304)
+            req.send_header("ETag", etag)
+            req.end_headers()
+            return
+        req.send_response(200)
+        req.send_header("Content-Type", self.FORMATS[fmt])
+        req.send_header("Content-Length", str(len(data)))
+        if fmt == "bgra":
+            w, h = size
+            req.send_header("X-Frame-Width", str(w))
+            req.send_header("X-Frame-Height", str(h))
+        req.send_header("ETag", etag)
+        req.send_header("Cache-Control", "no-cache")
+        req.end_headers()
+        req.wfile.write(data)
+
+    def _serve_mjpeg(self, req):
+        req.send_response(200)
+        req.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        req.send_header("Cache-Control", "no-cache")
+        req.end_headers()
+        last = -1
+        last_etag = None
+        min_interval = 1.0 / FRAME_SERVER_MJPEG_MAX_FPS
+        try:
+            while self.running:
+                if self.wait_next(last) == last:
+                    continue
+                t0 = time.perf_counter()
+                last, data, _, etag = self.get("jpeg")
+                if data is None or etag == last_etag:
+                    continue    # 番号は進んだが内容は同じ
+                last_etag = etag
+                req.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(data)).encode() + b"\r\n\r\n")
+                req.wfile.write(data)
+                req.wfile.write(b"\r\n")
+                req.wfile.flush()
+                wait = min_interval - (time.perf_counter() - t0)
+                if wait > 0:
+                    time.sleep(wait)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+
+class SharedFrameRing:
+    """合成フレームを multiprocessing.shared_memory のリングバッファへ無圧縮 (RGB/RGBA) で書き出す。
+    共有メモリの並び:
+      全体ヘッダ (GLOBAL): マジック, 版, スロット数, スロットの容量, 最新の番号, 最新のスロット
+      スロットごとのヘッダ (SLOT): 書込開始番号, 書込完了番号, 時刻(ns), 幅, 高さ, チャンネル数, 変化矩形の数, 変化矩形 x0,y0,x1,y1 × MAX_DIRTY_RECTS
+      スロットごとの画素
+    読む側は完了番号を見てから画素を参照し、読み終えたら開始番号が変わっていないことを確かめる (seqlock)。
+    内容が前回と同じフレームは書かないので、番号が変わらなければ読み直す必要はない"""
+    MAGIC = b"RQFR"
+    VERSION = 1
+    GLOBAL = struct.Struct("<4sHHQQI4x")
+    MAX_DIRTY_RECTS = 4
+    SLOT = struct.Struct("<QQQIIII" + "I" * 4 * MAX_DIRTY_RECTS)
+    SLOT_HEADER_BYTES = 128
+    created = set()  # このプロセスで作った共有メモリの名前
+
+    def __init__(self, name=FRAME_RING_NAME, slots=FRAME_RING_SLOTS, width=IMG_WIDTH, height=IMG_HEIGHT, create=True):
+        self.name = name
+        self.prev = None
+        if not create:
+            # 別プロセスが作ったリングに書き手として加わる (番号は続きから振る)
+            self.shm = shared_memory.SharedMemory(name=name)
+            magic, _, self.slots, self.slot_bytes, self.seq, _ = self.GLOBAL.unpack_from(self.shm.buf, 0)
+            if magic != self.MAGIC:
+                self.shm.close()
+                raise ValueError("共有メモリの形式が違います。")
+            return
+        self.slots = slots
+        self.slot_bytes = width * height * 4
+        size = self.data_offset(slots) + self.slot_bytes * slots
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 前回異常終了したときの残骸は作り直す
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        SharedFrameRing.created.add(name)
+        self.GLOBAL.pack_into(self.shm.buf, 0, self.MAGIC, self.VERSION, slots, self.slot_bytes, 0, 0)
+        self.seq = 0
+
+    @classmethod
+    def slot_header_offset(cls, slot):
+        return cls.GLOBAL.size + slot * cls.SLOT_HEADER_BYTES
+
+    @classmethod
+    def data_offset(cls, slots):
+        return (cls.GLOBAL.size + slots * cls.SLOT_HEADER_BYTES + 63) & ~63
+
+    def _dirty_rects(self, im):
+        """前回のフレームとの差分を横帯ごとの外接矩形で返す。初回や寸法・形式が変わったときは全体"""
+        w, h = im.size
+        if self.prev is None or self.prev.size != im.size or self.prev.mode != im.mode:
+            return [(0, 0, w, h)]
+        diff = ImageChops.difference(self.prev, im)
+        rects = []
+        band = -(-h // self.MAX_DIRTY_RECTS)
+        for y0 in range(0, h, band):
+            bbox = diff.crop((0, y0, w, min(h, y0 + band))).getbbox(alpha_only=False)
+            if bbox:
+                rects.append((bbox[0], bbox[1] + y0, bbox[2], bbox[3] + y0))
+        return rects
+
+    def write(self, im):
+        """フレームを書き込み、書いた番号を返す。前回と同じ内容なら書かずに None"""
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGB")
+        data = im.tobytes()
+        if len(data) > self.slot_bytes:
+            raise ValueError("フレームが共有メモリのスロットより大きいです。")
+        rects = self._dirty_rects(im)
+        if not rects:
+            return None
+        self.prev = im
+
+        self.seq += 1
+        seq = self.seq
+        slot = seq % self.slots
+        buf = self.shm.buf
+        hdr = self.slot_header_offset(slot)
+        struct.pack_into("<Q", buf, hdr, seq)  # 書込開始
+        off = self.data_offset(self.slots) + slot * self.slot_bytes
+        buf[off:off + len(data)] = data
+        flat = [v for r in rects for v in r] + [0] * (4 * (self.MAX_DIRTY_RECTS - len(rects)))
+        self.SLOT.pack_into(buf, hdr, seq, 0, time.time_ns(), im.size[0], im.size[1], len(im.getbands()), len(rects), *flat)
+        struct.pack_into("<Q", buf, hdr + 8, seq)  # 書込完了
+        struct.pack_into("<QI", buf, 16, seq, slot)
+        return seq
+
+    def close(self, unlink=True):
+        self.shm.close()
+        if not unlink:
+            return
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        SharedFrameRing.created.discard(self.name)
+
+class SharedFrameReader:
+    """SharedFrameRing の参照実装の読み手。poll() は新しいフレームがあれば画素をコピーせずに返す"""
+    def __init__(self, name=FRAME_RING_NAME, untrack=True):
+        self.shm = shared_memory.SharedMemory(name=name)
+        if untrack and os.name == "posix" and name not in SharedFrameRing.created:
+            # 読み手が終了したときに書き手の共有メモリを消されないよう、後始末の対象から外す
+            # (書き手の子プロセスとして動くときは後始末役を共有しているので外さない)
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception:
+                pass
+        magic, ver, slots, slot_bytes, _, _ = SharedFrameRing.GLOBAL.unpack_from(self.shm.buf, 0)
+        if magic != SharedFrameRing.MAGIC or ver != SharedFrameRing.VERSION:
+            self.shm.close()
+            raise ValueError("共有メモリの形式が違います。")
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.last_seq = 0
+
+    def poll(self):
+        """前回より新しいフレームがあれば dict を返す。pixels は共有メモリ上の memoryview で、
+        使い終わったら still_valid() で書き換えられていないことを確かめる"""
+        buf = self.shm.buf
+        for _ in range(3):
+            seq, slot = struct.unpack_from("<QI", buf, 16)
+            if seq == self.last_seq or seq == 0:
+                return None
+            hdr = SharedFrameRing.slot_header_offset(slot)
+            vals = SharedFrameRing.SLOT.unpack_from(buf, hdr)
+            start, done, ts, w, h, ch, n_rects = vals[:7]
+            if start != seq or done != seq:
+                continue  # 書き手に追い越された
+            off = SharedFrameRing.data_offset(self.slots) + slot * self.slot_bytes
+            flat = vals[7:7 + 4 * n_rects]
+            frame = {
+                "seq": seq,
+                "timestamp_ns": ts,
+                "size": (w, h),
+                "mode": "RGBA" if ch == 4 else "RGB",
+                "dirty": [tuple(flat[i:i + 4]) for i in range(0, len(flat), 4)],
+                "pixels": buf[off:off + w * h * ch],
+                "still_valid": lambda hdr=hdr, seq=seq: struct.unpack_from("<Q", self.shm.buf, hdr)[0] == seq,
+            }
+            self.last_seq = seq
+            return frame
+        return None
+
+    def read_slot(self, seq, slot):
+        """番号とスロットを指定して 1枚を PIL 画像にコピーする。既に上書きされていたら None"""
+        buf = self.shm.buf
+        hdr = SharedFrameRing.slot_header_offset(slot)
+        start, done, _, w, h, ch = SharedFrameRing.SLOT.unpack_from(buf, hdr)[:6]
+        if start != seq or done != seq:
+            return None
+        off = SharedFrameRing.data_offset(self.slots) + slot * self.slot_bytes
+        im = Image.frombytes("RGBA" if ch == 4 else "RGB", (w, h), bytes(buf[off:off + w * h * ch]))
+        return im if struct.unpack_from("<Q", buf, hdr)[0] == seq else None
+
+    def to_image(self, frame):
+        """確認済みのコピーを PIL 画像にする。読んでいる間に上書きされていたら None"""
+        im = Image.frombytes(frame["mode"], frame["size"], bytes(frame["pixels"]))
+        return im if frame["still_valid"]() else None
+
+    def close(self):
+        self.shm.close()
+
+def read_frame_ring(name=FRAME_RING_NAME, seconds=None):
+    """参照用の読み手: 届いたフレームの番号・遅延・変化矩形を表示する (python quiz3.py --read-frame-ring)"""
+    reader = SharedFrameReader(name)
+    t_end = None if seconds is None else time.monotonic() + seconds
+    try:
+        while t_end is None or time.monotonic() < t_end:
+            frame = reader.poll()
+            if frame is None:
+                time.sleep(0.002)
+                continue
+            lag_ms = (time.time_ns() - frame["timestamp_ns"]) / 1e6
+            print(f"#{frame['seq']} {frame['size'][0]}x{frame['size'][1]} {frame['mode']} lag={lag_ms:.1f}ms dirty={frame['dirty']}")
+            frame["pixels"].release()
+    finally:
+        reader.close()
+
+# ==========================================
+# 複数出力 (操作画面プレビュー / 会場表示 / 司会用タイマー / 配信)
+# ==========================================
+class OutputSink:
+    """出力先 1つ分。kind は描画の種類、size は出力の大きさを返す関数 (None なら等倍)。
+    deliver は縮小済みの画像を受け取って表示・送出する。flatten=True なら RGBA をクロマキー色で埋めてから渡す (Tk 向け)"""
+    def __init__(self, name, kind, deliver, size=None, flatten=False, active=None):
+        self.name = name
+        self.kind = kind
+        self.deliver = deliver
+        self.size = size
+        self.flatten = flatten
+        self.active = active or (lambda: True)
+        self.last_key = None
+        self.last_size = None
+        self.frames = 0
+        self.skipped = 0
+        self.shared = 0
+        self.render_ms = 0.0
+        self.scale_ms = 0.0
+        self.deliver_ms = 0.0
+        self.fps = 0.0
+        self._last_t = None
+
+    def record(self, render_ms, scale_ms, deliver_ms, shared):
+        now = time.perf_counter()
+        if self._last_t is not None:
+            dt = now - self._last_t
+            if dt > 0:
+                self.fps = 1.0 / dt if self.fps == 0 else self.fps * 0.8 + (1.0 / dt) * 0.2
+        self._last_t = now
+        self.frames += 1
+        self.shared += shared
+        self.render_ms = render_ms
+        self.scale_ms = scale_ms
+        self.deliver_ms = deliver_ms
+
+    def describe(self):
+        size = f"{self.last_size[0]}x{self.last_size[1]}" if self.last_size else "-"
+        return (f"{self.name} [{self.kind}] {size}: {self.frames}枚 (共有 {self.shared} / 省略 {self.skipped}) "
+                f"描画 {self.render_ms:.1f}ms 縮小 {self.scale_ms:.1f}ms 出力 {self.deliver_ms:.1f}ms {self.fps:.1f}fps")
+
+class OutputManager:
+    """1回の更新で、各出力先が必要とする描画の種類をそれぞれ 1回だけ描画し、同じ大きさへの縮小も使い回して配る"""
+    def __init__(self):
+        self.sinks = {}
+        self.passes = 0
+        self.renders = 0
+
+    def add(self, sink):
+        self.sinks[sink.name] = sink
+        return sink
+
+    def remove(self, name):
+        self.sinks.pop(name, None)
+
+    def render(self, renderers):
+        """renderers は kind -> (key, 描画関数)。key (key が None なら描画関数) が同じ種類は同じ画像を共有する。
+        key が None でなく前回と同じ出力先は描画し直さない (タイマーだけの画面など)"""
+        self.passes += 1
+        frames = {}
+        scaled = {}
+        for sink in list(self.sinks.values()):
+            if not sink.active() or sink.kind not in renderers:
+                continue
+            key, fn = renderers[sink.kind]
+            frame_id = key if key is not None else ("pass", id(fn))
+            size = sink.size() if sink.size else None
+            if key is not None and key == sink.last_key and size == sink.last_size:
+                sink.skipped += 1
+                continue
+            render_ms = 0.0
+            shared = 1
+            if frame_id not in frames:
+                t0 = time.perf_counter()
+                frames[frame_id] = fn()
+                render_ms = (time.perf_counter() - t0) * 1000
+                shared = 0
+                self.renders += 1
+            im = frames[frame_id]
+
+            t0 = time.perf_counter()
+            out_size = None
+            if size is not None:
+                r = min(size[0] / im.width, size[1] / im.height)
+                out_size = (max(1, int(im.width * r)), max(1, int(im.height * r)))
+            scale_key = (frame_id, out_size, sink.flatten)
+            if scale_key not in scaled:
+                out = im
+                if out_size is not None and out_size != im.size:
+                    out = im.resize(out_size, Image.Resampling.LANCZOS)
+                if sink.flatten and out.mode == "RGBA":
+                    # Tk では透過を表示できないので、画面上はクロマキー色で埋める
+                    bg = Image.new("RGBA", out.size, OBS_CHROMA_KEY_COLOR + (255,))
+                    out = Image.alpha_composite(bg, out).convert("RGB")
+                scaled[scale_key] = out
+            out = scaled[scale_key]
+            scale_ms = (time.perf_counter() - t0) * 1000
+
+            t0 = time.perf_counter()
+            sink.deliver(out)
+            deliver_ms = (time.perf_counter() - t0) * 1000
+            sink.last_key = key
+            sink.last_size = size
+            sink.record(render_ms, scale_ms, deliver_ms, shared)
+
+    def active_kinds(self):
+        return {sink.kind for sink in self.sinks.values() if sink.active()}
+
+    def describe(self):
+        lines = [f"更新 {self.passes}回 / 描画 {self.renders}回"]
+        lines.extend(sink.describe() for sink in self.sinks.values())
+        return "\n".join(lines)
+
+# ==========================================
+# 描画プロセス
+# ==========================================
+def _render_process_main(conn, ring_name):
+    """描画プロセスの本体。依頼ごとに前回から変わった引数だけを受け取り、描いた画像を共有メモリのリングへ書く"""
+    drawer = ScoreboardDrawer()
+    ring = SharedFrameRing(name=ring_name, create=False)
+    state = {}
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            req_id, updates = msg
+            results = {}
+            for job_id, (method, changed) in updates.items():
+                entry = state.get(job_id)
+                if entry is None or entry[0] != method:
+                    entry = state[job_id] = [method, {}]
+                for k, blob in changed.items():
+                    entry[1][k] = pickle.loads(blob)
+                t0 = time.perf_counter()
+                try:
+                    im = getattr(drawer, method)(**entry[1])
+                    ring.write(im)
+                except Exception:
+                    results[job_id] = ("error", traceback.format_exc())
+                    continue
+                # 前回と同じ画像なら書き込みが省かれるので、最後に書いた番号がそのまま使える
+                results[job_id] = ("ok", ring.seq, ring.seq % ring.slots, (time.perf_counter() - t0) * 1000)
+            conn.send((req_id, results))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        ring.close(unlink=False)
+
+class RenderProcess:
+    """ScoreboardDrawer を子プロセスで動かす。submit() で描画内容 (job_id -> (メソッド名, 引数)) を送り、
+    poll() で出来上がった画像を、submit() に渡した tag と一緒に受け取る。依頼は常に 1件だけ処理中にし、その間に来た依頼は最新の 1件にまとめる。
+    大会の状態は操作側にあるので、子プロセスが落ちても作り直して引数を全て送り直せば続きから描ける"""
+    def __init__(self, slots=RENDER_PROCESS_RING_SLOTS):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.ring_name = f"{FRAME_RING_NAME}_render_{os.getpid()}"
+        self.ring = SharedFrameRing(name=self.ring_name, slots=slots)
+        self.reader = SharedFrameReader(self.ring_name)
+        self.proc = None
+        self.conn = None
+        self.sent = {}
+        self.images = {}
+        self.pending = None
+        self.in_flight = None
+        self.req_seq = 0
+        self.retried = False
+        self.restarts = 0
+        self.errors = 0
+        self.render_ms = {}
+
+    def start(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.proc = self.ctx.Process(target=_render_process_main, args=(child_conn, self.ring_name), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.sent.clear()
+        self.in_flight = None
+
+    def stop(self):
+        if self.proc is not None:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self.proc.join(1.0)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join()
+            self.conn.close()
+            self.proc = None
+        self.reader.close()
+        self.ring.close()
+
+    def _restart(self):
+        if self.proc is not None:
+            if self.proc.is_alive():
+                self.proc.kill()
+            self.proc.join()
+            self.conn.close()
+        self.restarts += 1
+        print(f"描画プロセスを再起動します ({self.restarts}回目)")
+        last = self.in_flight[1:3] if self.in_flight is not None else None
+        self.start()
+        # 落ちる直前の依頼は 1度だけ送り直す (同じ依頼で続けて落ちるなら捨てて次の更新を待つ)
+        if last is not None and self.pending is None and not self.retried:
+            self.pending = last
+            self.retried = True
+        if self.pending is not None:
+            self._send()
+
+    def submit(self, jobs, tag=None):
+        self.pending = (jobs, tag)
+        if self.in_flight is None:
+            self._send()
+
+    def _send(self):
+        (jobs, tag), self.pending = self.pending, None
+        updates = {}
+        for job_id, (method, kwargs) in jobs.items():
+            blobs = {k: pickle.dumps(v, pickle.HIGHEST_PROTOCOL) for k, v in kwargs.items()}
+            prev = self.sent.get(job_id)
+            if prev is None or prev[0] != method or job_id not in self.images:
+                changed = blobs
+            else:
+                changed = {k: b for k, b in blobs.items() if prev[1].get(k) != b}
+                if not changed:
+                    continue
+            self.sent[job_id] = (method, blobs)
+            updates[job_id] = (method, changed)
+        self.req_seq += 1
+        # 変わった種類が無ければ送らず、次の poll() で前回の画像を返す
+        self.in_flight = (self.req_seq, jobs, tag, time.monotonic(), bool(updates))
+        if not updates:
+            return
+        try:
+            self.conn.send((self.req_seq, updates))
+        except (OSError, ValueError):
+            self._restart()
+
+    def poll(self):
+        """処理中の依頼が終わっていれば (job_id -> 画像, tag) を返す (描けなかった種類は前回の画像のまま)"""
+        if self.in_flight is None:
+            return None
+        req_id, jobs, tag, t0, sent = self.in_flight
+        if sent:
+            try:
+                if not self.conn.poll():
+                    if not self.proc.is_alive():
+                        raise EOFError
+                    if time.monotonic() - t0 > RENDER_PROCESS_TIMEOUT_SEC:
+                        print("描画プロセスが応答しません。")
+                        raise EOFError
+                    return None
+                got_id, results = self.conn.recv()
+            except (EOFError, OSError):
+                self._restart()
+                return None
+            if got_id != req_id:
+                return None
+            for job_id, res in results.items():
+                if res[0] == "ok":
+                    im = self.reader.read_slot(res[1], res[2])
+                    if im is not None:
+                        self.images[job_id] = im
+                        self.render_ms[job_id] = res[3]
+                        continue
+                    res = ("error", "共有メモリの画像が上書きされていました。")
+                self.errors += 1
+                # 次の依頼では全ての引数を送り直させる
+                self.sent.pop(job_id, None)
+                print(f"描画に失敗しました ({job_id}):\n{res[1]}")
+        self.in_flight = None
+        self.retried = False
+        if self.pending is not None:
+            self._send()
+        return {job_id: self.images[job_id] for job_id in jobs if job_id in self.images}, tag
+
+# ==========================================
+# 操作API (複数オペレーター)
+# ==========================================
+def json_dumps_compact(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def css_color(c):
+    return f"rgb({c[0]},{c[1]},{c[2]})" if isinstance(c, tuple) else c
+
+def web_player_state(p, view, hidden=False, buzz=False):
+    """1人分の表示状態 (操作APIとWeb版スコアボードで共通)。写真は送らない"""
+    return {
+        "rank": p["rank"], "rank_color": p.get("rank_color", "#3a8f3a"), "name": p["name"], "univ": p["univ"],
+        "hidden": hidden, "status": view["status"], "win_order": view["win_order"], "frozen": view["frozen"],
+        "main_text": view["main_text"], "main_color": css_color(view["main_color"]),
+        "sub_text": view["sub_text"], "note_text": view["note_text"], "marks": view["marks"],
+        "score_text": view["score_text"], "score_color": css_color(view["score_color"]), "panel_text": view["panel_text"],
+        "fill_ratio": view["fill_ratio"], "fill_color": css_color(view["fill_color"]),
+        "sets_won": p.get("final_sets_won", 0), "set_lost": p.get("final_set_lost", False),
+        "semi_active": p.get("semi_status") == "active", "buzz": buzz,
+    }
+
+def diff_control_state(old, new):
+    """操作状態の差分。players は変わった人だけを {番号: 内容} で、人数が変わったときは n も入れる"""
+    changes = {}
+    for key, value in new.items():
+        if key == "players":
+            old_players = old.get("players", [])
+            changed = {str(i): p for i, p in enumerate(value) if i >= len(old_players) or old_players[i] != p}
+            if changed or len(old_players) != len(value):
+                changes["players"] = {"n": len(value), "set": changed}
+        elif old.get(key) != value:
+            changes[key] = value
+    return changes
+
+def apply_control_delta(state, changes):
+    """diff_control_state の差分を状態に当てる (クライアント側と同じ手順の参照実装)"""
+    for key, value in changes.items():
+        if key == "players":
+            players = state.setdefault("players", [])
+            del players[value["n"]:]
+            while len(players) < value["n"]:
+                players.append(None)
+            for i, p in value["set"].items():
+                players[int(i)] = p
+        else:
+            state[key] = value
+    return state
+
+CONTROL_API_COMMANDS = (
+    "act", "act_win_lose", "undo",
+    "timer_start", "timer_stop", "timer_set", "timer_reset",
+    "next_question", "set_next_question", "show_question", "sf_next", "sf_prev",
+    "switch_tab",
+)
+
+class WebSocketTooLarge(Exception):
+    """受け取るメッセージが CONTROL_API_MAX_MESSAGE_BYTES を超えた"""
+
+class ControlServer:
+    """asyncio の HTTP/WebSocket サーバーを別スレッドで動かし、受けたコマンドに到着順の番号を振って
+    commands キューへ入れる。キューは Tk 側が順番に処理し、finish() で結果を返し broadcast() で差分を全員へ配る"""
+    WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, host=CONTROL_API_HOST, port=CONTROL_API_PORT, token=CONTROL_API_TOKEN):
+        self.host = host
+        self.port = port
+        self.token = token or secrets.token_urlsafe(16)
+        self.commands = queue.Queue()
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.clients = {}
+        self.sse_clients = {}
+        self.waiting = {}
+        self.cmd_seq = 0
+        self.client_ids = itertools.count(1)
+        self.state_lock = threading.Lock()
+        self.state = {}
+        self.state_seq = 0
+        self._ready = threading.Event()
+        self._error = None
+        self._html = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(2.0)
+
+    # --- Tk 側から呼ぶ (スレッドセーフ) ---
+    def set_state(self, state_seq, state):
+        with self.state_lock:
+            self.state_seq = state_seq
+            self.state = state
+
+    def finish(self, cmd_seq, reply):
+        self.loop.call_soon_threadsafe(self._finish, cmd_seq, reply)
+
+    def broadcast(self, message):
+        data = json_dumps_compact(message).encode("utf-8")
+        self.loop.call_soon_threadsafe(self._broadcast, self._ws_frame(data), b"data: " + data + b"\n\n")
+
+    # --- イベントループ側 ---
+    def _finish(self, cmd_seq, reply):
+        fut = self.waiting.pop(cmd_seq, None)
+        if fut is not None and not fut.done():
+            fut.set_result(reply)
+
+    def _send(self, client_id, writer, frame):
+        """送信はソケットの送信バッファへ積むだけにして、クライアントごとの待ちを作らない"""
+        if writer.transport.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > CONTROL_API_CLIENT_BUFFER_BYTES:
+            # 遅いクライアントのせいでメモリが膨らまないよう切り離す
+            self.clients.pop(client_id, None)
+            self.sse_clients.pop(client_id, None)
+            writer.transport.abort()
+            return
+        writer.write(frame)
+
+    def _broadcast(self, frame, event):
+        for client_id, writer in list(self.clients.items()):
+            self._send(client_id, writer, frame)
+        for client_id, writer in list(self.sse_clients.items()):
+            self._send(client_id, writer, event)
+
+    def _submit(self, client_id, msg):
+        """到着順に番号を振ってキューへ入れ、結果を待つ Future を返す"""
+        self.cmd_seq += 1
+        fut = self.loop.create_future()
+        self.waiting[self.cmd_seq] = fut
+        self.commands.put((self.cmd_seq, client_id, msg))
+        return fut
+
+    def _snapshot(self):
+        with self.state_lock:
+            return self.state_seq, self.state
+
+    def _authorized(self, params):
+        return hmac.compare_digest(params.get("token", [""])[0].encode("utf-8"), self.token.encode("utf-8"))
+
+    @staticmethod
+    def _same_origin(headers):
+        """ブラウザは Origin を必ず付けるので、付いていればこのサーバー自身のページから来たものだけを通す
+        (他サイトのページから操作されるのを防ぐ)。Origin の無い専用クライアントはトークンだけで判断する"""
+        origin = headers.get("origin")
+        if origin is None:
+            return True
+        return urllib.parse.urlsplit(origin).netloc.lower() == headers.get("host", "").lower()
+
+    async def _command(self, client_id, raw):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            msg = None
+        if not isinstance(msg, dict) or not isinstance(msg.get("cmd"), str):
+            msg_id = msg.get("id") if isinstance(msg, dict) else None
+            return {"type": "result", "id": msg_id, "ok": False, "error": "invalid_command"}
+        return await self._submit(client_id, msg)
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        path, _, query = target.partition("?")
+        params = urllib.parse.parse_qs(query)
+        try:
+            if not self._authorized(params):
+                await self._http_reply(writer, 403, {"error": "forbidden"})
+            elif (method == "POST" or "upgrade" in headers) and not self._same_origin(headers):
+                await self._http_reply(writer, 403, {"error": "cross_origin"})
+            elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self._ws_session(reader, writer, headers)
+            elif method == "GET" and path == "/events":
+                await self._sse_session(reader, writer)
+            elif method == "GET" and path in ("/", "/scoreboard"):
+                await self._http_send(writer, 200, self._scoreboard_html(), "text/html; charset=utf-8")
+            elif method == "GET" and path == "/api/state":
+                state_seq, state = self._snapshot()
+                await self._http_reply(writer, 200, {"state_seq": state_seq, "state": state})
+            elif method == "POST" and path == "/api/command":
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._http_reply(writer, 400, {"error": "bad_request"})
+                elif length > CONTROL_API_MAX_MESSAGE_BYTES:
+                    await self._http_reply(writer, 413, {"error": "too_large"})
+                else:
+                    body = await reader.readexactly(length)
+                    await self._http_reply(writer, 200, await self._command(None, body))
+            else:
+                await self._http_reply(writer, 404, {"error": "not_found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http_reply(self, writer, status, obj):
+        await self._http_send(writer, status, json_dumps_compact(obj).encode("utf-8"), "application/json; charset=utf-8")
+
+    async def _http_send(self, writer, status, body, content_type):
+        reason = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 413: "Payload Too Large"}.get(status, "")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    def _scoreboard_html(self):
+        if self._html is None:
+            config = {
+                "width": IMG_WIDTH, "height": IMG_HEIGHT, "bg": css_color(BG_COLOR), "chroma": css_color(OBS_CHROMA_KEY_COLOR),
+                "frame": FRAME_COLOR, "inner_top": INNER_BG_TOP, "inner_bottom": INNER_BG_BOTTOM, "win_bg": WIN_BG_COLOR,
+                "inner_border": INNER_BORDER, "name_stroke": NAME_STROKE_COLOR, "course_rect": COURSE_DISPLAY_RECT_COLOR,
+                "courses": MODE_COURSES, "buzz": BUZZER_HIGHLIGHT_COLOR,
+                "timer_offsets": ScoreboardDrawer.TIMER_OFFSETS, "tenths_scale": TIMER_TENTHS_SCALE,
+            }
+            self._html = WEB_SCOREBOARD_HTML.replace("__CONFIG__", json_dumps_compact(config)).encode("utf-8")
+        return self._html
+
+    async def _sse_session(self, reader, writer):
+        """Web版スコアボード向けの Server-Sent Events。最初に全体の状態、その後は差分だけを流す"""
+        client_id = next(self.client_ids)
+        state_seq, state = self._snapshot()
+        hello = json_dumps_compact({"type": "hello", "state_seq": state_seq, "state": state}).encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\nCache-Control: no-store\r\n"
+            b"Connection: keep-alive\r\n\r\nretry: 1000\n\ndata: " + hello + b"\n\n"
+        )
+        self.sse_clients[client_id] = writer
+        try:
+            # クライアントからは何も来ない。切断 (EOF) まで待つ
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.sse_clients.pop(client_id, None)
+
+    @staticmethod
+    def _ws_frame(payload, opcode=0x1):
+        n = len(payload)
+        if n < 126:
+            head = struct.pack("!BB", 0x80 | opcode, n)
+        elif n < 65536:
+            head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+        else:
+            head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+        return head + payload
+
+    @staticmethod
+    def _ws_unmask(data, mask):
+        n = len(data)
+        key = int.from_bytes((mask * (n // 4 + 1))[:n], "little")
+        return (int.from_bytes(data, "little") ^ key).to_bytes(n, "little")
+
+    async def _ws_read(self, reader):
+        """WebSocket のメッセージを 1つ読み、(opcode, payload) を返す。分割されたフレームはつなげる"""
+        message = bytearray()
+        first_opcode = None
+        while True:
+            b0, b1 = await reader.readexactly(2)
+            fin, opcode = b0 & 0x80, b0 & 0x0F
+            n = b1 & 0x7F
+            if n == 126:
+                n = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif n == 127:
+                n = struct.unpack("!Q", await reader.readexactly(8))[0]
+            if len(message) + n > CONTROL_API_MAX_MESSAGE_BYTES:
+                raise WebSocketTooLarge()
+            mask = await reader.readexactly(4) if b1 & 0x80 else None
+            data = await reader.readexactly(n)
+            if mask:
+                data = self._ws_unmask(data, mask)
+            if opcode >= 0x8:
+                return opcode, data  # 制御フレームは分割されない
+            if first_opcode is None:
+                first_opcode = opcode
+            message += data
+            if fin:
+                return first_opcode, bytes(message)
+
+    async def _ws_session(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + self.WS_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1")
+        )
+        client_id = next(self.client_ids)
+        state_seq, state = self._snapshot()
+        writer.write(self._ws_frame(json_dumps_compact(
+            {"type": "hello", "client": client_id, "state_seq": state_seq, "state": state}).encode("utf-8")))
+        self.clients[client_id] = writer
+
+        def reply(task):
+            self._send(client_id, writer, self._ws_frame(json_dumps_compact(task.result()).encode("utf-8")))
+
+        try:
+            while not writer.transport.is_closing():
+                opcode, data = await self._ws_read(reader)
+                if opcode == 0x8:
+                    self._send(client_id, writer, self._ws_frame(b"", 0x8))
+                    break
+                if opcode == 0x9:
+                    self._send(client_id, writer, self._ws_frame(data, 0xA))
+                elif opcode == 0x1:
+                    # 結果を待つ間も次のコマンドを受け付ける (順番はキューに入れた時点で決まっている)
+                    asyncio.ensure_future(self._command(client_id, data)).add_done_callback(reply)
+        except WebSocketTooLarge:
+            # 1009: Message Too Big
+            self._send(client_id, writer, self._ws_frame(struct.pack("!H", 1009), 0x8))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.pop(client_id, None)
+
+# ==========================================
+# Web版スコアボード (ブラウザ側で描画)
+# ==========================================
+# 会場PC・配信PCのブラウザで http://HOST:PORT/scoreboard を開くと、/events (SSE) で届く状態の差分から
+# Canvas に描き直す。?layout=obs で OBS 用オーバーレイ、&transparent=1 で背景透過 (ブラウザソース向け)。
+# 描画内容は ScoreboardDrawer.generate_image / generate_image_obs_overlay と同じ配置 (写真は描かない)
+WEB_SCOREBOARD_HTML = r"""<!doctype html>
+<html lang="ja"><head><meta charset="utf-8"><title>RUQabc Scoreboard</title>
+<style>html,body{margin:0;height:100%;background:#000;overflow:hidden}canvas{position:absolute;top:50%;left:50%;transform:translate(-50%,-50%)}</style>
+</head><body><canvas id="c"></canvas><script>
+"use strict";
+const CFG = __CONFIG__;
+const W = CFG.width, H = CFG.height;
+const params = new URLSearchParams(location.search);
+const OBS = params.get("layout") === "obs", TRANSPARENT = params.get("transparent") === "1";
+const canvas = document.getElementById("c"), ctx = canvas.getContext("2d");
+canvas.width = W; canvas.height = H;
+if (TRANSPARENT) document.documentElement.style.background = document.body.style.background = "transparent";
+function fitCanvas() { const r = Math.min(innerWidth / W, innerHeight / H); canvas.style.width = W * r + "px"; canvas.style.height = H * r + "px"; }
+addEventListener("resize", fitCanvas); fitCanvas();
+
+const F_MAIN = '"Source Han Sans JP","Noto Sans JP","Hiragino Sans","Yu Gothic",sans-serif';
+const F_HEAD = '"Outfit",' + F_MAIN;
+const F_QA = '"BIZ UDPGothic",' + F_MAIN;
+
+// ---- 描画の部品 (ScoreboardDrawer と同じ計算) ----
+function text(t, x, y, size, family, fill, o = {}) {
+  ctx.font = `${size}px ${family}`;
+  ctx.textAlign = o.align || "left"; ctx.textBaseline = o.baseline || "top";
+  if (o.stroke) { ctx.lineJoin = "round"; ctx.lineWidth = o.stroke * 2; ctx.strokeStyle = o.strokeColor || "black"; ctx.strokeText(t, x, y); }
+  ctx.fillStyle = fill; ctx.fillText(t, x, y);
+}
+function textWidth(t, size, family) { ctx.font = `${size}px ${family}`; return ctx.measureText(t).width; }
+function rect(x1, y1, x2, y2, fill) { ctx.fillStyle = fill; ctx.fillRect(x1, y1, x2 - x1, y2 - y1); }
+function outline(x1, y1, x2, y2, color, w) { ctx.strokeStyle = color; ctx.lineWidth = w; ctx.strokeRect(x1 + w / 2, y1 + w / 2, x2 - x1 - w, y2 - y1 - w); }
+function fitText(t, x, bottom, maxW, family, maxSize, fill, stroke, strokeColor, align = "center") {
+  let size = maxSize;
+  while (size > 10 && textWidth(t, size, family) > maxW) size -= 2;
+  text(t, x, bottom - 5, size, family, fill, { stroke, strokeColor, align, baseline: "bottom" });
+}
+function wrapLines(t, size, family, maxW) {
+  ctx.font = `${size}px ${family}`;
+  const lines = []; let cur = "";
+  for (const c of t) { if (ctx.measureText(cur + c).width <= maxW) cur += c; else { lines.push(cur); cur = c; } }
+  lines.push(cur); return lines;
+}
+function wrapped(t, x, y, size, family, fill, maxW) {
+  for (const line of wrapLines(t, size, family, maxW)) { text(line, x, y, size, family, fill); y += size + 10; }
+  return y;
+}
+function fixedPitchTimer(cx, cy, t, size, color, pitch) {
+  const chars = [...t], offsets = CFG.timer_offsets[chars.length] || CFG.timer_offsets[5];
+  if (chars.length > 5) { size = Math.floor(size * CFG.tenths_scale); pitch *= CFG.tenths_scale; }
+  chars.forEach((c, i) => { if (i < offsets.length) text(c, cx + offsets[i] * pitch, cy, size, F_HEAD, color, { align: "center", baseline: "middle" }); });
+}
+function pureName(name) { return name.replace(/[ 　]/g, ""); }
+function splitName(name) {
+  const pure = pureName(name), parts = name.split(/[ 　]+/);
+  return pure.length === 3 && parts.length >= 2 ? `${parts[0]}　${parts[1]}` : pure;
+}
+
+function drawHeader(s, y) {
+  text("RUQabc", 50, y, 54, F_HEAD, "white");
+  text(s.board.header, W - 50, y, 54, F_HEAD, "white", { align: "right" });
+}
+function drawTimer(s) {
+  const t = s.timer, mode = s.board.view_mode;
+  if (!t.visible || (t.alert && !t.blink_on)) return;
+  const color = t.alert ? "red" : "#00FFFF";
+  if (CFG.courses.includes(mode)) fixedPitchTimer(1640, 550, t.text, 150, color, 100);
+  else if (mode === "SEMI") fixedPitchTimer(W / 2, 250, t.text, 180, color, 120);
+}
+
+function drawPlate(p, xb, sy, cw, ch, scale, mode, is3rd) {
+  const lost = p.status === "lose", win = p.status === "win";
+  let [fc, rc, it] = lost ? ["#555", "#555", "#666"] : [CFG.frame, p.rank_color, CFG.inner_top];
+  if (p.frozen && !win) it = "#444";
+  if (mode === "FINAL" && p.set_lost && !win) it = "#444";
+  rect(xb, sy, xb + cw, sy + ch, fc);
+  const hh = 8 * scale;
+  rect(xb + (cw - 40 * scale) / 2, sy, xb + (cw + 40 * scale) / 2, sy + hh, rc);
+  rect(xb + (cw - 40) / 2, sy + ch - hh, xb + (cw + 40 * scale) / 2, sy + ch, rc);
+  const pad = 8 * scale, ix = xb + pad, iy = sy + pad, iw = cw - pad * 2, ih = ch - pad * 2;
+  rect(ix, iy, ix + iw, iy + ih, it);
+  if (mode === "FINAL") {
+    if (!win && !lost && p.fill_ratio > 0) rect(ix, iy + ih * (1 - p.fill_ratio), ix + iw, iy + ih, p.fill_color);
+    const margin = Math.floor(15 * scale), starSize = Math.floor(50 * scale);
+    const baseY = (iy + ih - 60 - margin) - 10 * scale;
+    for (let i = 0; i < p.sets_won; i++)
+      text("★", ix + margin - 5, baseY - i * 40 * scale - starSize, starSize, F_MAIN, "#FFD700", { stroke: Math.floor(2 * scale) });
+  } else if (mode !== "SEMI" && !is3rd) {
+    if (win) rect(ix, iy, ix + iw, iy + ih, CFG.win_bg);
+    else if (lost) rect(ix, iy, ix + iw, iy + ih, "#444");
+    else if (p.fill_ratio > 0 && !p.frozen) rect(ix, iy + ih * (1 - p.fill_ratio), ix + iw, iy + ih, CFG.inner_bottom);
+  }
+  outline(ix, iy, ix + iw, iy + ih, CFG.inner_border, Math.max(1, Math.floor(5 * scale)));
+
+  const cx = xb + cw / 2;
+  if (mode === "SEMI") {
+    text(p.rank, cx, sy - 40, 40, F_MAIN, "white", { align: "center", stroke: 3, strokeColor: rc });
+    const n = pureName(p.name).length, size = n <= 4 ? 40 : n === 5 ? 34 : 52;
+    fitText(p.univ, cx, sy + ch - 70, cw - 10, F_MAIN, 24, "white", 2, CFG.name_stroke);
+    fitText(splitName(p.name), cx, sy + ch - 20, cw - 5, F_MAIN, size, "white", 4, CFG.name_stroke);
+  } else if (mode === "FINAL") {
+    text(p.rank, cx, sy - 30, 40, F_MAIN, "white", { align: "center", stroke: 3, strokeColor: rc });
+    fitText(p.univ, ix + 15, sy + ch - 27, cw / 2 - 20, F_MAIN, 28, "white", 3, CFG.name_stroke, "left");
+    fitText(splitName(p.name), ix + iw - 25, sy + ch - 26, cw / 2, F_MAIN, 40, "white", 4, CFG.name_stroke, "right");
+  } else {
+    text(p.rank, cx, sy - 25 * scale, Math.floor(40 * scale), F_MAIN, "white", { align: "center", stroke: Math.floor(5 * scale), strokeColor: rc });
+    const pure = pureName(p.name), sp = p.name.search(/[ 　]/);
+    const size = Math.floor((pure.length < 5 ? 75 : 58) * scale), grid = size + 10 * scale;
+    const color = lost && mode !== "FINAL" ? "gray" : "white";
+    [...pure].forEach((c, i) => {
+      let dy = iy + 5 * scale + i * grid;
+      if (pure.length === 3 && sp !== -1 && i >= sp) dy += grid;
+      text(c, xb + cw * 0.45, dy, size, F_MAIN, color, { align: "center", stroke: Math.floor(4 * scale), strokeColor: CFG.name_stroke });
+    });
+    const us = Math.floor(24 * scale); let uy = iy + 10 * scale;
+    for (const c of p.univ) { text(c, xb + cw * 0.82, uy, us, F_MAIN, color, { align: "center", stroke: Math.floor(2 * scale) }); uy += us + 2; }
+  }
+  if (is3rd) return;
+
+  function centerScaled(t, base, color, offY = 10, ratio = 0.9) {
+    const maxW = Math.max(20, Math.floor(cw * ratio));
+    let size = Math.max(10, Math.floor(base * scale));
+    while (size > 10 && textWidth(t, size, F_HEAD) > maxW) size -= 2;
+    text(t, cx, sy + ch + offY, size, F_HEAD, color, { align: "center" });
+  }
+  if (win) {
+    if (mode === "FINAL") centerScaled(p.score_text, 72, "red", 10, 0.98);
+    else centerScaled(p.win_order > 0 ? p.score_text : "WIN", 80, "red", 10, 0.86);
+  } else if (lost) {
+    if (mode === "FINAL") centerScaled("LOSE", 80, "gray");
+    else centerScaled("LOSE", 92, "gray", 10, 1.10);
+  } else if (mode === "Freeze10" && p.frozen) {
+    centerScaled(p.main_text, 50, p.main_color, 30);
+  } else if (mode !== "SEMI") {
+    centerScaled(p.main_text, 80, p.main_color);
+    if (p.sub_text) centerScaled(p.sub_text, 50, "white", 100);
+    if (p.note_text) centerScaled(p.note_text, 36, "#b9d8ff", 145);
+    const ms = Math.floor(60 * scale), my = sy + ch + 100 * scale;
+    if (p.marks > 0 && mode === "10up-down") text("×", cx, my, ms, F_MAIN, "red", { align: "center" });
+    else for (let i = 0; i < p.marks; i++) text("×", cx - 25 * scale + i * 50 * scale, my, ms, F_MAIN, "white", { align: "center" });
+  }
+}
+
+// ---- 画面ごとの描画 ----
+function drawBoard(s) {
+  const b = s.board, q = s.question, mode = b.view_mode;
+  rect(0, 0, W, H, CFG.bg);
+  if (b.mode === "TIMER_ONLY") {
+    const t = s.timer;
+    let size = 620;
+    while (size > 80 && textWidth(t.text, size, F_HEAD) > W - 80) size -= 8;
+    if (!t.alert || t.blink_on) text(t.text, W / 2, H / 2, size, F_HEAD, t.alert ? "red" : "#00FFFF", { align: "center", baseline: "middle" });
+    return;
+  }
+  drawHeader(s, 40);
+  if (b.mode === "3RD") {
+    const rx = W / 2 - 350, ry = 180;
+    rect(rx, ry, rx + 700, ry + 120, CFG.course_rect); outline(rx, ry, rx + 700, ry + 120, "white", 2);
+    if (b.course && b.course !== "未選択") text(b.course, W / 2, ry + 60, 80, F_QA, "white", { align: "center", baseline: "middle" });
+    s.players.forEach((p, i) => { if (!p.hidden) drawPlate(p, 15 + i * 95, 480, 88, 380 * 0.65, 0.65, "2R", true); });
+    return;
+  }
+  if (b.mode === "SF_FOLLOW") {
+    const ys = [150, 420, 690];
+    q.sf.forEach((item, i) => {
+      const y = wrapped(item.q, 50, ys[i], 45, F_QA, "white", W - 100);
+      wrapped(`A. ${item.a}`, 50, y + 10, 45, F_QA, "yellow", W - 100);
+      if (i < 2) { ctx.strokeStyle = "#444"; ctx.lineWidth = 2; ctx.beginPath(); ctx.moveTo(50, ys[i + 1] - 30); ctx.lineTo(W - 50, ys[i + 1] - 30); ctx.stroke(); }
+    });
+    return;
+  }
+  drawTimer(s);
+  if (mode !== "SEMI" && q.shown) {
+    const y = wrapped(`Q. ${q.q}`, 50, 140, 45, F_QA, "white", W - 100);
+    wrapped(`A. ${q.a}`, 50, y + 10, 45, F_QA, "yellow", W - 100);
+  }
+  let mx = 50, sy = 350, cw = 132, ch = 380, gap = 22, scale = 1.0;
+  if (mode === "SEMI") { cw = 200; ch = 320; gap = 10; mx = Math.floor((W - cw * 9 - gap * 8) / 2); sy = 450; }
+  else if (mode === "FINAL") { cw = 480; ch = 320; gap = 80; mx = Math.floor((W - cw * 3 - gap * 2) / 2); scale = 1.1; }
+  else if (mode !== "2R" && mode !== "EXTRA") { mx = 150; cw = 145; ch = 400; gap = 120; scale = 1.06; }
+  s.players.forEach((p, i) => {
+    if (p.hidden) return;
+    const px = mx + i * (cw + gap);
+    drawPlate(p, px, sy, cw, ch, scale, mode, false);
+    if (p.buzz) outline(px - 8, sy - 8, px + cw + 8, sy + ch + 8, CFG.buzz, 6);
+    if (mode === "SEMI" && p.semi_active) text(p.main_text, px + Math.floor(cw / 2), sy + ch + 30, 100, F_HEAD, "yellow", { align: "center" });
+  });
+}
+
+function drawOverlay(s) {
+  const b = s.board, q = s.question, mode = b.view_mode;
+  const clear = (y1, y2) => { ctx.clearRect(0, y1, W, y2 - y1); if (!TRANSPARENT) rect(0, y1, W, y2, CFG.chroma); };
+  const headerH = 88, bottomTop = 800;
+  clear(0, H);
+  rect(0, 0, W, headerH, "#060606");
+  rect(0, bottomTop, W, H, "#2f3338");
+  drawHeader(s, 12);
+  drawTimer(s);
+  let qaBottom = headerH;
+  if (mode !== "SEMI" && q.shown) {
+    const maxW = W - 100, qt = `Q. ${q.q}`, at = `A. ${q.a}`;
+    const lines = wrapLines(qt, 45, F_QA, maxW).length + wrapLines(at, 45, F_QA, maxW).length;
+    qaBottom = headerH + lines * 55 + 12;
+    rect(0, headerH, W, qaBottom, "#0b0b0b");
+    const y = wrapped(qt, 50, headerH + 6, 45, F_QA, "white", maxW);
+    wrapped(at, 50, y + 8, 45, F_QA, "yellow", maxW);
+  }
+  if (qaBottom < bottomTop) clear(qaBottom, bottomTop);
+  const n = s.players.length;
+  if (!n) return;
+  const colW = (W - 16 - 3 * (n - 1)) / n;
+  s.players.forEach((p, i) => {
+    if (p.hidden) return;
+    const x1 = 8 + i * (colW + 3), x2 = x1 + colW, cx = Math.floor((x1 + x2) / 2), mw = Math.floor(colW - 8);
+    rect(x1, bottomTop + 36, x2, H - 4, "#4a4a4a"); outline(x1, bottomTop + 36, x2, H - 4, "#9a9a9a", 1);
+    rect(x1, bottomTop, x2, bottomTop + 36, p.rank_color);
+    fitText(p.rank, cx, bottomTop + 32, mw, F_MAIN, 32, "white", 1, "black");
+    fitText(p.name, cx, bottomTop + 98, mw, F_MAIN, 40, "white", 2, "black");
+    fitText(p.univ, cx, bottomTop + 134, mw, F_MAIN, 24, "#efefef", 1, "black");
+    fitText(p.score_text, cx, bottomTop + 178, mw, F_HEAD, 36, p.score_color, 2, "black");
+    if (p.buzz) outline(x1, bottomTop, x2, H - 4, CFG.buzz, 5);
+  });
+}
+
+// ---- 状態の受信 (最初に全体、その後は差分) ----
+let state = null, seq = -1, pending = false;
+function applyDelta(st, changes) {
+  for (const k in changes) {
+    if (k !== "players") { st[k] = changes[k]; continue; }
+    const d = changes.players, ps = st.players;
+    ps.length = Math.min(ps.length, d.n);
+    for (const i in d.set) ps[+i] = d.set[i];
+  }
+}
+function render() {
+  pending = false;
+  if (!state) return;
+  const courseView = !["TIMER_ONLY", "3RD", "SF_FOLLOW"].includes(state.board.mode);
+  if (OBS && courseView) drawOverlay(state); else drawBoard(state);
+}
+function schedule() { if (!pending) { pending = true; requestAnimationFrame(render); } }
+async function resync() {
+  const r = await fetch(`/api/state${location.search}`);
+  if (!r.ok) return;
+  const d = await r.json();
+  state = d.state; seq = d.state_seq; schedule();
+}
+const events = new EventSource(`/events${location.search}`);
+events.onmessage = (e) => {
+  const d = JSON.parse(e.data);
+  if (d.type === "hello") { state = d.state; seq = d.state_seq; schedule(); return; }
+  if (d.type !== "delta" || !state || d.state_seq <= seq) return;
+  if (d.state_seq !== seq + 1) { seq = d.state_seq; resync(); return; }
+  applyDelta(state, d.changes); seq = d.state_seq; schedule();
+};
+if (document.fonts) document.fonts.ready.then(schedule);
+</script></body></html>
+"""
+
+# ==========================================
+# カウントダウンタイマー
+# ==========================================
+class CountdownTimer:
+    """time.monotonic の締め切り時刻から残り時間を出すカウントダウン。
+    表示の更新や描画が遅れても残り時間はずれず、一時停止中は端数まで残り時間を保持する"""
+    def __init__(self, seconds=0, clock=time.monotonic):
+        self.clock = clock
+        self.left = float(seconds)      # 停止中の残り秒
+        self.deadline = None            # 動作中の締め切り (clock の時刻)
+
+    @property
+    def running(self):
+        return self.deadline is not None
+
+    def set(self, seconds):
+        self.left = float(seconds)
+        if self.deadline is not None:
+            self.deadline = self.clock() + self.left
+
+    def start(self):
+        if self.deadline is None and self.left > 0:
+            self.deadline = self.clock() + self.left
+
+    def pause(self):
+        if self.deadline is not None:
+            self.left = max(0.0, self.deadline - self.clock())
+            self.deadline = None
+
+    def remaining(self):
+        if self.deadline is None:
+            return self.left
+        return max(0.0, self.deadline - self.clock())
+
+    def display_units(self, step=1.0):
+        """画面に出す値 (step 秒単位)。切り上げなので開始直後は設定値のまま、step 秒経つと 1 減る"""
+        return math.ceil(self.remaining() / step - 1e-9)
+
+    def display_seconds(self):
+        return self.display_units(1.0)
+
+    def until_change(self, step=1.0):
+        """表示が次に変わるまでの時間"""
+        r = self.remaining()
+        return r - (math.ceil(r / step - 1e-9) - 1) * step
+
+# ==========================================
+# 早押し判定
+# ==========================================
+class BuzzerArbiter:
+    """押下 (席番号, perf_counter_ns) から着順を決める。入力スレッドと Tk の両方から呼ぶのでロックで守る。
+    締め出し: locked の席 (凍結中・失格・勝ち抜け済み) は常に、誤答した席はその問題の間、
+    受付開始前 BUZZER_EARLY_LOCKOUT_MS 以内に押した席 (フライング) は受付開始から同じ時間だけ無視する"""
+    def __init__(self, settle_us=BUZZER_SETTLE_US, early_lockout_ms=BUZZER_EARLY_LOCKOUT_MS):
+        self.lock = threading.Lock()
+        self.settle_ns = int(settle_us * 1000)
+        self.early_lockout_ns = int(early_lockout_ms * 1_000_000)
+        self.armed = False
+        self.armed_at = 0
+        self.locked = frozenset()
+        self.rejected = set()
+        self.false_starts = {}      # 席 -> 受付前に押した時刻
+        self.early_until = {}       # 席 -> フライングによる締め出しの終了時刻
+        self.presses = []           # 受け付けた押下 (時刻, 席, 機器名) の時刻順
+        self.winner = None
+        self.decided_at = None
+        self.version = 0            # 着順が変わるたびに増やす (表示更新の判定用)
+
+    def arm(self, locked=(), now_ns=None):
+        """新しい問題の受付開始。誤答による締め出しはここで解除する"""
+        with self.lock:
+            now = time.perf_counter_ns() if now_ns is None else now_ns
+            self.early_until = {seat: now + self.early_lockout_ns
+                                for seat, t in self.false_starts.items() if now - t <= self.early_lockout_ns}
+            self.false_starts.clear()
+            self.rejected.clear()
+            self._reset(now, locked)
+
+    def rearm(self, reject, locked=(), now_ns=None):
+        """誤答した席をこの問題の間締め出して、残りの席で受付をやり直す"""
+        with self.lock:
+            self.rejected.add(reject)
+            self._reset(time.perf_counter_ns() if now_ns is None else now_ns, locked)
+
+    def _reset(self, now, locked):
+        self.armed = True
+        self.armed_at = now
+        self.locked = frozenset(locked)
+        self.presses = []
+        self.winner = None
+        self.decided_at = None
+        self.version += 1
+
+    def disarm(self):
+        with self.lock:
+            self.armed = False
+            self.presses = []
+            self.winner = None
+            self.decided_at = None
+            self.version += 1
+
+    def set_locked(self, locked):
+        with self.lock:
+            self.locked = frozenset(locked)
+
+    def press(self, seat, t_ns, source=""):
+        """入力スレッドから呼ぶ。着順に加えたら True"""
+        with self.lock:
+            if not self.armed:
+                self.false_starts[seat] = t_ns
+                return False
+            if t_ns < self.armed_at:
+                # 受付開始より前に押されていた (届いたのが開始後だっただけ) のでフライング扱い
+                self.early_until[seat] = self.armed_at + self.early_lockout_ns
+                return False
+            if seat in self.locked or seat in self.rejected or t_ns < self.early_until.get(seat, 0):
+                return False
+            if any(s == seat for _, s, _ in self.presses):
+                return False
+            bisect.insort(self.presses, (t_ns, seat, source))
+            self.version += 1
+            return True
+
+    def poll(self, now_ns=None):
+        """1着が決まったらその席を 1度だけ返す。経路ごとの届く順の差を吸収するため、
+        最も早い押下から settle 時間が経つまでは後から届く押下を待つ"""
+        with self.lock:
+            if self.winner is not None or not self.presses:
+                return None
+            now = time.perf_counter_ns() if now_ns is None else now_ns
+            t_first, seat, _ = self.presses[0]
+            if now - t_first < self.settle_ns:
+                return None
+            self.winner = seat
+            self.decided_at = now
+            self.version += 1
+            return seat
+
+    def order(self):
+        """着順 [(席, 1着との差 ns)]"""
+        with self.lock:
+            if not self.presses:
+                return []
+            t0 = self.presses[0][0]
+            return [(seat, t - t0) for t, seat, _ in self.presses]
+
+class BuzzerInput:
+    """押しボタン機器ごとに入力スレッドを立て、届いた押下を判定器へ渡す"""
+    def __init__(self, arbiter):
+        self.arbiter = arbiter
+        self.stop_event = threading.Event()
+        self.devices = []
+
+    def add(self, device):
+        th = threading.Thread(target=self._run, args=(device,), name=f"buzzer-{device.name}", daemon=True)
+        self.devices.append((device, th))
+        th.start()
+
+    def _run(self, device):
+        while not self.stop_event.is_set():
+            try:
+                got = device.read(0.2)
+            except OSError as e:
+                print(f"早押し機器 ({device.name}) の読み取りに失敗しました: {e}")
+                return
+            if got is not None:
+                seat, t_ns = got
+                self.arbiter.press(seat, t_ns, device.name)
+
+    def stop(self):
+        self.stop_event.set()
+        for device, th in self.devices:
+            th.join(1.0)
+            device.close()
+
+class KeyboardBuzzerDevice:
+    """操作画面のキー (BUZZER_KEYS) を押しボタン代わりにする。
+    時刻は Tk のハンドラが動いた時点ではなく、OS がキー入力を受けた時刻 (event.time, ms) を perf_counter_ns に
+    換算したもの。描画などで Tk のイベント処理が遅れても、その待ち時間が着順に入らない。
+    キーイベントは Tk スレッドで届くので、入力スレッドを介さず判定器へ直接渡す (後に続く _poll_buzzer より先に必ず載る)"""
+    name = "keyboard"
+    CALIBRATION_SAMPLES = 64
+    WRAP_MS = 1 << 32
+
+    def __init__(self, arbiter):
+        self.arbiter = arbiter
+        self.offsets = []           # 直近のキーイベントでの (ハンドラ実行時刻 - イベント時刻)
+        self.last_ms = None
+        self.wraps = 0
+
+    def event_time_ns(self, event_time_ms, now_ns=None):
+        """イベント時刻を perf_counter_ns に換算する。ハンドラはイベントより必ず後に動くので、
+        直近の (実行時刻 - イベント時刻) の最小値を両方の時計の差とみなす (待ちが最も短かったイベント)"""
+        now = time.perf_counter_ns() if now_ns is None else now_ns
+        if not event_time_ms:
+            return now              # event_generate などで時刻が付いていない
+        if self.last_ms is not None and event_time_ms < self.last_ms - self.WRAP_MS // 2:
+            self.wraps += 1         # 32bit のミリ秒は約49日で一周する
+        self.last_ms = event_time_ms
+        t_ms = event_time_ms + self.wraps * self.WRAP_MS
+        self.offsets.append(now - t_ms * 1_000_000)
+        del self.offsets[:-self.CALIBRATION_SAMPLES]
+        return min(now, t_ms * 1_000_000 + min(self.offsets))
+
+    def press(self, seat, event_time_ms=None, now_ns=None):
+        return self.arbiter.press(seat, self.event_time_ns(event_time_ms, now_ns), self.name)
+
+class SerialBuzzerDevice:
+    """シリアル (USB-シリアル変換含む) 接続の押しボタン。押された席番号 (1始まり) を 1行ずつ送る機器を想定し、
+    行を受け取った時点の時刻を付ける"""
+    name = "serial"
+
+    def __init__(self, port=BUZZER_SERIAL_PORT, baud=BUZZER_SERIAL_BAUD):
+        try:
+            import serial
+        except ImportError:
+            raise ValueError("シリアル接続の押しボタンには pyserial が必要です。(pip install pyserial)")
+        self.port = serial.Serial(port, baud, timeout=0.2)
+
+    def read(self, timeout):
+        # 待ち時間はポートを開いたときの timeout で決まる
+        line = self.port.readline()
+        t_ns = time.perf_counter_ns()
+        text = line.strip()
+        if not text.isdigit():
+            return None
+        return int(text) - 1, t_ns
+
+    def close(self):
+        self.port.close()
+
+# ==========================================
+# 筆記予選の採点
+# ==========================================
+class QualifierGrader:
+    """筆記予選の一括採点。解答用紙を (人数 × 問題数) の正誤行列にして NumPy でまとめて得点と順位を出す。
+    解答キーの行: 問題番号, 正解 (別解は QUALIFIER_ANSWER_SEPARATOR 区切り), 配点 (省略時 1)
+    解答用紙の行: 受験番号, 氏名, 大学, 1問目の解答, 2問目の解答, ...
+    どちらも先頭行が見出しなら読み飛ばす。解答は問題検索と同じ正規化 (全角半角・かな・空白) をしてから突き合わせる。
+    解答キーは行の順ではなく問題番号で並べ、番号の抜け・重複があれば ValueError にする"""
+    HEADER_LABELS = {"番号", "受験番号", "受験者番号", "id", "受験id", "no", "no.", "受験no", "受験no."}
+
+    def __init__(self, key_rows, tiebreak=None):
+        entries = {}
+        for row in key_rows:
+            if len(row) < 2 or not row[0].strip().isdigit():
+                continue
+            no = int(row[0].strip())
+            if no in entries:
+                raise ValueError(f"解答キーの問題番号 {no} が重複しています。")
+            try:
+                weight = float(row[2]) if len(row) >= 3 and row[2].strip() else 1.0
+            except ValueError:
+                weight = 1.0
+            alts = {normalize_question_text(a) for a in row[1].split(QUALIFIER_ANSWER_SEPARATOR)} - {""}
+            entries[no] = (alts, weight)
+        if not entries:
+            raise ValueError("解答キーに有効な行がありません。(問題番号, 正解, 配点)")
+        missing = [no for no in range(1, max(entries) + 1) if no not in entries]
+        if missing or min(entries) < 1:
+            raise ValueError(f"解答キーの問題番号が 1 から連続していません。(抜け: {', '.join(map(str, missing[:10])) or 'なし'})")
+        self.key = [entries[no][0] for no in range(1, len(entries) + 1)]
+        self.weights = [entries[no][1] for no in range(1, len(entries) + 1)]
+        self.tiebreak = list(tiebreak or QUALIFIER_TIEBREAK)
+
+    @classmethod
+    def _is_header(cls, row):
+        head = (row[0] if row else "").strip().casefold()
+        return unicodedata.normalize("NFKC", head).replace(" ", "") in cls.HEADER_LABELS
+
+    def grade(self, sheet_rows):
+        """順位順のリストと採点にかかった時間 (秒) を返す"""
+        try:
+            import numpy as np
+        except ImportError:
+            raise ValueError("筆記採点には NumPy が必要です。(pip install numpy)")
+
+        sheets = [r for i, r in enumerate(sheet_rows) if r and not (i == 0 and self._is_header(r))]
+        t0 = time.perf_counter()
+        n_q = len(self.key)
+        n_s = len(sheets)
+
+        # 解答文字列を整数コードにしてから行列にする (同じ解答の正規化は1回だけ)
+        codes = {}
+        norm_cache = {}
+        ans = np.full((n_s, n_q), -1, dtype=np.int64)
+        for i, r in enumerate(sheets):
+            for j, raw in enumerate(r[3:3 + n_q]):
+                key = norm_cache.get(raw)
+                if key is None:
+                    key = norm_cache[raw] = normalize_question_text(raw)
+                if key:
+                    ans[i, j] = codes.setdefault(key, len(codes))
+
+        correct = np.zeros((n_s, n_q), dtype=bool)
+        for j, alts in enumerate(self.key):
+            key_codes = [codes[a] for a in alts if a in codes]
+            if key_codes:
+                correct[:, j] = np.isin(ans[:, j], key_codes)
+
+        weights = np.asarray(self.weights, dtype=np.float64)
+        metrics = {
+            "score": correct @ weights,
+            "correct": correct.sum(axis=1),
+        }
+        rate = correct.mean(axis=0) if n_s else np.zeros(n_q)
+        metrics["rare"] = correct @ (1.0 - rate)
+
+        # np.lexsort は最後のキーが最優先。降順にするため符号を反転し、最後に同点なら提出順
+        sort_keys = [np.arange(n_s)]
+        for name in reversed(self.tiebreak):
+            if name == "backward":
+                sort_keys.extend(-correct[:, j].astype(np.int8) for j in range(n_q))
+            elif name in metrics:
+                sort_keys.append(-metrics[name])
+        order = np.lexsort(sort_keys) if n_s else np.zeros(0, dtype=np.int64)
+        elapsed = time.perf_counter() - t0
+
+        ranking = []
+        for rank, i in enumerate(order.tolist(), start=1):
+            r = sheets[i]
+            ranking.append({
+                "rank": rank,
+                "id": r[0] if len(r) > 0 else "",
+                "name": r[1] if len(r) > 1 else "",
+                "univ": r[2] if len(r) > 2 else "",
+                "score": float(metrics["score"][i]),
+                "correct": int(metrics["correct"][i]),
+            })
+        return ranking, elapsed
+
+    @staticmethod
+    def seed_entries(ranking, advance=QUALIFIER_ADVANCE):
+        """上位 advance 名を、48名読込と同じ (順位-1)%4 組 / (順位-1)//4 番目 の配置にする"""
+        entries = []
+        for rec in ranking[:advance]:
+            r_num = rec["rank"]
+            g_idx = (r_num - 1) % 4
+            p_idx = (r_num - 1) // 4
+            if 0 <= g_idx < NUM_GROUPS and 0 <= p_idx < 12:
+                entries.append((g_idx, p_idx, rec["univ"], rec["name"]))
+        return entries
+
+    @staticmethod
+    def write_ranking(fp, ranking):
+        with open(fp, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["順位", "受験番号", "氏名", "大学", "得点", "正解数"])
+            for rec in ranking:
+                score = int(rec["score"]) if rec["score"].is_integer() else rec["score"]
+                w.writerow([rec["rank"], rec["id"], rec["name"], rec["univ"], score, rec["correct"]])
+
 # ==========================================
 # メインアプリケーション
 # ==========================================
@@ -962,7 +3647,7 @@ class QuizApp(tk.Tk):
         super().__init__()
         self.title("RUQabc HQ Manager"); self.geometry(CONTROL_WINDOW_GEOMETRY)
         self.all_groups_data = [[get_empty_player((i*4)+(g+1)) for i in range(12)] for g in range(NUM_GROUPS)]
-        self.questions = []; self.current_q_idx = 0; self.current_group_idx = 0
+        self.questions = QuestionStore.from_pairs([]); self.current_q_idx = 0; self.current_group_idx = 0
         self.history_stacks = {} 
         self.history_stacks_3rd = {} 
         self.mode = "SCORE"
@@ -971,6 +3656,9 @@ class QuizApp(tk.Tk):
         self.player_selections_3rd = {}
         self.timer_seconds = TIMER_DEFAULT_MIN * 60 + TIMER_DEFAULT_SEC
         self.timer_running = False
+        self.timer_tenths = self.timer_seconds * 10
+        self.timer = CountdownTimer(self.timer_seconds)
+        self._timer_job = None
         self.timer_blink_on = True
         self._timer_blink_job = None
         self.question_display_started = False
@@ -989,9 +3677,14 @@ class QuizApp(tk.Tk):
         self.sf_hide_scores = False
 
         self.display_window = None
+        self.host_window = None
+        self.control_preview_frame = None
+        self.host_timer_var = tk.BooleanVar(value=False)
         self.display_separate_var = tk.BooleanVar(value=DISPLAY_WINDOW_SEPARATE_DEFAULT)
         self.obs_overlay_var = tk.BooleanVar(value=OBS_OVERLAY_DEFAULT)
+        self.obs_transparent_var = tk.BooleanVar(value=OBS_OVERLAY_TRANSPARENT_DEFAULT)
         self.timer_visible_var = tk.BooleanVar(value=TIMER_VISIBLE_DEFAULT)
+        self.timer_tenths_var = tk.BooleanVar(value=TIMER_TENTHS_DEFAULT)
         self.question_visible_var = tk.BooleanVar(value=True)
         self.next_q_manual_mode_var = tk.BooleanVar(value=False)
         self.next_q_target_var = tk.StringVar(value="")
@@ -1010,27 +3703,151 @@ class QuizApp(tk.Tk):
         self.btn_apply_next_q = None
         self.cb_name_labels = []
 
+        self._judge_txn = None
+        self.qualifiers = QualifierPipeline()
+        self.tournament_index = TournamentIndex()
+        for g, group in enumerate(self.all_groups_data):
+            self.tournament_index.update_group(g, group)
+        self.question_cache = QuestionBankCache()
+        self.questions_path = None
+        self.questions_stamp = None
+        self._questions_layout_count = 0
+        self._load_job = None
+        self._watch_job = None
+        self._watch_pending = None
+        self._watch_failed = None
+        self.question_search = QuestionSearchIndex()
+        self.frame_ring = None
+        if FRAME_RING_ENABLED:
+            try:
+                self.frame_ring = SharedFrameRing()
+            except (OSError, ValueError) as e:
+                print(f"共有メモリ出力を開始できませんでした: {e}")
+        self.frame_server = None
+        if FRAME_SERVER_ENABLED:
+            try:
+                self.frame_server = FrameServer()
+                self.frame_server.start()
+                print(f"フレーム配信: http://{FRAME_SERVER_HOST}:{FRAME_SERVER_PORT}/")
+            except OSError as e:
+                print(f"フレーム配信を開始できませんでした: {e}")
+                self.frame_server = None
         self.drawer = ScoreboardDrawer(); self._update_job = None
+        self.render_process = None
+        self._render_poll_job = None
+        if RENDER_PROCESS_ENABLED:
+            try:
+                self.render_process = RenderProcess()
+                self.render_process.start()
+            except (OSError, ValueError) as e:
+                print(f"描画プロセスを開始できませんでした (このプロセスで描画します): {e}")
+                self.render_process = None
+        self.outputs = OutputManager()
+        if self.frame_server is not None or self.frame_ring is not None:
+            self.outputs.add(OutputSink("stream", OUTPUT_STREAM_KIND, self._publish_frame))
+        self.control_server = None
+        self._control_state = {}
+        self._control_state_seq = 0
+        self._control_changed = {}
+        self._control_busy = False
+        if CONTROL_API_ENABLED:
+            try:
+                self.control_server = ControlServer()
+                self.control_server.start()
+                base = f"{CONTROL_API_HOST}:{self.control_server.port}"
+                token = urllib.parse.quote(self.control_server.token)
+                print(f"操作API: ws://{base}/ws?token={token}")
+                print(f"Web版スコアボード: http://{base}/scoreboard?token={token}")
+            except OSError as e:
+                print(f"操作APIを開始できませんでした: {e}")
+                self.control_server = None
+        self.buzzer = BuzzerArbiter()
+        self.buzz_idx = None
+        self._buzzer_version = -1
+        self.buzzer_input = None
+        self.buzzer_keyboard = None
+        self.lbl_buzzer = None
+        if BUZZER_ENABLED:
+            self.buzzer_input = BuzzerInput(self.buzzer)
+            self.buzzer_keyboard = KeyboardBuzzerDevice(self.buzzer)
+            if BUZZER_SERIAL_PORT:
+                try:
+                    self.buzzer_input.add(SerialBuzzerDevice())
+                except (OSError, ValueError) as e:
+                    print(f"早押し機器を開けませんでした: {e}")
+        self.protocol("WM_DELETE_WINDOW", self._on_main_window_close)
         self.setup_ui()
         self.refresh_ui()
-
-    def _read_rows_from_csv(self, fp):
-        last_error = None
-        for enc in ["utf-8-sig", "shift_jis", "cp932", "utf-8"]:
+        if self.buzzer_input is not None:
+            for seat, key in enumerate(BUZZER_KEYS):
+                self.bind_all(f"<KeyPress-{key}>", lambda e, seat=seat: self.buzzer_keyboard.press(seat, e.time))
+                # 離したときの時刻も時計合わせに使う
+                self.bind_all(f"<KeyRelease-{key}>", lambda e: self.buzzer_keyboard.event_time_ns(e.time))
+            self.after(BUZZER_POLL_MS, self._poll_buzzer)
+        if QUESTION_WATCH_ENABLED:
+            self.after(QUESTION_WATCH_INTERVAL_MS, self._poll_question_file)
+        if self.control_server is not None:
+            self._publish_control_state()
+            self.after(CONTROL_API_POLL_MS, self._poll_control_commands)
+
+    def _detect_csv_encoding(self, buf):
+        """BOMと先頭サンプルだけで文字コードを決め、(CSV_ENCODINGS 内の位置, 本文の開始位置) を返す。
+        サンプルより後ろは検証しない (読みながら確かめ、解読できなければ _read_rows_from_csv が読み直す)"""
+        if buf[:3] == codecs.BOM_UTF8:
+            return None, 3
+        size = len(buf)
+        sample = buf[:CSV_ENCODING_SAMPLE_BYTES]
+        for k, enc in enumerate(CSV_ENCODINGS):
             try:
-                rows = []
-                with open(fp, "r", encoding=enc, newline="") as f:
-                    reader = csv.reader(f)
-                    for row in reader:
-                        if not row:
-                            continue
-                        if len(row) == 1:
-                            row = row[0].replace('"', "").split(",")
-                        rows.append([str(c).strip() for c in row])
-                return rows
-            except Exception as e:
-                last_error = e
-        raise last_error if last_error else ValueError("CSVの読み込みに失敗しました。")
+                codecs.getincrementaldecoder(enc)().decode(sample, final=(size <= CSV_ENCODING_SAMPLE_BYTES))
+                return k, 0
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("CSVの文字コードを判定できませんでした。(UTF-8 / Shift_JIS / CP932)")
+
+    def _read_rows_from_csv(self, fp, max_rows=None, max_cols=None, job=None, digest=None):
+        """ファイルを一度だけメモリマップし、1回の読み進めで文字コードを確かめながら行を逐次返すジェネレータ。
+        途中で解読できなくなったら次の文字コードで先頭から読み直す。読むのをやめても (ジェネレータが捨てられた時点で)
+        マップとファイルを閉じる"""
+        with open(fp, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if job is not None:
+                    job.total_bytes = len(mm)
+                k, start = self._detect_csv_encoding(mm)
+                # BOM付きは UTF-8 と確定しているので読み直さない
+                encodings = ["utf-8"] if k is None else CSV_ENCODINGS[k:]
+                yielded = 0
+                ascii_only = True
+                for n, enc in enumerate(encodings):
+                    raw = _MmapRawReader(mm, start, digest)
+                    text = io.TextIOWrapper(io.BufferedReader(raw, FILE_READ_CHUNK_BYTES), encoding=enc, newline="")
+                    seen = 0
+                    try:
+                        for row in csv.reader(text):
+                            if not row:
+                                continue
+                            seen += 1
+                            if seen <= yielded:
+                                continue  # 読み直す前に返した行
+                            if ascii_only:
+                                ascii_only = all(c.isascii() for c in row)
+                            if len(row) == 1:
+                                row = row[0].replace('"', "").split(",")
+                            if job is not None:
+                                job.tick(raw.pos)
+                            yield [str(c).strip() for c in row[:max_cols]]
+                            yielded += 1
+                            if max_rows is not None and yielded >= max_rows:
+                                return
+                        if digest is not None:
+                            digest.feed(mm, len(mm))
+                        return
+                    except UnicodeDecodeError as e:
+                        # 返し済みの行が ASCII だけなら次の文字コードでも同じ行になるので、読み飛ばして続きを返せる
+                        if not ascii_only or n + 1 == len(encodings):
+                            raise ValueError("CSVの文字コードを判定できませんでした。(UTF-8 / Shift_JIS / CP932)") from e
 
     def _col_idx_from_cell_ref(self, ref):
         m = re.match(r"([A-Za-z]+)", ref or "")
@@ -1042,20 +3859,40 @@ class QuizApp(tk.Tk):
             idx = idx * 26 + (ord(ch) - ord("A") + 1)
         return idx - 1
 
-    def _read_rows_from_xlsx(self, fp):
+    def _load_xlsx_shared_strings(self, z, ns_main):
+        """sharedStrings.xml を逐次読みし、1本の文字列と開始位置の配列に詰めて保持する"""
+        si_tag, t_tag = f"{ns_main}si", f"{ns_main}t"
+        buf = io.StringIO()
+        offsets = array("Q", [0])
+        pos = 0
+        root = None
+        with z.open("xl/sharedStrings.xml") as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if root is None:
+                    root = elem
+                if event == "end" and elem.tag == si_tag:
+                    txt = "".join((t.text or "") for t in elem.iter(t_tag))
+                    buf.write(txt)
+                    pos += len(txt)
+                    offsets.append(pos)
+                    root.clear()
+        return buf.getvalue(), offsets
+
+    def _read_rows_from_xlsx(self, fp, max_rows=None, max_cols=None, job=None, digest=None):
+        """先頭シートを iterparse で1行ずつ読み、処理済みの要素は都度破棄しながら行を返すジェネレータ。
+        ファイルは一度だけメモリマップし、digest があれば読み終えた後に同じマップからハッシュを取る"""
         ns_main = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
         ns_rel_doc = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
         ns_rel_pkg = "{http://schemas.openxmlformats.org/package/2006/relationships}"
 
-        with zipfile.ZipFile(fp, "r") as z:
+        with open(fp, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                zipfile.ZipFile(io.BufferedReader(_MmapRawReader(mm), FILE_READ_CHUNK_BYTES), "r") as z:
             names = set(z.namelist())
 
-            shared_strings = []
+            ss_blob, ss_offsets = "", array("Q", [0])
             if "xl/sharedStrings.xml" in names:
-                ss_root = ET.fromstring(z.read("xl/sharedStrings.xml"))
-                for si in ss_root.findall(f"{ns_main}si"):
-                    txt = "".join((t.text or "") for t in si.iter(f"{ns_main}t"))
-                    shared_strings.append(txt)
+                ss_blob, ss_offsets = self._load_xlsx_shared_strings(z, ns_main)
+            ss_count = len(ss_offsets) - 1
 
             sheet_path = None
             if "xl/workbook.xml" in names and "xl/_rels/workbook.xml.rels" in names:
@@ -1079,45 +3916,116 @@ class QuizApp(tk.Tk):
                     raise ValueError("xlsx内にワークシートが見つかりません。")
                 sheet_path = candidates[0]
 
-            ws_root = ET.fromstring(z.read(sheet_path))
-            rows = []
-            for r in ws_root.findall(f".//{ns_main}row"):
-                row_vals = []
-                for c in r.findall(f"{ns_main}c"):
-                    col_idx = self._col_idx_from_cell_ref(c.attrib.get("r", "")) 
-                    if col_idx is None:
-                        col_idx = len(row_vals)
-                    while len(row_vals) < col_idx:
-                        row_vals.append("")
-
-                    t = c.attrib.get("t")
-                    v = c.find(f"{ns_main}v")
-                    is_elem = c.find(f"{ns_main}is")
-                    value = ""
-                    if t == "s":
-                        try:
-                            si = int(v.text) if v is not None and v.text is not None else -1
-                            value = shared_strings[si] if 0 <= si < len(shared_strings) else ""
-                        except Exception:
-                            value = ""
-                    elif t == "inlineStr":
-                        value = "".join((t_elem.text or "") for t_elem in is_elem.iter(f"{ns_main}t")) if is_elem is not None else ""
-                    elif t == "b":
-                        value = "TRUE" if (v is not None and v.text == "1") else "FALSE"
-                    else:
-                        value = v.text if v is not None and v.text is not None else ""
-
-                    row_vals.append(str(value).strip())
-
-                if row_vals:
-                    rows.append(row_vals)
-            return rows
-
-    def _read_rows_from_file(self, fp):
+            row_tag, c_tag = f"{ns_main}row", f"{ns_main}c"
+            v_tag, is_tag, t_tag = f"{ns_main}v", f"{ns_main}is", f"{ns_main}t"
+            sheet_data_tag = f"{ns_main}sheetData"
+            sheet_data = None
+            yielded = 0
+            if job is not None:
+                job.total_bytes = z.getinfo(sheet_path).file_size
+            with z.open(sheet_path) as f:
+                for event, elem in ET.iterparse(f, events=("start", "end")):
+                    if event == "start":
+                        if elem.tag == sheet_data_tag:
+                            sheet_data = elem
+                        continue
+                    if elem.tag != row_tag:
+                        continue
+
+                    row_vals = []
+                    for c in elem.iter(c_tag):
+                        col_idx = self._col_idx_from_cell_ref(c.attrib.get("r", ""))
+                        if col_idx is None:
+                            col_idx = len(row_vals)
+                        if max_cols is not None and col_idx >= max_cols:
+                            if len(row_vals) < max_cols:
+                                row_vals.extend([""] * (max_cols - len(row_vals)))
+                            break
+                        if len(row_vals) < col_idx:
+                            row_vals.extend([""] * (col_idx - len(row_vals)))
+
+                        t = c.attrib.get("t")
+                        v = c.find(v_tag)
+                        value = ""
+                        if t == "s":
+                            try:
+                                si = int(v.text) if v is not None and v.text is not None else -1
+                                value = ss_blob[ss_offsets[si]:ss_offsets[si + 1]] if 0 <= si < ss_count else ""
+                            except Exception:
+                                value = ""
+                        elif t == "inlineStr":
+                            is_elem = c.find(is_tag)
+                            value = "".join((t_elem.text or "") for t_elem in is_elem.iter(t_tag)) if is_elem is not None else ""
+                        elif t == "b":
+                            value = "TRUE" if (v is not None and v.text == "1") else "FALSE"
+                        else:
+                            value = v.text if v is not None and v.text is not None else ""
+
+                        row_vals.append(str(value).strip())
+
+                    elem.clear()
+                    if sheet_data is not None:
+                        sheet_data.clear()
+                    if job is not None:
+                        job.tick(f.tell())
+                    if row_vals:
+                        yield row_vals
+                        yielded += 1
+                        if max_rows is not None and yielded >= max_rows:
+                            return
+            if digest is not None:
+                digest.feed(mm, len(mm))
+
+    def _read_rows_from_file(self, fp, max_rows=None, max_cols=None, job=None, digest=None):
         ext = os.path.splitext(fp)[1].lower()
         if ext == ".xlsx":
-            return self._read_rows_from_xlsx(fp)
-        return self._read_rows_from_csv(fp)
+            return self._read_rows_from_xlsx(fp, max_rows=max_rows, max_cols=max_cols, job=job, digest=digest)
+        return self._read_rows_from_csv(fp, max_rows=max_rows, max_cols=max_cols, job=job, digest=digest)
+
+    def _read_rows_cached(self, fp, max_cols, job=None):
+        """サイドカーキャッシュが有効ならそれを使い、無ければ解析して書き出す。
+        ワーカースレッドからも呼ぶので描画側の状態には触れず、(TableStore, スタンプ, 折り返し結果) を返す"""
+        if not QUESTION_CACHE_ENABLED:
+            st = os.stat(fp)
+            table = TableStore.from_rows(self._read_rows_from_file(fp, max_cols=max_cols, job=job), max_cols)
+            return table, (st.st_size, st.st_mtime_ns, None), {}
+        hit = self.question_cache.load(fp, max_cols)
+        if hit is not None:
+            table, stamp = hit
+            return table, stamp, self.question_cache.load_layouts(fp, stamp)
+        # 行は読んだそばから書き出し、元ファイルのハッシュも同じ読み進めで取る
+        st = os.stat(fp)
+        digest = _MmapDigest()
+        rows = self._read_rows_from_file(fp, max_cols=max_cols, job=job, digest=digest)
+        table, stamp = self.question_cache.save(fp, max_cols, rows, st=st, digest=digest)
+        return table, stamp, {}
+
+    def _save_question_layouts(self):
+        """表示中に計算した折り返し結果を、読込中の問題ファイルのキャッシュへ書き足す。
+        折り返しキャッシュは問題ファイルを読み込むたびに空にしているので、中身はすべてこのファイルのもの"""
+        if not QUESTION_CACHE_ENABLED or not self.questions_path:
+            return
+        if not self.question_cache.is_current(self.questions_path, self.questions_stamp):
+            return
+        layouts = self.drawer.layout_cache
+        if len(layouts) <= self._questions_layout_count:
+            return
+        if self.question_cache.save_layouts(self.questions_path, self.questions_stamp, layouts):
+            self._questions_layout_count = len(layouts)
+
+    def _on_main_window_close(self):
+        self._save_question_layouts()
+        if self.frame_server is not None:
+            self.frame_server.stop()
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+        if self.render_process is not None:
+            self.render_process.stop()
+        if self.control_server is not None:
+            self.control_server.stop()
+        if self.buzzer_input is not None:
+            self.buzzer_input.stop()
+        self.destroy()
 
     def _parse_question_no(self, raw):
         txt = str(raw or "").strip().translate(str.maketrans("０１２３４５６７８９", "0123456789"))
@@ -1216,10 +4124,70 @@ class QuizApp(tk.Tk):
             self.next_q_manual_mode_var.set(True)
         self._update_question_nav_status()
 
-    def _build_view_frame(self, parent, fill="x", expand=False, before=None):
-        if self.view_frame is not None:
-            self.view_frame.destroy()
-        frame = tk.Frame(parent, bg="#222", height=VIEW_FRAME_HEIGHT)
+    def _start_question_index(self, questions):
+        """問題集の検索索引を別スレッドで作る。作成途中でも、索引済みの範囲で検索できる"""
+        index = QuestionSearchIndex(len(questions))
+        self.question_search = index
+
+        def build():
+            for i, (q, a) in enumerate(questions.pairs()):
+                if self.question_search is not index:
+                    return
+                index.add(i, q, a)
+
+        threading.Thread(target=build, name="question-index", daemon=True).start()
+
+    def open_question_search_window(self):
+        if not self.questions:
+            messagebox.showwarning("問題未読込", "先に「問題読込」で問題を読み込んでください。")
+            return
+        win = tk.Toplevel(self)
+        win.title("問題検索")
+        win.geometry("760x360")
+        win.transient(self)
+
+        # 問題文・解答のキーワードで検索し、選んだ問題を「次No指定」に入れる
+        f_search = tk.Frame(win)
+        f_search.pack(fill="x", padx=10, pady=(10, 4))
+        tk.Label(f_search, text="キーワード:").pack(side="left")
+        search_var = tk.StringVar(value="")
+        e_search = tk.Entry(f_search, width=30, textvariable=search_var)
+        e_search.pack(side="left", padx=(2, 8))
+        lbl_status = tk.Label(f_search, text="", font=self.small_font)
+        lbl_status.pack(side="left")
+        lb_search = tk.Listbox(win, height=14)
+        lb_search.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        search_results = []
+
+        def on_search(_event=None):
+            index = self.question_search
+            questions = self.questions
+            search_results[:] = index.search(search_var.get(), questions)
+            lb_search.delete(0, "end")
+            for idx in search_results:
+                qa = questions[idx]
+                lb_search.insert("end", f"{idx + 1}: {qa['q']} / A. {qa['a']}")
+            status = f"{len(search_results)}件"
+            if not index.ready:
+                status += f" (索引作成中 {index.count:,}/{index.total:,})"
+            lbl_status.config(text=status)
+
+        def on_pick(_event=None):
+            sel = lb_search.curselection()
+            if not sel:
+                return
+            self.next_q_target_var.set(str(search_results[sel[0]] + 1))
+            self.apply_next_question_target()
+
+        e_search.bind("<KeyRelease>", on_search)
+        e_search.bind("<Return>", on_search)
+        lb_search.bind("<Double-Button-1>", on_pick)
+        lb_search.bind("<Return>", on_pick)
+        e_search.focus_set()
+
+    def _build_output_frame(self, parent, sink_name, kind, height=VIEW_FRAME_HEIGHT, fill="x", expand=False, before=None):
+        """画像を表示する枠を作り、出力先として登録する"""
+        frame = tk.Frame(parent, bg="#222", height=height)
         if before is not None:
             frame.pack(side="top", fill=fill, expand=expand, before=before)
         else:
@@ -1228,9 +4196,71 @@ class QuizApp(tk.Tk):
         label = tk.Label(frame, bg="#222")
         label.place(relx=0.5, rely=0.5, anchor="center")
         frame.bind("<Configure>", lambda e: self.schedule_image_update())
-        self.view_frame = frame
-        self.preview_label = label
+
+        def size():
+            w, h = frame.winfo_width(), frame.winfo_height()
+            return (w if w > 1 else 1400, h if h > 1 else 300)
+
+        def deliver(img):
+            label.tk_img = ImageTk.PhotoImage(img)
+            label.config(image=label.tk_img)
+
+        self.outputs.add(OutputSink(sink_name, kind, deliver, size=size, flatten=True,
+                                    active=lambda: frame.winfo_exists()))
         self.schedule_image_update()
+        return frame, label
+
+    def _build_view_frame(self, parent, fill="x", expand=False, before=None):
+        if self.view_frame is not None:
+            self.view_frame.destroy()
+        sink_name = "venue" if parent is self.display_window else "preview"
+        self.view_frame, self.preview_label = self._build_output_frame(parent, sink_name, "main", fill=fill, expand=expand, before=before)
+
+    def _build_control_preview(self):
+        """表示分離中に操作画面へ残す小さなプレビュー"""
+        if self.control_preview_frame is not None and self.control_preview_frame.winfo_exists():
+            return
+        before = self.control_stage if self.control_stage and self.control_stage.winfo_manager() else None
+        self.control_preview_frame, _ = self._build_output_frame(self, "preview", "main", height=CONTROL_PREVIEW_HEIGHT, before=before)
+
+    def _destroy_control_preview(self):
+        if self.control_preview_frame is not None:
+            self.control_preview_frame.destroy()
+        self.control_preview_frame = None
+        self.outputs.remove("preview")
+
+    def toggle_host_timer_window(self):
+        """司会者用のタイマーだけの画面 (コンフィデンスモニター) を開閉する"""
+        if self.host_timer_var.get():
+            if self.host_window is None or not self.host_window.winfo_exists():
+                self.host_window = tk.Toplevel(self)
+                self.host_window.title(HOST_TIMER_WINDOW_TITLE)
+                self.host_window.geometry(HOST_TIMER_WINDOW_GEOMETRY)
+                self.host_window.protocol("WM_DELETE_WINDOW", self._on_host_timer_window_close)
+                self._build_output_frame(self.host_window, "host", "timer", fill="both", expand=True)
+        else:
+            self._on_host_timer_window_close()
+
+    def _on_host_timer_window_close(self):
+        self.host_timer_var.set(False)
+        self.outputs.remove("host")
+        if self.host_window is not None and self.host_window.winfo_exists():
+            self.host_window.destroy()
+        self.host_window = None
+
+    def show_output_stats(self):
+        text = self.outputs.describe()
+        rp = self.render_process
+        if rp is not None:
+            times = " ".join(f"{k} {v:.1f}ms" for k, v in rp.render_ms.items())
+            text += f"\n描画プロセス: 再起動 {rp.restarts}回 / 失敗 {rp.errors}回 / {times}"
+        messagebox.showinfo("出力状況", text)
+
+    def _publish_frame(self, im):
+        if self.frame_server is not None:
+            self.frame_server.publish(im)
+        if self.frame_ring is not None:
+            self.frame_ring.write(im)
 
     def _open_display_window(self):
         if self.display_window is None or not self.display_window.winfo_exists():
@@ -1256,6 +4286,11 @@ class QuizApp(tk.Tk):
     def toggle_timer_visibility(self):
         self.schedule_image_update()
 
+    def toggle_timer_tenths(self):
+        if self.timer.running:
+            self._schedule_timer_tick()
+        self.refresh_ui()
+
     def toggle_question_visibility(self):
         self.schedule_image_update()
 
@@ -1264,8 +4299,12 @@ class QuizApp(tk.Tk):
             self.view_frame.destroy()
         win = self._open_display_window()
         self._build_view_frame(win, fill="both", expand=True)
+        if CONTROL_PREVIEW_WITH_DISPLAY:
+            self._build_control_preview()
 
     def _embed_display_window(self):
+        self._destroy_control_preview()
+        self.outputs.remove("venue")
         if self.view_frame is not None:
             self.view_frame.destroy()
         if self.display_window is not None and self.display_window.winfo_exists():
@@ -1350,7 +4389,7 @@ class QuizApp(tk.Tk):
         self.btn_3rd = tk.Button(nav, text="3rd選択", width=8, bg="#55acee", fg="white", command=lambda: self.switch_tab("3RD"))
         self.btn_3rd.pack(side="left", padx=5, pady=5); self.tab_btns.append(self.btn_3rd)
         self.course_btns = []
-        for c_name in ["10by10", "Swedish10", "Freeze10", "10up-down"]:
+        for c_name in MODE_COURSES:
             b = tk.Button(nav, text=c_name, width=8, bg="#ff8c00", fg="white", command=lambda n=c_name: self.switch_tab(n))
             b.pack(side="left", padx=1, pady=5); self.course_btns.append(b)
         
@@ -1370,14 +4409,22 @@ class QuizApp(tk.Tk):
         self.tool.pack(side="top", fill="x")
         tk.Button(self.tool, text="48名読込", command=self.load_all_csv).pack(side="left", padx=5)
         tk.Button(self.tool, text="問題読込", command=self.load_questions_csv).pack(side="left", padx=5)
+        tk.Button(self.tool, text="筆記採点", command=self.grade_qualifier).pack(side="left", padx=5)
         
+        tk.Checkbutton(self.tool, text="透過(RGBA)", variable=self.obs_transparent_var,
+                       command=self.toggle_obs_overlay, bg="#eee").pack(side="right", padx=(0, 10))
         tk.Checkbutton(self.tool, text="OBS合成UI", variable=self.obs_overlay_var,
                        command=self.toggle_obs_overlay, bg="#eee").pack(side="right", padx=10)
         tk.Checkbutton(self.tool, text="表示分離", variable=self.display_separate_var,
                        command=self.toggle_display_window, bg="#eee").pack(side="right", padx=10)
+        tk.Checkbutton(self.tool, text="司会タイマー", variable=self.host_timer_var,
+                       command=self.toggle_host_timer_window, bg="#eee").pack(side="right", padx=(10, 0))
+        tk.Button(self.tool, text="出力状況", command=self.show_output_stats).pack(side="right", padx=5)
         timer_f = tk.Frame(self.tool, bg="#ddd", padx=5); timer_f.pack(side="right", padx=10)
         tk.Checkbutton(timer_f, text="表示", variable=self.timer_visible_var,
                        command=self.toggle_timer_visibility, bg="#ddd").pack(side="right", padx=(8, 0))
+        tk.Checkbutton(timer_f, text="1/10秒", variable=self.timer_tenths_var,
+                       command=self.toggle_timer_tenths, bg="#ddd").pack(side="right", padx=(8, 0))
         tk.Checkbutton(timer_f, text="問題表示", variable=self.question_visible_var,
                        command=self.toggle_question_visibility, bg="#ddd").pack(side="right", padx=(8, 0))
         tk.Label(timer_f, text="Timer:", bg="#ddd").pack(side="left")
@@ -1409,6 +4456,22 @@ class QuizApp(tk.Tk):
         self.entry_next_q_no.bind("<Return>", lambda _e: self.apply_next_question_target())
         self.btn_apply_next_q = tk.Button(prog, text="反映", width=6, command=self.apply_next_question_target)
         self.btn_apply_next_q.pack(side="left", padx=(0, 3))
+        tk.Button(prog, text="問題検索", width=8, command=self.open_question_search_window).pack(side="left", padx=(0, 3))
+
+        bulk = tk.Frame(self.score_ctrls, bg="#eee"); bulk.pack(side="top", fill="x")
+        tk.Label(bulk, text="選択した参加者に一括:", bg="#eee").pack(side="left", padx=(5, 3))
+        tk.Button(bulk, text="O", bg="#dfd", width=3, command=lambda: self.act_selected("o")).pack(side="left", padx=1)
+        tk.Button(bulk, text="X", bg="#fdd", width=3, command=lambda: self.act_selected("x")).pack(side="left", padx=1)
+        tk.Button(bulk, text="W", bg="#ffd700", width=3, command=lambda: self.act_win_lose_selected("win")).pack(side="left", padx=1)
+        tk.Button(bulk, text="L", bg="#888", width=3, command=lambda: self.act_win_lose_selected("lose")).pack(side="left", padx=1)
+        tk.Button(bulk, text="選択解除", command=self.clear_player_selection).pack(side="left", padx=(6, 0))
+        if BUZZER_ENABLED:
+            buzz = tk.Frame(self.score_ctrls, bg="#eee"); buzz.pack(side="top", fill="x")
+            tk.Label(buzz, text="早押し:", bg="#eee").pack(side="left", padx=(5, 3))
+            tk.Button(buzz, text="受付開始", command=self.arm_buzzer).pack(side="left", padx=1)
+            tk.Button(buzz, text="停止", command=self.disarm_buzzer).pack(side="left", padx=1)
+            self.lbl_buzzer = tk.Label(buzz, text="停止中", bg="#eee", anchor="w")
+            self.lbl_buzzer.pack(side="left", padx=(6, 0))
         
         self.btn_grid_f = tk.Frame(self.score_ctrls, bg="#eee"); self.btn_grid_f.pack(side="top", fill="x")
         self.player_widgets = []
@@ -1423,8 +4486,10 @@ class QuizApp(tk.Tk):
             tk.Button(b_row, text="R", bg="#eee", width=2, command=lambda x=i: self.act(x, "r")).pack(side="left", expand=True)
             tk.Button(b_row, text="W", bg="#ffd700", width=2, command=lambda x=i: self.act_win_lose(x, "win")).pack(side="left", expand=True)
             tk.Button(b_row, text="L", bg="#888", width=2, command=lambda x=i: self.act_win_lose(x, "lose")).pack(side="left", expand=True)
+            sel_var = tk.BooleanVar(value=False)
+            tk.Checkbutton(b_row, variable=sel_var, bg="white").pack(side="left")
 
-            self.player_widgets.append({"name": n, "score": s, "frame": f})
+            self.player_widgets.append({"name": n, "score": s, "frame": f, "selected": sel_var})
 
         display_ctrl = tk.LabelFrame(self.course_ctrls, text="中央モニター表示操作", bg="#eee", padx=10, pady=5)
         display_ctrl.pack(side="top", fill="x", padx=10, pady=5)
@@ -1492,23 +4557,13 @@ class QuizApp(tk.Tk):
                 p = players[i]
                 self.player_widgets[i]["frame"].grid()
                 
-                status_suffix = self._get_status_suffix(p)
+                view = self.drawer.get_player_view(p, self._get_view_mode())
+                bg = BUZZER_HIGHLIGHT_COLOR if i == self.buzz_idx else "white"
+                self.player_widgets[i]["frame"].config(bg=bg)
+                self.player_widgets[i]["name"].config(text=f"{p['rank']} {p['name']}{view['suffix']}", bg=bg)
+                txt = view["panel_text"]
                 
-                self.player_widgets[i]["name"].config(text=f"{p['rank']} {p['name']}{status_suffix}")
-                
-                txt = ""
-                if self.mode == "10by10": txt = f"{p['10by10_o'] * p['10by10_x']} ({p['10by10_o']}○{p['10by10_x']}×)"
-                elif self.mode == "Swedish10":
-                    nxt = get_swedish10_wrong_increment(p["Swedish10_o"])
-                    txt = f"{p['Swedish10_o']}○ {p['Swedish10_x']}× (+{nxt})"
-                elif self.mode == "Freeze10": txt = f"{p['Freeze10_o']}○ {p['Freeze10_x']}×"
-                elif self.mode == "10up-down": txt = f"{p['10up-down_score']}pts {p['10up-down_wrong']}×"
-                elif self.mode == "SEMI": txt = f"{p['semi_score']} pts"
-                elif self.mode == "FINAL": txt = f"{p['final_sets_won']}Sets ({p['final_curr_o']}○{p['final_curr_x']}×)"
-                elif self.mode == "EXTRA": txt = f"{p['extra_score']}pts {p['extra_wrong']}×"
-                else: txt = f"{p['score']}pts / {p['wrong']}×"
-                
-                self.player_widgets[i]["score"].config(text=txt)
+                self.player_widgets[i]["score"].config(text=txt, bg=bg)
             else:
                 self.player_widgets[i]["frame"].grid_remove()
 
@@ -1527,39 +4582,73 @@ class QuizApp(tk.Tk):
             m = int(self.entry_min.get())
             s = int(self.entry_sec.get())
             self.timer_seconds = m * 60 + s
+            self.timer_tenths = self.timer_seconds * 10
+            self.timer.set(self.timer_seconds)
+            if self.timer_running:
+                self._schedule_timer_tick()
             self._set_timer_blink_active(self.timer_seconds == 0 and not self.timer_running)
             self.refresh_ui()
         except: pass
 
     def toggle_timer(self):
-        self.timer_running = not self.timer_running
+        if self.timer.running:
+            self.timer.pause()
+        else:
+            self.timer.start()
+        self.timer_running = self.timer.running
         if self.timer_running:
             self._set_timer_blink_active(False)
             self.timer_blink_on = True
-            self.update_timer_loop()
-        elif self.timer_seconds == 0:
-            self._set_timer_blink_active(True)
+            self._schedule_timer_tick()
+        else:
+            self._cancel_timer_tick()
+            if self.timer_seconds == 0:
+                self._set_timer_blink_active(True)
 
     def reset_timer(self):
+        self.timer.pause()
         self.timer_running = False
+        self._cancel_timer_tick()
         self._set_timer_blink_active(False)
         self.set_timer_val()
         self.refresh_ui()
 
-    def update_timer_loop(self):
-        if self.timer_running:
-            if self.timer_seconds > 0:
-                self.timer_seconds -= 1
-                self.refresh_ui()
-                if self.timer_seconds == 0:
-                    self.timer_running = False
-                    self._set_timer_blink_active(True)
-                else:
-                    self.after(1000, self.update_timer_loop)
-            else:
-                self.timer_running = False 
-                self._set_timer_blink_active(True)
-                self.refresh_ui()
+    # --- タイマー: 残り時間は CountdownTimer の締め切りから計算し、表示が変わる瞬間にだけ起きる ---
+    def _timer_tenths_active(self):
+        if not self.timer_tenths_var.get() or self.mode not in MODE_COURSES + ["SEMI", "TIMER_ONLY"]:
+            return False
+        return TIMER_TENTHS_LAST_SEC <= 0 or self.timer_seconds <= TIMER_TENTHS_LAST_SEC
+
+    def _schedule_timer_tick(self):
+        self._cancel_timer_tick()
+        step = 0.1 if self._timer_tenths_active() else 1.0
+        self._timer_job = self.after(int(self.timer.until_change(step) * 1000) + 2, self._timer_tick)
+
+    def _cancel_timer_tick(self):
+        if self._timer_job:
+            self.after_cancel(self._timer_job)
+            self._timer_job = None
+
+    def _timer_tick(self):
+        self._timer_job = None
+        if not self.timer.running:
+            return
+        tenths = self.timer.display_units(0.1)
+        seconds = (tenths + 9) // 10
+        if seconds <= 0:
+            self.timer.pause()
+            self.timer_running = False
+            self._set_timer_blink_active(True)
+        seconds_changed = seconds != self.timer_seconds
+        tenths_changed = tenths != self.timer_tenths
+        self.timer_seconds, self.timer_tenths = seconds, tenths
+        if seconds_changed:
+            self.refresh_ui()
+        elif tenths_changed and self._timer_tenths_active():
+            # 1/10秒だけの変化は操作パネルを更新せず、描画だけ依頼する (タイマー以外は描き直さない)
+            self.schedule_image_update()
+        if self.timer.running:
+            self._schedule_timer_tick()
 
     def _set_timer_blink_active(self, active):
         if not active:
@@ -1581,19 +4670,18 @@ class QuizApp(tk.Tk):
         self._timer_blink_job = self.after(450, self._timer_blink_tick)
 
     def get_timer_str(self):
+        if self._timer_tenths_active():
+            t = self.timer_tenths
+            return f"{t // 600:02}:{t // 10 % 60:02}.{t % 10}"
         m = self.timer_seconds // 60
         s = self.timer_seconds % 60
         return f"{m:02}:{s:02}"
 
     def update_3rd_list(self):
-        winners = {i:[] for i in range(1, 13)}
-        for g in range(4):
-            for p in self.all_groups_data[g]:
-                if p["win_order"] > 0: winners[p["win_order"]].append(p)
-        selected = []
-        for o in range(1, 13): selected.extend(sorted(winners[o], key=lambda x: x["rank_num"]))
-        while len(selected) < 20: selected.append(get_empty_player(99))
-        self.players_3rd_20 = selected[:20]; self.refresh_ui()
+        self.players_3rd_20 = self.qualifiers.third_round_roster()
+        self.qualifiers.rebuild_courses(self.players_3rd_20)
+        self.tournament_index.set_round("3rd", self.players_3rd_20)
+        self.refresh_ui()
 
     def _semi_round_started(self):
         for p in self.players_semi_9:
@@ -1621,41 +4709,14 @@ class QuizApp(tk.Tk):
             p["win_order_semi"] = 0
             p["semi_status"] = "active"
             p["semi_exit_set"] = 0
-        return p
-
-    def _get_3rd_winners_for_semi(self):
-        course_win_fields = [
-            "win_order_10by10",
-            "win_order_Swedish10",
-            "win_order_Freeze10",
-            "win_order_10up-down",
-        ]
-        winners = []
-        seen_rank = set()
-        for wf in course_win_fields:
-            cands = [p for p in self.players_3rd_20 if p.get(wf, 0) > 0 and p.get("rank_num", 99) != 99]
-            cands.sort(key=lambda p: (p.get(wf, 999), p.get("rank_num", 999)))
-            for p in cands:
-                r = p.get("rank_num", 99)
-                if r in seen_rank:
-                    continue
-                seen_rank.add(r)
-                winners.append(p)
-        return winners
-
-    def _get_extra_winner_for_semi(self):
-        cands = [p for p in self.players_extra_12 if p.get("win_order_extra", 0) > 0 and p.get("rank_num", 99) != 99]
-        if not cands:
-            return None
-        cands.sort(key=lambda p: (p.get("win_order_extra", 999), p.get("rank_num", 999)))
-        return cands[0]
+        return touch_player(p)
 
     def sync_semi_players_from_winners(self, force=False):
         if not force and self._semi_round_started():
             return
 
-        third_winners = self._get_3rd_winners_for_semi()
-        extra_winner = self._get_extra_winner_for_semi()
+        third_winners = self.qualifiers.semi_winners()
+        extra_winner = self.qualifiers.extra_winner
         if not third_winners and extra_winner is None and not force:
             return
 
@@ -1671,6 +4732,8 @@ class QuizApp(tk.Tk):
             new_list[8] = self._build_semi_slot_player(extra_winner, prev_state=prev)
 
         self.players_semi_9 = new_list
+        self.qualifiers.update_semi(self.players_semi_9)
+        self.tournament_index.set_round("SEMI", self.players_semi_9)
 
     def select_course_3rd(self, p_idx):
         c_name = self.cb_list[p_idx].get()
@@ -1686,10 +4749,7 @@ class QuizApp(tk.Tk):
         self.refresh_ui()
 
     def reset_final_set(self):
-        for p in self.players_final_3:
-            p["final_curr_o"] = 0
-            p["final_curr_x"] = 0
-            p["final_set_lost"] = False
+        ROUND_FORMATS["FINAL"].reset_set(self.players_final_3)
         self.refresh_ui()
 
     def get_current_final_set_index(self):
@@ -1743,10 +4803,7 @@ class QuizApp(tk.Tk):
         win.grab_set()
         
         current_list = self.players_semi_9 if self.mode == "SEMI" else self.players_extra_12
-        rank_to_player = {}
-        for g in self.all_groups_data:
-            for pl in g:
-                rank_to_player[pl.get("rank_num")] = pl
+        index = self.tournament_index
         entries = []
         is_extra = (self.mode == "EXTRA")
         
@@ -1754,8 +4811,8 @@ class QuizApp(tk.Tk):
             txt = str(rank_text or "").strip()
             if not txt.isdigit():
                 return "---"
-            src = rank_to_player.get(int(txt))
-            if not src or src.get("name", "---") == "---":
+            src = index.get_registered(int(txt))
+            if not src:
                 return "---"
             return src.get("name", "---") or "---"
 
@@ -1763,8 +4820,7 @@ class QuizApp(tk.Tk):
             txt = str(rank_text or "").strip()
             if not txt.isdigit():
                 return False
-            src = rank_to_player.get(int(txt))
-            return bool(src) and src.get("name", "---") != "---"
+            return index.get_registered(int(txt)) is not None
 
         def split_univ_grade(univ_text):
             txt = str(univ_text or "").strip()
@@ -1783,6 +4839,37 @@ class QuizApp(tk.Tk):
             return f"{g}年" if g.isdigit() else g
         
         tk.Label(win, text=f"{self.mode} 手動編集").pack(pady=5)
+
+        # 氏名・大学・番号で参加者を検索し、選んだ番号を直前にフォーカスしていた No. 欄へ入れる
+        f_search = tk.Frame(win)
+        f_search.pack(fill="x", padx=10)
+        tk.Label(f_search, text="検索:").pack(side="left")
+        search_var = tk.StringVar(value="")
+        e_search = tk.Entry(f_search, width=20, textvariable=search_var)
+        e_search.pack(side="left", padx=(2, 8))
+        lb_search = tk.Listbox(f_search, height=4, width=60)
+        lb_search.pack(side="left", fill="x", expand=True)
+        search_results = []
+        target = {"idx": 0}
+
+        def on_search(_event=None):
+            search_results[:] = index.search(search_var.get())
+            lb_search.delete(0, "end")
+            for r in search_results:
+                lb_search.insert("end", index.describe(r))
+
+        def on_pick(_event=None):
+            sel = lb_search.curselection()
+            if not sel or not entries:
+                return
+            item = entries[target["idx"]]
+            item["rank"].delete(0, "end")
+            item["rank"].insert(0, str(search_results[sel[0]]))
+            item["sync"]()
+
+        e_search.bind("<KeyRelease>", on_search)
+        lb_search.bind("<Double-Button-1>", on_pick)
+        lb_search.bind("<Return>", on_pick)
         
         f_list = tk.Frame(win)
         f_list.pack(fill="both", expand=True, padx=10)
@@ -1842,7 +4929,9 @@ class QuizApp(tk.Tk):
                 rank_entry.bind("<KeyRelease>", _sync)
                 rank_entry.bind("<FocusOut>", _sync)
                 _sync()
-            bind_rank_name_sync(e_rank, name_var, e_manual_name, e_manual_univ, e_manual_grade)
+                return _sync
+            rank_sync = bind_rank_name_sync(e_rank, name_var, e_manual_name, e_manual_univ, e_manual_grade)
+            e_rank.bind("<FocusIn>", lambda _e, ix=i: target.__setitem__("idx", ix))
             
             def sel_img(idx=i):
                 fp = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg;*.png;*.jpeg")])
@@ -1876,12 +4965,13 @@ class QuizApp(tk.Tk):
                 "manual_name": e_manual_name,
                 "manual_univ": e_manual_univ,
                 "manual_grade": e_manual_grade,
+                "sync": rank_sync,
             })
             
             if i == 0: first_entry = e_rank
             
         def apply():
-            loaded_check = any(p["name"] != "---" for g in self.all_groups_data for p in g)
+            loaded_check = index.has_registered()
             if self.mode == "SEMI" and not loaded_check:
                 messagebox.showerror("エラー", "まだCSVファイルが読み込まれていません。\n先に「48名読込」を行ってください。")
                 win.destroy()
@@ -1898,8 +4988,8 @@ class QuizApp(tk.Tk):
                 
                 if rank_val.isdigit():
                     r_num = int(rank_val)
-                    src_player = rank_to_player.get(r_num)
-                    if src_player is not None and src_player.get("name", "---") != "---":
+                    src_player = index.get_registered(r_num)
+                    if src_player is not None:
                         player_obj = copy.deepcopy(src_player)
                     elif self.mode == "EXTRA":
                         player_obj = get_empty_player(r_num)
@@ -1931,12 +5021,16 @@ class QuizApp(tk.Tk):
                     player_obj["extra_score"] = s_val
                     player_obj["extra_wrong"] = w_val
                 
-                new_list.append(player_obj)
+                new_list.append(touch_player(player_obj))
             
             if self.mode == "SEMI":
                 self.players_semi_9 = new_list
+                self.qualifiers.update_semi(self.players_semi_9)
+                self.tournament_index.set_round("SEMI", self.players_semi_9)
             else:
                 self.players_extra_12 = new_list
+                self.qualifiers.update_extra(self.players_extra_12)
+                self.tournament_index.set_round("EXTRA", self.players_extra_12)
             
             self.refresh_ui()
             win.destroy()
@@ -1952,6 +5046,8 @@ class QuizApp(tk.Tk):
 
     def switch_tab(self, target):
         self.mode = "SCORE" if isinstance(target, int) else target
+        self.clear_player_selection()
+        self.buzzer.disarm()
         
         self.score_ctrls.pack_forget()
         self.course_ctrls.pack_forget()
@@ -1978,19 +5074,13 @@ class QuizApp(tk.Tk):
                 self.special_ctrl_lbl.config(text="決勝 Triple Seven")
                 self.special_ctrls.pack(side="top", fill="x")
                 self.final_btn_f.pack(side="left")
-                
-                final_candidates = [get_empty_player(99) for _ in range(3)]
-                for p in self.players_semi_9:
-                    if p["semi_status"] == "win":
-                        s_idx = p.get("semi_exit_set", 0)
-                        if 1 <= s_idx <= 3:
-                            final_candidates[s_idx - 1] = p
-                self.players_final_3 = final_candidates
+                self.players_final_3 = self.qualifiers.final_roster()
+                self.tournament_index.set_round("FINAL", self.players_final_3)
 
             elif target == "EXTRA":
                 self.special_ctrl_lbl.config(text="Extra Round 2nd step")
                 self.special_ctrls.pack(side="top", fill="x")
-            elif target not in ["10by10", "Swedish10", "Freeze10", "10up-down"]: 
+            elif target not in MODE_COURSES: 
                 self.current_group_idx = target
             
             self.score_ctrls.pack(fill="both", expand=True)
@@ -2026,7 +5116,7 @@ class QuizApp(tk.Tk):
     def get_current_mode_players(self):
         if self.mode == "TIMER_ONLY":
             return []
-        if self.mode in ["10by10", "Swedish10", "Freeze10", "10up-down"]:
+        if self.mode in MODE_COURSES:
             selected = [self.players_3rd_20[i] for i, c_idx in self.player_selections_3rd.items() if COURSES[c_idx] == self.mode]
             return sorted(selected, key=lambda x: x["rank_num"])[:5]
         elif self.mode == "SEMI": return self.players_semi_9
@@ -2034,337 +5124,443 @@ class QuizApp(tk.Tk):
         elif self.mode == "EXTRA": return self.players_extra_12
         return self.all_groups_data[self.current_group_idx]
 
-    def load_all_csv(self):
-        fp = filedialog.askopenfilename(
+    def _ask_data_file(self):
+        return filedialog.askopenfilename(
             filetypes=[
                 ("Data Files", "*.csv;*.xlsx"),
                 ("CSV Files", "*.csv"),
                 ("Excel Files", "*.xlsx"),
             ]
         )
-        if not fp: return
-        try:
-            rows = self._read_rows_from_file(fp)
-        except Exception as e:
-            messagebox.showerror("読込エラー", f"ファイルを読み込めませんでした。\n{e}")
+
+    def _start_file_load(self, fp, title, parse, apply, error_msg):
+        """parse(job) をワーカースレッドで実行し、終わったら apply(結果) をTkスレッドで一度に反映する。
+        読込中も操作パネルと表示はそのまま使える"""
+        if self._load_job is not None:
+            messagebox.showinfo("読込中", "別のファイルを読み込んでいます。完了またはキャンセルしてから再度お試しください。")
+            return
+        job = FileLoadJob(fp, parse)
+        self._load_job = job
+
+        win = tk.Toplevel(self)
+        win.title(title)
+        win.geometry("420x120")
+        win.transient(self)
+        win.resizable(False, False)
+        tk.Label(win, text=os.path.basename(fp), font=self.bold_font, anchor="w").pack(fill="x", padx=10, pady=(10, 2))
+        bar = ttk.Progressbar(win, orient="horizontal", mode="determinate", maximum=1000)
+        bar.pack(fill="x", padx=10, pady=2)
+        lbl = tk.Label(win, text="", font=self.small_font, anchor="w")
+        lbl.pack(fill="x", padx=10)
+        btn_cancel = tk.Button(win, text="キャンセル", font=self.default_font, command=job.cancel)
+        btn_cancel.pack(pady=(4, 8))
+        win.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        job.start()
+        self.after(FILE_LOAD_POLL_MS, lambda: self._poll_file_load(job, win, bar, lbl, btn_cancel, apply, error_msg))
+
+    def _poll_file_load(self, job, win, bar, lbl, btn_cancel, apply, error_msg):
+        if not job.done.is_set():
+            total = job.total_bytes
+            if total > 0:
+                bar["value"] = min(1000, int(job.bytes_read * 1000 / total))
+            mb = 1024 * 1024
+            status = f"{job.rows:,} 行 / {job.bytes_read / mb:.1f} MB / {total / mb:.1f} MB"
+            if job.cancel_event.is_set():
+                status += " (キャンセル中...)"
+                btn_cancel.config(state="disabled")
+            lbl.config(text=status)
+            self.after(FILE_LOAD_POLL_MS, lambda: self._poll_file_load(job, win, bar, lbl, btn_cancel, apply, error_msg))
             return
 
+        self._load_job = None
+        if win.winfo_exists():
+            win.destroy()
+        if isinstance(job.error, LoadCancelled):
+            return
+        if job.error is not None:
+            messagebox.showerror("読込エラー", f"{error_msg}\n{job.error}")
+            return
+        apply(job.result)
+
+    def load_all_csv(self):
+        fp = self._ask_data_file()
+        if not fp: return
+
+        def parse(job):
+            entries = []
+            table, _, _ = self._read_rows_cached(fp, 3, job)
+            for row in table:
+                if len(row) < 3: 
+                    continue
+                match = re.search(r"\d+", str(row[0]))
+                if match:
+                    r_num = int(match.group())
+                    g_idx = (r_num - 1) % 4
+                    p_idx = (r_num - 1) // 4
+                    if 0 <= g_idx < NUM_GROUPS and 0 <= p_idx < 12:
+                        entries.append((g_idx, p_idx, str(row[1]), str(row[2])))
+            return entries
+
+        self._start_file_load(fp, "参加者ファイル読込", parse, self._apply_loaded_entries, "ファイルを読み込めませんでした。")
+
+    def _apply_loaded_entries(self, entries):
         success = False
-        for row in rows:
-            if len(row) < 3: 
-                continue
-            match = re.search(r"\d+", str(row[0]))
-            if match:
-                r_num = int(match.group())
-                g_idx = (r_num - 1) % 4
-                p_idx = (r_num - 1) // 4
-                if 0 <= g_idx < NUM_GROUPS and 0 <= p_idx < 12:
-                    self.all_groups_data[g_idx][p_idx]["univ"] = str(row[1])
-                    self.all_groups_data[g_idx][p_idx]["name"] = str(row[2])
-                    success = True
+        for g_idx, p_idx, univ, name in entries:
+            p = self.all_groups_data[g_idx][p_idx]
+            p["univ"] = univ
+            p["name"] = name
+            touch_player(p)
+            self.tournament_index.update_player(p)
+            success = True
 
         if not success:
             messagebox.showwarning("読込結果", "有効な参加者データを見つけられませんでした。")
         self.refresh_ui()
 
+    def grade_qualifier(self):
+        """解答キーと解答用紙を選び、別スレッドで採点して上位48名を2Rの組に配置する。順位表は解答用紙の隣に書き出す"""
+        messagebox.showinfo("筆記採点", "まず解答キー (問題番号, 正解, 配点) のファイルを選んでください。")
+        key_fp = self._ask_data_file()
+        if not key_fp:
+            return
+        messagebox.showinfo("筆記採点", "次に解答用紙 (受験番号, 氏名, 大学, 各問の解答) のファイルを選んでください。")
+        fp = self._ask_data_file()
+        if not fp:
+            return
+        out_fp = os.path.splitext(fp)[0] + "_順位.csv"
+
+        def parse(job):
+            grader = QualifierGrader(self._read_rows_from_file(key_fp))
+            rows = list(self._read_rows_from_file(fp, job=job))
+            ranking, elapsed = grader.grade(rows)
+            QualifierGrader.write_ranking(out_fp, ranking)
+            return ranking, elapsed, len(grader.key)
+
+        def apply(result):
+            ranking, elapsed, n_q = result
+            self._apply_loaded_entries(QualifierGrader.seed_entries(ranking))
+            messagebox.showinfo(
+                "筆記採点",
+                f"{len(ranking)}名 × {n_q}問 を {elapsed * 1000:.1f} ms で採点しました。\n"
+                f"上位{min(QUALIFIER_ADVANCE, len(ranking))}名を2Rの組に配置しました。\n順位表: {out_fp}",
+            )
+
+        self._start_file_load(fp, "筆記採点", parse, apply, "採点できませんでした。")
+
     def load_questions_csv(self):
-        fp = filedialog.askopenfilename(
-            filetypes=[
-                ("Data Files", "*.csv;*.xlsx"),
-                ("CSV Files", "*.csv"),
-                ("Excel Files", "*.xlsx"),
-            ]
-        )
+        fp = self._ask_data_file()
         if not fp:
             return
+
+        def parse(job):
+            table, stamp, layouts = self._read_rows_cached(fp, 2, job)
+            return fp, QuestionStore(table), stamp, layouts
+
+        self._start_file_load(fp, "問題ファイル読込", parse, self._apply_loaded_questions, "問題ファイルを読み込めませんでした。")
+
+    # --- 問題ファイルの監視: 本番中の誤字修正などを、位置を保ったまま取り込む ---
+    def _poll_question_file(self):
         try:
-            rows = self._read_rows_from_file(fp)
-            self.questions = [{"q": r[0], "a": r[1]} for r in rows if len(r) >= 2]
-            self.current_q_idx = 0
-            self.question_display_started = False
-            if self.questions:
-                self.next_q_target_var.set("1" if len(self.questions) == 1 else "2")
-            else:
-                self.next_q_target_var.set("")
-            self.refresh_ui()
-        except Exception as e:
-            messagebox.showerror("読込エラー", f"問題ファイルを読み込めませんでした。\n{e}")
+            self._check_question_file()
+        finally:
+            self.after(QUESTION_WATCH_INTERVAL_MS, self._poll_question_file)
 
-    # --- 修正: W/Lボタンの処理を汎用化 ---
-    def act_win_lose(self, idx, status):
-        """全モード共通のW/Lボタン処理"""
-        self.save_history()
-        players = self.get_current_mode_players()
-        if idx >= len(players): return
-        p = players[idx]
-        
-        if self.mode == "SEMI":
-            if status == "win":
-                p["semi_status"] = "win"
-                p["semi_exit_set"] = self.semi_set_idx
-            elif status == "lose":
-                p["semi_status"] = "lose"
-                p["semi_exit_set"] = self.semi_set_idx
-        
-        elif self.mode == "EXTRA":
-            if status == "win":
-                p["extra_score"] = 5
-                # 修正: 勝者が確定していない場合のみ勝ち抜け順を設定
-                if p["win_order_extra"] == 0:
-                      p["win_order_extra"] = len([pl for pl in players if pl["win_order_extra"] > 0]) + 1
-            elif status == "lose":
-                p["extra_wrong"] = 1
-        
-        elif self.mode == "10by10":
-            if status == "win":
-                p["10by10_o"] = 10; p["10by10_x"] = 10
-                if p["win_order_10by10"] == 0:
-                      p["win_order_10by10"] = len([pl for pl in players if pl["win_order_10by10"] > 0]) + 1
-            elif status == "lose":
-                p["10by10_x"] = 0 # 失格条件
-        
-        elif self.mode == "Swedish10":
-            if status == "win":
-                p["Swedish10_o"] = 10
-                if p["win_order_Swedish10"] == 0:
-                      p["win_order_Swedish10"] = len([pl for pl in players if pl["win_order_Swedish10"] > 0]) + 1
-            elif status == "lose":
-                p["Swedish10_x"] = 10 # 失格条件
-
-        elif self.mode == "Freeze10":
-            if status == "win":
-                p["Freeze10_o"] = 10
-                p["Freeze10_x"] = 0
-                p["Freeze10_freeze"] = 0
-                if p["win_order_Freeze10"] == 0:
-                    p["win_order_Freeze10"] = len([pl for pl in players if pl["win_order_Freeze10"] > 0]) + 1
-            elif status == "lose":
-                p["Freeze10_x"] = 10
-                p["Freeze10_freeze"] = 0
-                p["win_order_Freeze10"] = 0
-        
-        elif self.mode == "10up-down":
-            if status == "win":
-                p["10up-down_score"] = 10
-                if p["win_order_10up-down"] == 0:
-                      p["win_order_10up-down"] = len([pl for pl in players if pl["win_order_10up-down"] > 0]) + 1
-            elif status == "lose":
-                p["10up-down_wrong"] = 2 # 失格条件
-                
-        # 修正: モードが "SCORE" (2R) の場合の判定を追加
-        elif self.mode == "SCORE" or isinstance(self.mode, int): # 2R
-            if status == "win":
-                p["score"] = WIN_POINTS
-                # 修正: 勝者が確定していない場合のみ勝ち抜け順を設定
-                if p["win_order"] == 0:
-                    p["win_order"] = len([pl for pl in self.all_groups_data[self.current_group_idx] if pl["win_order"] > 0]) + 1
-            elif status == "lose":
-                p["wrong"] = LOSE_WRONGS
+    def _check_question_file(self):
+        fp = self.questions_path
+        if not fp or self._load_job is not None or self._watch_job is not None:
+            return
+        try:
+            st = os.stat(fp)
+        except OSError:
+            return
+        key = (st.st_size, st.st_mtime_ns)
+        if self.questions_stamp is not None and key == self.questions_stamp[:2]:
+            self._watch_pending = None
+            return
+        if key == self._watch_failed:
+            return
+        # 保存途中のファイルを読まないよう、同じ状態が2回続いてから読み直す
+        if key != self._watch_pending:
+            self._watch_pending = key
+            return
+        self._watch_pending = None
+        old_questions = self.questions
+
+        def parse(job):
+            table, stamp, layouts = self._read_rows_cached(fp, 2, job)
+            questions = QuestionStore(table)
+            # 差分もここで取り、Tk スレッドでは出来上がった結果を当てはめるだけにする
+            opcodes, stale_texts = diff_question_stores(old_questions, questions)
+            return old_questions, questions, opcodes, stale_texts, stamp, layouts
+
+        job = FileLoadJob(fp, parse)
+        self._watch_job = job
+        job.start()
+        self.after(FILE_LOAD_POLL_MS, lambda: self._poll_question_reload(job, key))
+
+    def _poll_question_reload(self, job, key):
+        if not job.done.is_set():
+            self.after(FILE_LOAD_POLL_MS, lambda: self._poll_question_reload(job, key))
+            return
+        self._watch_job = None
+        if job.fp != self.questions_path:
+            return
+        if job.error is not None:
+            self._watch_failed = key
+            messagebox.showwarning("問題ファイル再読込", f"問題ファイルの再読込に失敗しました。\n{job.error}")
+            return
+        self._watch_failed = None
+        old_questions, questions, opcodes, stale_texts, stamp, layouts = job.result
+        if self.questions is not old_questions:
+            # 読み直している間に問題ファイルが手動で読み込まれた。差分の元が違うので捨てる
+            return
+        self.drawer.layout_cache.update(layouts)
+        self._patch_questions(questions, opcodes, stale_texts)
+        self._start_question_index(self.questions)
+        self.questions_stamp = stamp
+        self._questions_layout_count = len(layouts)
+        self.refresh_ui()
 
+    def _patch_questions(self, new_questions, opcodes, stale_texts):
+        """diff_question_stores の結果を使い、変わった問題の折り返し結果だけ捨てて新しい問題集に差し替える。
+        挿入・削除で番号がずれた場合は、表示中の問題・SFフォロー範囲・手動の次問題が同じ問題を指すように付け替える"""
+        old_total = len(self.questions)
+        if opcodes is None:
+            self.questions = new_questions
+            return
+        if stale_texts:
+            for k in [k for k in self.drawer.layout_cache if k[0] in stale_texts]:
+                del self.drawer.layout_cache[k]
+
+        def remap(idx):
+            for tag, i1, i2, j1, j2 in opcodes:
+                if i1 <= idx < i2:
+                    if tag == "equal" or tag == "replace":
+                        return min(j1 + (idx - i1), max(j1, j2 - 1))
+                    return j1
+            return idx
+
+        total = len(new_questions)
+        def clamp(idx):
+            return max(0, min(idx, total - 1)) if total else 0
+
+        self.questions = new_questions
+        self.current_q_idx = clamp(remap(self.current_q_idx))
+        sf_first = self.sf_follow_start + self.sf_follow_cursor
+        self.sf_follow_start = clamp(remap(self.sf_follow_start))
+        self.sf_follow_end = clamp(remap(self.sf_follow_end))
+        self.sf_follow_cursor = max(0, clamp(remap(sf_first)) - self.sf_follow_start)
+        no = self._parse_question_no(self.next_q_target_var.get())
+        if no is not None and 1 <= no <= old_total:
+            self.next_q_target_var.set(str(clamp(remap(no - 1)) + 1))
+        for stack in self.history_stacks.values():
+            for entry in stack:
+                entry["q_idx"] = clamp(remap(entry["q_idx"]))
+
+    def _apply_loaded_questions(self, result):
+        fp, questions, stamp, layouts = result
+        self._save_question_layouts()
+        self.drawer.layout_cache.clear()
+        self.drawer.layout_cache.update(layouts)
+        self.questions = questions
+        self._start_question_index(questions)
+        self.questions_path = fp
+        self.questions_stamp = stamp
+        self._questions_layout_count = len(layouts)
+        self._watch_pending = None
+        self._watch_failed = None
+        self.current_q_idx = 0
+        self.question_display_started = False
+        if self.questions:
+            self.next_q_target_var.set("1" if len(self.questions) == 1 else "2")
+        else:
+            self.next_q_target_var.set("")
         self.refresh_ui()
 
-    def act(self, idx, t):
+    # --- 判定トランザクション: 複数人の判定を1つのUndo単位・1回の問題送り・1回の再描画にまとめる ---
+    def begin_judgement(self):
+        if self._judge_txn is not None:
+            # 前のトランザクションが確定されずに残っている。続きとして扱わず、巻き戻してから始める
+            self.rollback_judgement()
         self.save_history()
-        players = self.get_current_mode_players()
-        if idx >= len(players): return
-        p = players[idx]
-        
-        if self.mode == "Freeze10" and p["Freeze10_freeze"] > 0: return 
-        if self.mode == "FINAL" and p["final_set_lost"]: return
-        if self.mode == "EXTRA" and p["extra_wrong"] >= 1: return 
+        self._judge_txn = {"players": self.get_current_mode_players(), "advance": False, "events": [], "judged": [],
+                           "mode": self.mode, "group": self.current_group_idx}
 
-        advance = False
-        
-        if self.mode == "10by10":
-            if t == "o": 
-                p["10by10_o"] += 1
-                if p["10by10_o"] * p["10by10_x"] >= 100 and p["win_order_10by10"] == 0:
-                    p["win_order_10by10"] = len([pl for pl in players if pl["win_order_10by10"] > 0]) + 1
-                advance = True
-            elif t == "x": p["10by10_x"] -= 1; advance = True
-            elif t == "r": p["10by10_o"] = 0; p["10by10_x"] = 10; p["win_order_10by10"] = 0
-        
-        elif self.mode == "10up-down":
-            if t == "o":
-                p["10up-down_score"] += 1
-                if p["10up-down_score"] >= 10 and p["win_order_10up-down"] == 0:
-                    p["win_order_10up-down"] = len([pl for pl in players if pl["win_order_10up-down"] > 0]) + 1
-                advance = True
-            elif t == "x":
-                p["10up-down_score"] = 0 
-                p["10up-down_wrong"] += 1
-                advance = True
-            elif t == "r":
-                p["10up-down_score"] = 0; p["10up-down_wrong"] = 0; p["win_order_10up-down"] = 0
-
-        elif self.mode == "Freeze10":
-            if t == "o":
-                p["Freeze10_o"] += 1
-                if p["Freeze10_o"] >= 10 and p["win_order_Freeze10"] == 0:
-                    p["win_order_Freeze10"] = len([pl for pl in players if pl["win_order_Freeze10"] > 0]) + 1
-                advance = True
-            elif t == "x":
-                p["Freeze10_x"] += 1
-                p["Freeze10_freeze"] = p["Freeze10_x"] + 1 
-                advance = True
-            elif t == "r":
-                p["Freeze10_o"] = 0; p["Freeze10_x"] = 0; p["Freeze10_freeze"] = 0; p["win_order_Freeze10"] = 0
-
-        elif self.mode == "Swedish10":
-            if t == "o":
-                p["Swedish10_o"] += 1
-                if p["Swedish10_o"] >= 10 and p["win_order_Swedish10"] == 0:
-                    p["win_order_Swedish10"] = len([pl for pl in players if pl["win_order_Swedish10"] > 0]) + 1
-                advance = True
-            elif t == "x":
-                pen = get_swedish10_wrong_increment(p["Swedish10_o"])
-                p["Swedish10_x"] += pen
-                advance = True
-            elif t == "r":
-                p["Swedish10_o"] = 0; p["Swedish10_x"] = 0; p["win_order_Swedish10"] = 0
+    def apply_judgement(self, idx, t):
+        txn = self._judge_txn
+        try:
+            players = txn["players"]
+            if idx >= len(players): return
+            fmt = ROUND_FORMATS.get(self._get_view_mode())
+            result = fmt.judge(players[idx], t, players, set_idx=self.semi_set_idx)
+        except Exception:
+            self.rollback_judgement()
+            raise
+        if result is None: return
+        advance, events = result
+        txn["advance"] = txn["advance"] or advance
+        txn["events"].extend(events)
+        txn["judged"].append((idx, t))
+
+    def apply_win_lose(self, idx, status):
+        try:
+            players = self._judge_txn["players"]
+            if idx >= len(players): return
+            fmt = ROUND_FORMATS.get(self._get_view_mode())
+            fmt.force(players[idx], status, players, set_idx=self.semi_set_idx)
+        except Exception:
+            self.rollback_judgement()
+            raise
+
+    def rollback_judgement(self):
+        """途中まで当てた判定を begin_judgement で保存した状態へ戻し、トランザクションを閉じる"""
+        txn, self._judge_txn = self._judge_txn, None
+        if txn is None:
+            return
+        if (txn["mode"], txn["group"]) == (self.mode, self.current_group_idx):
+            self.undo()
 
-        elif self.mode == "SEMI":
-            conf = SEMI_RULES[self.semi_set_idx]
-            if t == "o": p["semi_score"] += conf["correct"]; advance = True
-            elif t == "x": p["semi_score"] += conf["wrong"]; advance = True
-            elif t == "r": p["semi_score"] = 0; p["semi_status"] = "active"
+    def commit_judgement(self):
+        txn, self._judge_txn = self._judge_txn, None
+        if txn is None:
+            return
+        busy, self._control_busy = self._control_busy, True
+        try:
+            for kind, winner in txn["events"]:
+                if kind == "set_won":
+                    messagebox.showinfo("Set Winner", f"{winner['name']} がセット獲得！")
+                elif kind == "set_survivor":
+                    messagebox.showinfo("Set Winner", f"他者失格により {winner['name']} がセット獲得！")
+                elif kind == "survivor":
+                    messagebox.showinfo("Winner", f"他者全滅により {winner['name']} が復活！")
+        finally:
+            self._control_busy = busy
+        if txn["advance"]:
+            self._process_end_of_question(txn["players"])
+        self._notify_qualifiers()
+        self._buzzer_after_judgement(txn)
+        self.refresh_ui()
 
-        elif self.mode == "FINAL":
-            if t == "o":
-                if p["final_curr_o"] < 7:
-                    p["final_curr_o"] += 1
-                    if p["final_curr_o"] == 7:
-                        p["final_sets_won"] += 1
-                        messagebox.showinfo("Set Winner", f"{p['name']} がセット獲得！")
-                        if p["final_sets_won"] >= 3: p["win_order_final"] = 1
-                    
-                    # 7に到達した場合もそうでない場合も、問題を送るためにTrueにする
-                    advance = True
-            elif t == "x":
-                p["final_curr_x"] += 1
-                if p["final_curr_x"] >= 3: p["final_set_lost"] = True
-                advance = True
-            elif t == "r":
-                p["final_sets_won"] = 0; self.reset_final_set()
-
-            active = [pl for pl in players if not pl["final_set_lost"]]
-            if len(active) == 1:
-                winner = active[0]
-                winner["final_sets_won"] += 1
-                
-                winner["final_curr_o"] = 7
-                messagebox.showinfo("Set Winner", f"他者失格により {winner['name']} がセット獲得！")
-                
-                if winner["final_sets_won"] >= 3: winner["win_order_final"] = 1
+    # --- 早押し: 着順は入力スレッドと BuzzerArbiter が決め、Tk 側は表示と判定後の受付のやり直しを受け持つ ---
+    def _buzzer_locked_seats(self):
+        """凍結中・失格・勝ち抜け済み・空席は押しても無視する"""
+        fmt = ROUND_FORMATS.get(self._get_view_mode())
+        locked = set()
+        for i, p in enumerate(self.get_current_mode_players()):
+            if p["name"] == "---" or (fmt is not None and (fmt.is_frozen(p) or fmt.is_lost(p) or p.get(fmt.win_key, 0) > 0)):
+                locked.add(i)
+        return locked
 
-        elif self.mode == "EXTRA":
-            if t == "o":
-                p["extra_score"] += 1
-                if p["extra_score"] >= 5:
-                    # 修正: 勝ち抜け順の重複加算を防ぐ
-                    if p["win_order_extra"] == 0:
-                        p["win_order_extra"] = 1
-                advance = True
-            elif t == "x":
-                p["extra_wrong"] += 1
-                advance = True
-            elif t == "r":
-                p["extra_score"] = 0; p["extra_wrong"] = 0; p["win_order_extra"] = 0
-            
-            active = [pl for pl in players if pl["name"] != "---" and pl["extra_wrong"] == 0]
-            already_win = any(pl["win_order_extra"] > 0 for pl in players)
-            
-            if not already_win and len(active) == 1:
-                winner = active[0]
-                winner["win_order_extra"] = 1
-                messagebox.showinfo("Winner", f"他者全滅により {winner['name']} が復活！")
+    def arm_buzzer(self):
+        self.buzzer.arm(self._buzzer_locked_seats())
 
-        else: # 2nd Round
-            if t == "o":
-                p["score"] += (2 if p["rento"] else 1)
-                if p["rento"]: p["rento"] = False
-                else:
-                    if p["score"] < WIN_POINTS: p["rento"] = True
-                
-                if p["score"] >= WIN_POINTS:
-                    # 修正: 勝ち抜け順の重複加算を防ぐ
-                    if p["win_order"] == 0:
-                         p["win_order"] = len([pl for pl in self.all_groups_data[self.current_group_idx] if pl["win_order"] > 0]) + 1
-                
-                for other in self.all_groups_data[self.current_group_idx]:
-                    if other != p: other["rento"] = False
-                self._advance_q()
-            elif t == "x":
-                p["wrong"] += 1; p["rento"] = False; self._advance_q()
-            elif t == "r":
-                p["score"], p["wrong"], p["rento"], p["win_order"] = get_advantage_points(p["rank_num"]), 0, False, 0
-        
-        if advance:
-            self._process_end_of_question(players)
-            
-        self.refresh_ui()
+    def disarm_buzzer(self):
+        self.buzzer.disarm()
 
-    def _get_status_suffix(self, p):
-        mode = self.mode
-        if mode == "SCORE" or isinstance(mode, int):
-            if p.get("win_order", 0) > 0:
-                return " [WIN]"
-            if p.get("wrong", 0) >= LOSE_WRONGS:
-                return " [LOSE]"
-            return ""
-        if mode == "10by10":
-            if p.get("win_order_10by10", 0) > 0:
-                return " [WIN]"
-            if p.get("10by10_x", 10) <= 4:
-                return " [LOSE]"
-            return ""
-        if mode == "Swedish10":
-            if p.get("win_order_Swedish10", 0) > 0:
-                return " [WIN]"
-            if p.get("Swedish10_x", 0) >= 10:
-                return " [LOSE]"
-            return ""
-        if mode == "Freeze10":
-            if p.get("win_order_Freeze10", 0) > 0:
-                return " [WIN]"
-            if p.get("Freeze10_x", 0) >= 10:
-                return " [LOSE]"
-            return ""
-        if mode == "10up-down":
-            if p.get("win_order_10up-down", 0) > 0:
-                return " [WIN]"
-            if p.get("10up-down_wrong", 0) >= 2:
-                return " [LOSE]"
-            return ""
-        if mode == "SEMI":
-            if p.get("semi_status") == "win":
-                return " [WIN]"
-            if p.get("semi_status") == "lose":
-                return " [LOSE]"
-            return ""
-        if mode == "FINAL":
-            if p.get("win_order_final", 0) > 0:
-                return " [WIN]"
-            if p.get("final_set_lost", False):
-                return " [LOSE]"
-            return ""
-        if mode == "EXTRA":
-            if p.get("win_order_extra", 0) > 0:
-                return " [WIN]"
-            if p.get("extra_wrong", 0) >= 1:
-                return " [LOSE]"
-            return ""
-        return ""
+    def _buzzer_after_judgement(self, txn):
+        if not self.buzzer.armed:
+            return
+        winner = self.buzzer.winner
+        if txn["advance"]:
+            # 問題が終わった。次の問題を読み始めるときに受付開始する
+            self.buzzer.disarm()
+        elif winner is not None and (winner, "x") in txn["judged"]:
+            self.buzzer.rearm(winner, self._buzzer_locked_seats())
+        else:
+            self.buzzer.set_locked(self._buzzer_locked_seats())
+
+    def _poll_buzzer(self):
+        decided = self.buzzer.poll()
+        if self.buzzer.version != self._buzzer_version:
+            self._buzzer_version = self.buzzer.version
+            self.buzz_idx = self.buzzer.winner
+            self._update_buzzer_label()
+            self.refresh_ui()
+            if decided is not None:
+                # 1着の強調は描画の間引きを待たずに次のフレームへ載せる
+                if self._update_job:
+                    self.after_cancel(self._update_job)
+                    self._update_job = None
+                self.update_preview_image()
+        self.after(BUZZER_POLL_MS, self._poll_buzzer)
+
+    def _update_buzzer_label(self):
+        if self.lbl_buzzer is None:
+            return
+        order = self.buzzer.order()
+        if not self.buzzer.armed or not order:
+            self.lbl_buzzer.config(text="受付中" if self.buzzer.armed else "停止中", fg="black")
+            return
+        players = self.get_current_mode_players()
+        parts = []
+        for n, (seat, delta_ns) in enumerate(order[:4]):
+            name = players[seat]["name"] if seat < len(players) else "---"
+            parts.append(f"{n + 1}着 {seat + 1}番 {name}" + (f" (+{delta_ns / 1e6:.3f}ms)" if n else ""))
+        self.lbl_buzzer.config(text="  ".join(parts), fg="#c00000" if self.buzzer.winner is not None else "black")
+
+    # --- 修正: W/Lボタンの処理を汎用化 ---
+    def act_win_lose(self, idx, status):
+        """全モード共通のW/Lボタン処理"""
+        self.begin_judgement()
+        self.apply_win_lose(idx, status)
+        self.commit_judgement()
+
+    def act(self, idx, t):
+        self.begin_judgement()
+        self.apply_judgement(idx, t)
+        self.commit_judgement()
+
+    def get_selected_player_indices(self):
+        players = self.get_current_mode_players()
+        return [i for i, w in enumerate(self.player_widgets) if i < len(players) and w["selected"].get()]
+
+    def clear_player_selection(self):
+        for w in self.player_widgets:
+            w["selected"].set(False)
+
+    def act_selected(self, t):
+        indices = self.get_selected_player_indices()
+        if not indices: return
+        self.begin_judgement()
+        for idx in indices:
+            self.apply_judgement(idx, t)
+        self.commit_judgement()
+        self.clear_player_selection()
+
+    def act_win_lose_selected(self, status):
+        indices = self.get_selected_player_indices()
+        if not indices: return
+        self.begin_judgement()
+        for idx in indices:
+            self.apply_win_lose(idx, status)
+        self.commit_judgement()
+        self.clear_player_selection()
+
+    def _notify_qualifiers(self, rebuild=False):
+        """現在モードの成績変化を進出者パイプラインへ伝える"""
+        view_mode = self._get_view_mode()
+        if view_mode == "2R":
+            self.qualifiers.update_group(self.current_group_idx, self.all_groups_data[self.current_group_idx])
+        elif view_mode in MODE_COURSES:
+            if rebuild:
+                self.qualifiers.rebuild_courses(self.players_3rd_20)
+            else:
+                self.qualifiers.update_course_players(self.get_current_mode_players())
+        elif view_mode == "SEMI":
+            self.qualifiers.update_semi(self.players_semi_9)
+        elif view_mode == "EXTRA":
+            self.qualifiers.update_extra(self.players_extra_12)
+
+    def _get_view_mode(self):
+        if self.mode in MODE_COURSES + ["SEMI", "FINAL", "EXTRA"]:
+            return self.mode
+        return "2R"
 
     def _process_end_of_question(self, players):
-        if self.mode in ["10by10", "Swedish10", "Freeze10", "10up-down", "SEMI", "FINAL", "EXTRA", "SCORE"] or isinstance(self.mode, int):
+        if self.mode in MODE_COURSES + ["SEMI", "FINAL", "EXTRA", "SCORE"] or isinstance(self.mode, int):
             self._advance_q()
-            if self.mode == "Freeze10":
-                for p in players:
-                    if p["Freeze10_freeze"] > 0:
-                        p["Freeze10_freeze"] -= 1
-        else:
-            pass
+            ROUND_FORMATS[self._get_view_mode()].end_of_question(players)
 
     def _advance_q(self):
         if not self.questions:
@@ -2399,7 +5595,7 @@ class QuizApp(tk.Tk):
             self.question_display_started = last.get("question_started", self.question_display_started)
             
             # 各モードの変数に書き戻す
-            if self.mode in ["10by10", "Swedish10", "Freeze10", "10up-down"]:
+            if self.mode in MODE_COURSES:
                 self.players_3rd_20 = restored_players
             elif self.mode == "SEMI":
                 self.players_semi_9 = restored_players
@@ -2411,6 +5607,11 @@ class QuizApp(tk.Tk):
             elif self.mode == "SCORE" or isinstance(self.mode, int):
                 self.all_groups_data[self.current_group_idx] = restored_players
                 
+            self._notify_qualifiers(rebuild=True)
+            if self.mode == "SCORE" or isinstance(self.mode, int):
+                self.tournament_index.update_group(self.current_group_idx, restored_players)
+            elif self.mode in ["SEMI", "FINAL", "EXTRA"]:
+                self.tournament_index.set_round(self.mode, restored_players)
             self.refresh_ui()
 
     def save_history(self):
@@ -2424,7 +5625,7 @@ class QuizApp(tk.Tk):
             self.history_stacks[key] = []
             
         target_list = []
-        if self.mode in ["10by10", "Swedish10", "Freeze10", "10up-down"]:
+        if self.mode in MODE_COURSES:
             target_list = self.players_3rd_20
         elif self.mode == "SEMI":
             target_list = self.players_semi_9
@@ -2446,32 +5647,37 @@ class QuizApp(tk.Tk):
         if self._update_job: self.after_cancel(self._update_job)
         self._update_job = self.after(30, self.update_preview_image)
 
-    def update_preview_image(self):
-        if self.view_frame is None or not self.view_frame.winfo_exists():
-            return
+    def _frame_specs(self):
+        """出力の種類ごとの描画内容 (key, メソッド名, 引数)。同じ画像で済む種類には同じものを入れる"""
         show_question_text = bool(self.questions) and self.question_display_started and self.question_visible_var.get()
         timer_blink_on = self.timer_blink_on if self.timer_seconds == 0 else True
         obs_overlay = self.obs_overlay_var.get()
+        timer_str = self.get_timer_str()
+        timer_alert = (self.timer_seconds == 0)
+        timer = (("timer", timer_str, timer_alert, timer_blink_on), "generate_image_timer_only", dict(
+            timer_str=timer_str,
+            timer_alert=timer_alert,
+            timer_blink_on=timer_blink_on,
+        ))
         if self.mode == "TIMER_ONLY":
-            pil_img = self.drawer.generate_image_timer_only(
-                timer_str=self.get_timer_str(),
-                timer_alert=(self.timer_seconds == 0),
-                timer_blink_on=timer_blink_on,
-            )
+            main = obs = timer
         elif self.mode == "3RD":
-            pil_img = self.drawer.generate_image_3rd_round(
-                self.players_3rd_20,
-                self.current_selected_course_name_3rd,
-                self.player_selections_3rd,
-            )
+            main = obs = (None, "generate_image_3rd_round", dict(
+                players=self.players_3rd_20,
+                selected_course_name=self.current_selected_course_name_3rd,
+                player_selections=self.player_selections_3rd,
+            ))
         elif self.mode == "SF_FOLLOW":
-            pil_img = self.drawer.generate_image_sf_follow(
-                self.questions,
-                self.sf_follow_start,
-                self.sf_follow_end,
-                self.sf_follow_cursor,
+            # 画面に出る 3問だけを渡す (問題集全体は描画プロセスへ送らない)
+            lo = self.sf_follow_start + self.sf_follow_cursor
+            hi = min(self.sf_follow_end, len(self.questions) - 1, lo + 2)
+            main = obs = (None, "generate_image_sf_follow", dict(
+                questions=[self.questions[i] for i in range(lo, hi + 1)],
+                start_idx=0,
+                end_idx=hi - lo,
+                offset=0,
                 show_question_text=show_question_text,
-            )
+            ))
         else:
             players = self.get_current_mode_players()
             if show_question_text:
@@ -2483,38 +5689,275 @@ class QuizApp(tk.Tk):
             else:
                 q, a = "", ""
             
-            t_str = self.get_timer_str()
-            t_alert = (self.timer_seconds == 0)
-            final_set_idx = self.get_current_final_set_index()
-            pil_img = self.drawer.generate_image(
-                players,
-                self.current_group_idx,
-                q,
-                a,
-                timer_str=t_str,
-                timer_alert=t_alert,
-                mode="2R" if self.mode=="SCORE" or isinstance(self.mode, int) else self.mode,
+            kwargs = dict(
+                players=players,
+                group_idx=self.current_group_idx,
+                question_text=q,
+                answer_text=a,
+                timer_str=timer_str,
+                timer_alert=timer_alert,
+                mode=self._get_view_mode(),
                 semi_set_idx=self.semi_set_idx,
-                final_set_idx=final_set_idx,
+                final_set_idx=self.get_current_final_set_index(),
                 sf_hide_scores=self.sf_hide_scores,
-                obs_overlay=obs_overlay,
+                obs_transparent=self.obs_transparent_var.get(),
                 question_index=self.current_q_idx + 1,
                 show_timer=self.timer_visible_var.get(),
                 show_question_text=show_question_text,
                 timer_blink_on=timer_blink_on,
+                buzz_idx=self.buzz_idx,
             )
-        
-        w = self.view_frame.winfo_width()
-        h = self.view_frame.winfo_height()
-        if w <= 1: w = 1400
-        if h <= 1: h = 300
-        r = min(w/IMG_WIDTH, h/IMG_HEIGHT)
-        img = pil_img.resize((int(IMG_WIDTH*r), int(IMG_HEIGHT*r)), Image.Resampling.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(img)
-        if self.preview_label is not None:
-            self.preview_label.config(image=self.tk_img)
+            main = (None, "generate_image_layered", dict(kwargs, obs_overlay=obs_overlay))
+            # OBS合成UIを表示中なら画面と同じ画像をそのまま使う
+            obs = main if obs_overlay else (None, "generate_image_layered", dict(kwargs, obs_overlay=True))
+        return {"main": main, "obs": obs, "timer": timer}
+
+    # --- 操作API: コマンドは受け付け順に 1件ずつ Tk 側で処理し、状態の差分を全オペレーターへ配る ---
+    def _control_snapshot(self):
+        """操作APIとWeb版スコアボードへ配る状態。画面に出す内容 (表示中の出場者・ヘッダー・タイマー・問題) をまとめる"""
+        view_mode = self._get_view_mode()
+        final_set = self.get_current_final_set_index()
+        players = []
+        if self.mode == "3RD":
+            header = "3rd Round course select"
+            for i, p in enumerate(self.players_3rd_20):
+                hidden = self.player_selections_3rd.get(i, 0) > 0 or p["name"] == "---"
+                players.append(web_player_state(p, self.drawer.get_player_view(p, "2R"), hidden))
+        else:
+            header = "SF Follow-up" if self.mode == "SF_FOLLOW" else \
+                self.drawer._build_header_text(view_mode, self.current_group_idx, self.semi_set_idx, final_set_idx=final_set)
+            for i, p in enumerate(self.drawer._get_display_players(self.get_current_mode_players(), view_mode)):
+                if view_mode == "SEMI":
+                    hidden = p.get("semi_status") != "active" and p.get("semi_exit_set", 0) < self.semi_set_idx
+                else:
+                    hidden = view_mode == "EXTRA" and p["name"] == "---"
+                view = self.drawer.get_player_view(p, view_mode, self.sf_hide_scores)
+                players.append(web_player_state(p, view, hidden, buzz=(i == self.buzz_idx)))
+        show_question_text = bool(self.questions) and self.question_display_started and self.question_visible_var.get()
+        question = {
+            "total": len(self.questions),
+            "no": self._get_current_display_question_no(),
+            "next_no": self._get_manual_next_question_no() if self.next_q_manual_mode_var.get() else self._get_auto_next_question_no(),
+            "visible": self.question_visible_var.get(),
+            "shown": show_question_text,
+            "q": "", "a": "",
+            "sf": [],
+        }
+        if self.questions and self.question_display_started and 0 <= self.current_q_idx < len(self.questions):
+            question["q"] = self.questions[self.current_q_idx]["q"]
+            question["a"] = self.questions[self.current_q_idx]["a"]
+        if self.mode == "SF_FOLLOW" and show_question_text:
+            lo = self.sf_follow_start + self.sf_follow_cursor
+            hi = min(self.sf_follow_end, len(self.questions) - 1, lo + 2)
+            question["sf"] = [self.questions[i] for i in range(lo, hi + 1)]
+        return {
+            "board": {"mode": self.mode, "group": self.current_group_idx, "view_mode": view_mode, "header": header,
+                      "semi_set": self.semi_set_idx, "final_set": final_set,
+                      "course": self.current_selected_course_name_3rd if self.mode == "3RD" else None},
+            "players": players,
+            "timer": {"seconds": self.timer_seconds, "running": self.timer_running, "text": self.get_timer_str(),
+                      "visible": self.timer_visible_var.get(), "alert": self.timer_seconds == 0,
+                      "blink_on": self.timer_blink_on if self.timer_seconds == 0 else True},
+            "question": question,
+        }
+
+    def _publish_control_state(self, by="local", cmd_seq=None):
+        """前回配った状態との差分を配る。競合判定のため、変わった対象ごとに状態番号と変更者を覚える"""
+        if self.control_server is None:
+            return
+        old = self._control_state
+        new = self._control_snapshot()
+        changes = diff_control_state(old, new)
+        if not changes:
+            return
+        self._control_state_seq += 1
+        seq = self._control_state_seq
+        touched = set()
+        if "board" in changes:
+            touched.update(("board", "players"))
+        if "players" in changes:
+            touched.add("players")
+            touched.update(f"player:{i}" for i in changes["players"]["set"])
+        if "question" in changes:
+            touched.add("question")
+        if "timer" in changes:
+            t_old, t_new = old.get("timer", {}), new["timer"]
+            # 動作中のカウントダウンと 0秒での点滅は競合扱いにしない
+            ticking = t_old.get("running") and t_new["running"] and t_new["seconds"] < t_old.get("seconds", 0)
+            if any(t_old.get(k) != t_new[k] for k in ("running", "visible")) or \
+                    (t_old.get("seconds") != t_new["seconds"] and not ticking):
+                touched.add("timer")
+        for key in touched:
+            self._control_changed[key] = (seq, by)
+        self._control_state = new
+        self.control_server.set_state(seq, new)
+        self.control_server.broadcast({"type": "delta", "state_seq": seq, "cmd_seq": cmd_seq, "by": by, "changes": changes})
+
+    def _control_command_deps(self, cmd, args):
+        """コマンドが前提にしている対象 (この対象が base 以降に他の人に変えられていたら競合)"""
+        if cmd in ("act", "act_win_lose"):
+            idx = args.get("idx")
+            indices = idx if isinstance(idx, list) else [idx]
+            return ["board"] + [f"player:{i}" for i in indices]
+        if cmd == "undo":
+            return ["board", "players"]
+        if cmd == "next_question":
+            return ["board", "players", "question"]
+        if cmd in ("timer_start", "timer_stop", "timer_set", "timer_reset"):
+            return ["timer"]
+        if cmd in ("set_next_question", "show_question", "sf_next", "sf_prev"):
+            return ["question", "board"]
+        if cmd == "switch_tab":
+            return ["board"]
+        return []
+
+    def _run_control_command(self, cmd, args):
+        """1件のコマンドを画面のボタンと同じ処理で実行する。不正な引数なら ValueError"""
+        if cmd in ("act", "act_win_lose"):
+            players = self.get_current_mode_players()
+            idx = args.get("idx")
+            indices = idx if isinstance(idx, list) else [idx]
+            if not indices or not all(isinstance(i, int) and 0 <= i < len(players) for i in indices):
+                raise ValueError("idx")
+            value = args.get("t") if cmd == "act" else args.get("status")
+            if value not in (("o", "x", "r") if cmd == "act" else ("win", "lose")):
+                raise ValueError("t" if cmd == "act" else "status")
+            self.begin_judgement()
+            for i in indices:
+                if cmd == "act":
+                    self.apply_judgement(i, value)
+                else:
+                    self.apply_win_lose(i, value)
+            self.commit_judgement()
+        elif cmd == "undo":
+            self.undo()
+        elif cmd == "next_question":
+            self.next_question_manual()
+        elif cmd == "set_next_question":
+            no = args.get("no")
+            if not isinstance(no, int) or not 1 <= no <= len(self.questions):
+                raise ValueError("no")
+            self.next_q_target_var.set(str(no))
+            self.next_q_manual_mode_var.set(True)
+            self._update_question_nav_status()
+        elif cmd == "show_question":
+            self.question_visible_var.set(bool(args.get("visible", True)))
+            self.toggle_question_visibility()
+        elif cmd == "sf_next":
+            self.next_sf_follow()
+        elif cmd == "sf_prev":
+            self.prev_sf_follow()
+        elif cmd in ("timer_start", "timer_stop"):
+            if self.timer_running != (cmd == "timer_start"):
+                self.toggle_timer()
+        elif cmd == "timer_set":
+            seconds = args.get("seconds")
+            if not isinstance(seconds, int) or seconds < 0:
+                raise ValueError("seconds")
+            self.entry_min.delete(0, "end"); self.entry_min.insert(0, str(seconds // 60))
+            self.entry_sec.delete(0, "end"); self.entry_sec.insert(0, str(seconds % 60))
+            self.set_timer_val()
+        elif cmd == "timer_reset":
+            self.reset_timer()
+        elif cmd == "switch_tab":
+            target = args.get("target")
+            names = ["3RD", "SEMI", "SF_FOLLOW", "TIMER_ONLY", "FINAL", "EXTRA"] + MODE_COURSES
+            if not (isinstance(target, int) and 0 <= target < NUM_GROUPS) and target not in names:
+                raise ValueError("target")
+            self.switch_tab(target)
+
+    def _poll_control_commands(self):
+        # 画面操作の判定結果 (messagebox) を表示中は、その判定が終わるまで次のコマンドを待たせる
+        while not self._control_busy:
+            try:
+                cmd_seq, client_id, msg = self.control_server.commands.get_nowait()
+            except queue.Empty:
+                break
+            self._handle_control_command(cmd_seq, client_id, msg)
+        self.after(CONTROL_API_POLL_MS, self._poll_control_commands)
+
+    def _control_conflict(self, by, msg, cmd, args):
+        """base (送り手が最後に見た状態番号) 以降に、コマンドの対象を他の人が変えていればその対象名を返す"""
+        base = msg.get("base")
+        if not isinstance(base, int) or msg.get("force"):
+            return None
+        for key in self._control_command_deps(cmd, args):
+            seq, changed_by = self._control_changed.get(key, (0, None))
+            if seq > base and changed_by != by:
+                return key
+        return None
+
+    def _handle_control_command(self, cmd_seq, client_id, msg):
+        by = client_id if client_id is not None else "http"
+        cmd = msg["cmd"]
+        args = msg.get("args") or {}
+        reply = {"type": "result", "id": msg.get("id"), "cmd_seq": cmd_seq, "ok": True}
+        # 画面での操作やタイマーの変化を先に反映してから競合を判定する
+        self._publish_control_state()
+        if cmd not in CONTROL_API_COMMANDS:
+            reply.update(ok=False, error="unknown_command")
+        elif not isinstance(args, dict):
+            reply.update(ok=False, error="invalid_args")
+        else:
+            conflict = self._control_conflict(by, msg, cmd, args)
+            if conflict is not None:
+                reply.update(ok=False, error="conflict", target=conflict)
+            else:
+                try:
+                    self._run_control_command(cmd, args)
+                except ValueError as e:
+                    reply.update(ok=False, error="invalid_args", target=str(e))
+                except Exception:
+                    traceback.print_exc()
+                    reply.update(ok=False, error="internal_error")
+                self._publish_control_state(by=by, cmd_seq=cmd_seq)
+        reply["state_seq"] = self._control_state_seq
+        self.control_server.finish(cmd_seq, reply)
+
+    def update_preview_image(self):
+        self._publish_control_state()
+        specs = self._frame_specs()
+        kinds = self.outputs.active_kinds()
+        if self.render_process is None:
+            fns = {}
+            renderers = {}
+            for kind, spec in specs.items():
+                if id(spec) not in fns:
+                    fns[id(spec)] = lambda spec=spec: getattr(self.drawer, spec[1])(**spec[2])
+                renderers[kind] = (spec[0], fns[id(spec)])
+            self.outputs.render(renderers)
+            return
+        # 同じ描画内容は最初の種類名を job_id にして 1度だけ依頼する
+        job_ids = {}
+        jobs = {}
+        for kind, spec in specs.items():
+            if kind not in kinds:
+                continue
+            job_id = job_ids.setdefault(id(spec), kind)
+            jobs[job_id] = (spec[1], spec[2])
+        self.render_process.submit(jobs, (specs, job_ids))
+        if self._render_poll_job is None:
+            self._render_poll_job = self.after(RENDER_PROCESS_POLL_MS, self._poll_render_process)
+
+    def _poll_render_process(self):
+        self._render_poll_job = None
+        result = self.render_process.poll()
+        if result is not None:
+            images, (specs, job_ids) = result
+            renderers = {}
+            for kind, spec in specs.items():
+                im = images.get(job_ids.get(id(spec)))
+                if im is not None:
+                    renderers[kind] = (spec[0], lambda im=im: im)
+            self.outputs.render(renderers)
+        if self.render_process.in_flight is not None:
+            self._render_poll_job = self.after(RENDER_PROCESS_POLL_MS, self._poll_render_process)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if "--read-frame-ring" in sys.argv:
+        read_frame_ring()
+        sys.exit(0)
     print("アプリケーションを開始します...")
     try:
         QuizApp().mainloop()
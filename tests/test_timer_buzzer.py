@@ -0,0 +1,279 @@
+"""カウントダウンタイマーと早押し判定のテスト (python -m pytest tests)。
+時計はすべて引数で与えるので、実時間を待たずに結果が決まる"""
+import heapq
+import itertools
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quiz3 import BuzzerArbiter, CountdownTimer, KeyboardBuzzerDevice  # noqa: E402
+
+MS = 1_000_000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class VirtualLoop:
+    """Tk の after の代わり。コールバックの遅れと描画時間のぶんだけ仮想時刻が進む"""
+    def __init__(self, rng, render_ms):
+        self.rng = rng
+        self.render_ms = render_ms
+        self.now = 0.0
+        self.jobs = []
+        self.seq = itertools.count()
+
+    def after(self, ms, fn):
+        heapq.heappush(self.jobs, (self.now + ms / 1000, next(self.seq), fn))
+
+    def render(self):
+        self.now += self.rng.uniform(*self.render_ms) / 1000
+
+    def run(self):
+        while self.jobs:
+            at, _, fn = heapq.heappop(self.jobs)
+            self.now = max(self.now, at) + self.rng.uniform(0.001, 0.004)
+            fn()
+
+
+class CountdownTimerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timer = CountdownTimer(60, clock=self.clock)
+
+    def test_display_rounds_up_until_a_full_second_passes(self):
+        self.timer.start()
+        self.assertEqual(self.timer.display_seconds(), 60)
+        self.clock.now = 0.999
+        self.assertEqual(self.timer.display_seconds(), 60)
+        self.clock.now = 1.0
+        self.assertEqual(self.timer.display_seconds(), 59)
+        self.assertAlmostEqual(self.timer.until_change(), 1.0)
+
+    def test_pause_keeps_the_fraction(self):
+        self.timer.start()
+        self.clock.now = 10.3
+        self.timer.pause()
+        self.clock.now = 100.0
+        self.assertFalse(self.timer.running)
+        self.assertAlmostEqual(self.timer.remaining(), 49.7)
+        self.timer.start()
+        self.clock.now = 100.7
+        self.assertEqual(self.timer.display_seconds(), 49)
+        self.assertAlmostEqual(self.timer.remaining(), 49.0)
+
+    def test_set_while_running_moves_the_deadline(self):
+        self.timer.start()
+        self.clock.now = 5.0
+        self.timer.set(30)
+        self.clock.now = 6.0
+        self.assertAlmostEqual(self.timer.remaining(), 29.0)
+
+    def test_never_goes_negative(self):
+        self.timer.start()
+        self.clock.now = 61.0
+        self.assertEqual(self.timer.remaining(), 0.0)
+        self.assertEqual(self.timer.display_seconds(), 0)
+
+    def test_start_at_zero_does_nothing(self):
+        timer = CountdownTimer(0, clock=self.clock)
+        timer.start()
+        self.assertFalse(timer.running)
+
+    def test_tenths(self):
+        self.timer.set(10)
+        self.timer.start()
+        self.clock.now = 0.05
+        self.assertEqual(self.timer.display_units(0.1), 100)
+        self.assertAlmostEqual(self.timer.until_change(0.1), 0.05)
+        self.clock.now = 9.95
+        self.assertEqual(self.timer.display_units(0.1), 1)
+
+    def test_slow_rendering_does_not_stretch_the_countdown(self):
+        # QuizApp._timer_tick と同じ手順で、1回の描画に 40〜250ms かかり途中で 5回一時停止しても、
+        # 動作時間の合計が設定時間に一致し、表示は 1秒ごとに 1回だけ変わる
+        seconds = 300
+        rng = random.Random(1)
+        loop = VirtualLoop(rng, (40, 250))
+        timer = CountdownTimer(seconds, clock=lambda: loop.now)
+        state = {"shown": seconds, "chain": 0, "updates": 0, "late": 0.0, "paused": 0.0, "pause_at": None, "end": None}
+
+        def tick(chain):
+            if chain != state["chain"] or not timer.running:
+                return
+            shown = timer.display_seconds()
+            if shown <= 0:
+                timer.pause()
+                state["end"] = loop.now
+            if shown != state["shown"]:
+                due = state["paused"] + (seconds - shown)
+                state["late"] = max(state["late"], loop.now - due)
+                self.assertEqual(shown, state["shown"] - 1)
+                state["shown"] = shown
+                state["updates"] += 1
+                loop.render()
+            if timer.running:
+                loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(chain))
+
+        def pause():
+            timer.pause()
+            state["pause_at"] = loop.now
+
+        def resume():
+            state["paused"] += loop.now - state["pause_at"]
+            timer.start()
+            state["chain"] += 1
+            chain = state["chain"]
+            loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(chain))
+
+        for k in range(5):
+            at = (k + 1) * seconds * 1000 / 6 + rng.uniform(0, 900)
+            loop.after(at, pause)
+            loop.after(at + rng.uniform(500, 3000), resume)
+        timer.start()
+        loop.after(int(timer.until_change() * 1000) + 2, lambda: tick(0))
+        loop.run()
+
+        self.assertIsNotNone(state["end"])
+        self.assertLess(abs(state["end"] - state["paused"] - seconds), 0.05)
+        self.assertEqual(state["updates"], seconds)
+        # 表示の遅れは描画 1回ぶんとタイマーの誤差まで
+        self.assertLess(state["late"], 0.3)
+
+
+class BuzzerArbiterTest(unittest.TestCase):
+    def setUp(self):
+        self.arbiter = BuzzerArbiter(settle_us=2000, early_lockout_ms=300)
+
+    def test_orders_by_press_time_not_arrival(self):
+        a = self.arbiter
+        a.arm(now_ns=0)
+        self.assertTrue(a.press(2, 10 * MS + 500_000, "serial"))
+        self.assertTrue(a.press(5, 10 * MS, "keyboard"))
+        self.assertEqual([seat for seat, _ in a.order()], [5, 2])
+        self.assertEqual(a.order()[1][1], 500_000)
+
+    def test_waits_for_settle_before_deciding(self):
+        a = self.arbiter
+        a.arm(now_ns=0)
+        a.press(3, 10 * MS)
+        self.assertIsNone(a.poll(now_ns=11 * MS))
+        # settle 中に届いた、それより前の押下が 1着になる
+        a.press(7, 9 * MS)
+        self.assertIsNone(a.poll(now_ns=10 * MS))
+        self.assertEqual(a.poll(now_ns=12 * MS), 7)
+        self.assertIsNone(a.poll(now_ns=20 * MS))
+        self.assertEqual(a.winner, 7)
+
+    def test_ignores_second_press_of_the_same_seat(self):
+        a = self.arbiter
+        a.arm(now_ns=0)
+        self.assertTrue(a.press(1, 5 * MS))
+        self.assertFalse(a.press(1, 4 * MS))
+        self.assertEqual(a.order(), [(1, 0)])
+
+    def test_locked_seats_are_ignored(self):
+        a = self.arbiter
+        a.arm(locked={4}, now_ns=0)
+        self.assertFalse(a.press(4, 1 * MS))
+        a.set_locked({6})
+        self.assertTrue(a.press(4, 2 * MS))
+        self.assertFalse(a.press(6, 3 * MS))
+
+    def test_false_start_locks_the_seat_after_arming(self):
+        a = self.arbiter
+        a.disarm()
+        self.assertFalse(a.press(8, 900 * MS))
+        a.arm(now_ns=1000 * MS)
+        self.assertFalse(a.press(8, 1200 * MS))
+        self.assertTrue(a.press(9, 1250 * MS))
+        self.assertTrue(a.press(8, 1300 * MS))
+        self.assertEqual([seat for seat, _ in a.order()], [9, 8])
+
+    def test_old_false_start_is_forgiven(self):
+        a = self.arbiter
+        a.disarm()
+        a.press(8, 100 * MS)
+        a.arm(now_ns=1000 * MS)
+        self.assertTrue(a.press(8, 1001 * MS))
+
+    def test_press_stamped_before_arming_is_a_false_start(self):
+        a = self.arbiter
+        a.arm(now_ns=1000 * MS)
+        self.assertFalse(a.press(2, 999 * MS))
+        self.assertFalse(a.press(2, 1100 * MS))
+        self.assertTrue(a.press(2, 1300 * MS))
+
+    def test_rearm_rejects_the_wrong_seat_for_this_question_only(self):
+        a = self.arbiter
+        a.arm(now_ns=0)
+        a.press(1, 1 * MS)
+        a.press(2, 2 * MS)
+        self.assertEqual(a.poll(now_ns=10 * MS), 1)
+        a.rearm(reject=1, now_ns=20 * MS)
+        self.assertEqual(a.order(), [])
+        self.assertFalse(a.press(1, 21 * MS))
+        self.assertTrue(a.press(2, 22 * MS))
+        self.assertEqual(a.poll(now_ns=30 * MS), 2)
+        a.arm(now_ns=100 * MS)
+        self.assertTrue(a.press(1, 101 * MS))
+
+    def test_version_changes_when_the_order_changes(self):
+        a = self.arbiter
+        a.arm(now_ns=0)
+        v = a.version
+        a.press(1, 1 * MS)
+        self.assertGreater(a.version, v)
+        v = a.version
+        a.press(1, 2 * MS)
+        self.assertEqual(a.version, v)
+
+
+class KeyboardBuzzerDeviceTest(unittest.TestCase):
+    def setUp(self):
+        self.arbiter = BuzzerArbiter(settle_us=2000, early_lockout_ms=300)
+        self.keyboard = KeyboardBuzzerDevice(self.arbiter)
+        self.base_ms = 123_456
+        self.clock0 = 5_000 * MS
+        # 空いているときのキー入力で時計合わせ (ハンドラの遅れ 0〜1ms)
+        for k in range(8):
+            self.keyboard.event_time_ns(self.base_ms + k, self.clock0 + k * MS + (k % 3) * 300_000)
+
+    def test_late_handler_keeps_the_press_time(self):
+        t = self.keyboard.event_time_ns(self.base_ms + 100, self.clock0 + 260 * MS)
+        self.assertEqual(t, self.clock0 + 100 * MS)
+
+    def test_key_handled_late_still_wins(self):
+        a = self.arbiter
+        a.arm(now_ns=self.clock0 + 50 * MS)
+        # 60ms に押されたキーの処理が描画で 160ms 遅れ、その間に 65ms のボタンが先に届く
+        self.assertTrue(a.press(3, self.clock0 + 65 * MS, "serial"))
+        self.assertTrue(self.keyboard.press(7, self.base_ms + 60, self.clock0 + 220 * MS))
+        self.assertEqual(a.poll(now_ns=self.clock0 + 221 * MS), 7)
+
+    def test_never_stamps_in_the_future(self):
+        now = self.clock0 + 10 * MS
+        self.assertLessEqual(self.keyboard.event_time_ns(self.base_ms + 50, now), now)
+
+    def test_missing_event_time_uses_now(self):
+        self.assertEqual(self.keyboard.event_time_ns(0, 42), 42)
+
+    def test_32bit_wraparound(self):
+        keyboard = KeyboardBuzzerDevice(self.arbiter)
+        wrap = KeyboardBuzzerDevice.WRAP_MS
+        keyboard.event_time_ns(wrap - 10, 1_000 * MS)
+        t = keyboard.event_time_ns(5, 1_015 * MS)
+        self.assertEqual(t, 1_015 * MS)
+        self.assertEqual(keyboard.wraps, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()